@@ -0,0 +1,251 @@
+"""A dynamic bounding volume tree
+This module provides `AABBTree`, a balanced binary tree of axis-aligned
+bounding boxes.  Each leaf holds an item and a box a little bigger than
+the item (a "fat" box), so that an item only needs to be moved in the
+tree once it leaves its fat box.
+
+Boxes are `(left, top, right, bottom)` tuples, as made by
+`collision.make_aabb`.
+"""
+
+from collision import collide_aabb, collide_segment_aabb
+
+__all__ = ['AABBTree']
+
+
+def union(a, b):
+    return (min(a[0], b[0]), min(a[1], b[1]),
+            max(a[2], b[2]), max(a[3], b[3]))
+
+
+def perimeter(box):
+    return 2 * ((box[2] - box[0]) + (box[3] - box[1]))
+
+
+def contains(outer, inner):
+    return (outer[0] <= inner[0] and outer[1] <= inner[1]
+            and inner[2] <= outer[2] and inner[3] <= outer[3])
+
+
+class AABBTree:
+    """A tree of boxes supporting fast overlap, point and ray queries.
+
+    margin - how far each leaf's box is grown past the item's box.
+    """
+
+    class Node:
+        __slots__ = ['box', 'parent', 'left', 'right', 'height', 'item']
+
+        def __init__(self, box, parent=None, height=0, item=None):
+            self.box = box
+            self.parent = parent
+            self.left = None
+            self.right = None
+            self.height = height  # Leaves have height 0.
+            self.item = item
+
+        def is_leaf(self):
+            return self.left is None
+
+    def __init__(self, margin=10.0):
+        self.root = None
+        self.margin = margin
+
+    def __iter__(self):
+        """Yield every item in the tree."""
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if node is None:
+                continue
+
+            if node.is_leaf():
+                yield node.item
+            else:
+                stack.append(node.left)
+                stack.append(node.right)
+
+    def fatten(self, box):
+        m = self.margin
+        return (box[0] - m, box[1] - m, box[2] + m, box[3] + m)
+
+    def insert(self, item, box):
+        """Add `item` with bounding box `box` and return its leaf."""
+        leaf = self.Node(self.fatten(box), item=item)
+        self._insert_leaf(leaf)
+        return leaf
+
+    def remove(self, leaf):
+        self._remove_leaf(leaf)
+
+    def move(self, leaf, box):
+        """Update the box of `leaf`'s item.
+
+        The leaf is only reinserted if `box` has left its fat box.
+        Returns whether it was.
+        """
+        if contains(leaf.box, box):
+            return False
+
+        self._remove_leaf(leaf)
+        leaf.box = self.fatten(box)
+        self._insert_leaf(leaf)
+        return True
+
+    def query(self, box):
+        """Yield the items whose fat boxes overlap `box`."""
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if node is None or not collide_aabb(node.box, box):
+                continue
+
+            if node.is_leaf():
+                yield node.item
+            else:
+                stack.append(node.left)
+                stack.append(node.right)
+
+    def query_point(self, point):
+        """Yield the items whose fat boxes contain `point`."""
+        return self.query((point.x, point.y, point.x, point.y))
+
+    def ray_cast(self, start, end):
+        """Yield the items whose fat boxes touch the segment from `start`
+        to `end`.
+        """
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if node is None or not collide_segment_aabb(start, end, node.box):
+                continue
+
+            if node.is_leaf():
+                yield node.item
+            else:
+                stack.append(node.left)
+                stack.append(node.right)
+
+    def _insert_leaf(self, leaf):
+        if self.root is None:
+            self.root = leaf
+            leaf.parent = None
+            return
+
+        # Walk down the tree to find the cheapest sibling for the leaf,
+        # where cost is the increase in perimeter of the tree's boxes.
+        box = leaf.box
+        node = self.root
+        while not node.is_leaf():
+            area = perimeter(node.box)
+            combined = perimeter(union(node.box, box))
+
+            # Cost of making the leaf a sibling of this node.
+            cost = 2 * combined
+            # Cost pushed down onto the children by growing this node.
+            inherited = 2 * (combined - area)
+
+            costs = []
+            for child in (node.left, node.right):
+                grown = perimeter(union(box, child.box))
+                if not child.is_leaf():
+                    grown -= perimeter(child.box)
+                costs.append(grown + inherited)
+
+            if cost < costs[0] and cost < costs[1]:
+                break
+
+            node = node.left if costs[0] < costs[1] else node.right
+
+        sibling = node
+        old_parent = sibling.parent
+        new_parent = self.Node(union(box, sibling.box), parent=old_parent,
+                               height=sibling.height + 1)
+        self._replace_child(old_parent, sibling, new_parent)
+
+        new_parent.left = sibling
+        new_parent.right = leaf
+        sibling.parent = new_parent
+        leaf.parent = new_parent
+
+        self._refit(new_parent)
+
+    def _remove_leaf(self, leaf):
+        if leaf is self.root:
+            self.root = None
+            return
+
+        parent = leaf.parent
+        grandparent = parent.parent
+        sibling = parent.right if parent.left is leaf else parent.left
+
+        self._replace_child(grandparent, parent, sibling)
+        leaf.parent = None
+
+        if grandparent is not None:
+            self._refit(grandparent)
+
+    def _replace_child(self, parent, old, new):
+        new.parent = parent
+        if parent is None:
+            self.root = new
+        elif parent.left is old:
+            parent.left = new
+        else:
+            parent.right = new
+
+    def _refit(self, node):
+        """Rebalance and recompute boxes from `node` up to the root."""
+        while node is not None:
+            node = self._balance(node)
+            node.height = 1 + max(node.left.height, node.right.height)
+            node.box = union(node.left.box, node.right.box)
+            node = node.parent
+
+    def _balance(self, a):
+        """Rotate the taller child of `a` up if the tree is lopsided.
+
+        Returns the node now at `a`'s old place in the tree.
+        """
+        if a.is_leaf() or a.height < 2:
+            return a
+
+        b, c = a.left, a.right
+        balance = c.height - b.height
+
+        if balance > 1:
+            return self._rotate_up(a, c, b, right=True)
+        elif balance < -1:
+            return self._rotate_up(a, b, c, right=False)
+
+        return a
+
+    def _rotate_up(self, a, up, other, right):
+        """Swap `a` with its child `up`, handing `a` one of `up`'s
+        children in `up`'s old place.
+        """
+        f, g = up.left, up.right
+
+        self._replace_child(a.parent, a, up)
+        up.left = a
+        a.parent = up
+
+        # `up` keeps its taller child and gives the other to `a`.
+        if f.height > g.height:
+            kept, given = f, g
+        else:
+            kept, given = g, f
+
+        up.right = kept
+        given.parent = a
+        if right:
+            a.right = given
+        else:
+            a.left = given
+
+        a.box = union(other.box, given.box)
+        a.height = 1 + max(other.height, given.height)
+        up.box = union(a.box, kept.box)
+        up.height = 1 + max(a.height, kept.height)
+
+        return up
@@ -6,7 +6,8 @@ some utility functions.
 import itertools
 from math import sin, cos
 
-__all__ = ['take', 'flatten', 'min_max', 'Vec', 'Rect', 'Poly']
+__all__ = ['take', 'flatten', 'min_max', 'Vec', 'Rotation', 'Transform',
+           'Rect', 'Poly', 'rotate_all', 'transform_all', 'support_index']
 
 
 def take(n, iterable):
@@ -101,7 +102,8 @@ class Vec:
         return self
 
     def __neg__(self):
-        return Vec() - self
+        # The same as `Vec() - self`, which keeps the sign of zeros.
+        return Vec(x=0.0 - self.x, y=0.0 - self.y)
 
     def __getitem__(self, i):
         if i == 0:
@@ -124,13 +126,17 @@ class Vec:
 
     def rotate(self, t):
         """Rotate by `t` radians anticlockwise around (0, 0)."""
-        return Vec(x=self.x*cos(t) - self.y*sin(t),
-                   y=self.x*sin(t) + self.y*cos(t))
+        c = cos(t)
+        s = sin(t)
+        return Vec(x=self.x*c - self.y*s,
+                   y=self.x*s + self.y*c)
 
     def rotate_inplace(self, t):
         """Rotate by `t` radians anticlockwise around (0, 0) inplace."""
-        self.x, self.y = (self.x*cos(t) - self.y*sin(t),
-                          self.x*sin(t) + self.y*cos(t))
+        c = cos(t)
+        s = sin(t)
+        self.x, self.y = (self.x*c - self.y*s,
+                          self.x*s + self.y*c)
 
     def to_dict(self):
         return {'x': self.x, 'y': self.y}
@@ -139,6 +145,109 @@ class Vec:
     def from_dict(d):
         return Vec(x=d['x'], y=d['y'])
 
+
+class Rotation:
+    """A rotation by `angle` radians anticlockwise, with its cosine and
+    sine worked out once to rotate many vectors by.
+
+    Rotating gives exactly the same result as `Vec.rotate`.
+    """
+    __slots__ = ['angle', 'cos', 'sin']
+
+    def __init__(self, angle=0.0):
+        self.angle = angle
+        self.cos = cos(angle)
+        self.sin = sin(angle)
+
+    def __repr__(self):
+        return f"Rotation({self.angle})"
+
+    def apply(self, v):
+        """Return `v` rotated."""
+        c = self.cos
+        s = self.sin
+        return Vec(x=v.x*c - v.y*s,
+                   y=v.x*s + v.y*c)
+
+    def apply_inverse(self, v):
+        """Return `v` rotated back, the same as `v.rotate(-angle)`."""
+        c = self.cos
+        s = self.sin
+        return Vec(x=v.x*c + v.y*s,
+                   y=v.y*c - v.x*s)
+
+
+class Transform:
+    """A `Rotation` followed by a move to `pos`, taking points relative
+    to a body into world space.
+
+    Transforming gives exactly the same result as
+    `point.rotate(angle) + pos`.
+    """
+    __slots__ = ['rotation', 'x', 'y']
+
+    def __init__(self, pos=Vec(), rotation=None):
+        self.rotation = Rotation() if rotation is None else rotation
+        self.x = pos.x
+        self.y = pos.y
+
+    def __repr__(self):
+        return f"Transform(Vec(x={self.x}, y={self.y}), {self.rotation})"
+
+    def apply(self, point):
+        """Return `point` in world space."""
+        c = self.rotation.cos
+        s = self.rotation.sin
+        return Vec(x=(point.x*c - point.y*s) + self.x,
+                   y=(point.x*s + point.y*c) + self.y)
+
+    def apply_all(self, points):
+        """Return a list of `points` in world space."""
+        return transform_all(points, self.rotation, self)
+
+    def apply_inverse(self, point):
+        """Return `point`, in world space, relative to the body, the same
+        as `(point - pos).rotate(-angle)`.
+        """
+        return self.rotation.apply_inverse(Vec(x=point.x - self.x,
+                                               y=point.y - self.y))
+
+
+# Helpers working on a whole list of vectors at once.
+
+def rotate_all(vectors, rotation):
+    """Return a list of `vectors` rotated by the `Rotation`."""
+    c = rotation.cos
+    s = rotation.sin
+    return [Vec(x=v.x*c - v.y*s, y=v.x*s + v.y*c) for v in vectors]
+
+
+def transform_all(points, rotation, pos):
+    """Return a list of `points` rotated by the `Rotation` then moved
+    by `pos`, the same as `point.rotate(angle) + pos`.
+    """
+    c = rotation.cos
+    s = rotation.sin
+    x = pos.x
+    y = pos.y
+    return [Vec(x=(v.x*c - v.y*s) + x, y=(v.x*s + v.y*c) + y) for v in points]
+
+
+def support_index(points, dx, dy):
+    """Return the index of the first of `points` furthest along the
+    direction (`dx`, `dy`).
+    """
+    best = 0
+    highest = float('-inf')
+    for i, v in enumerate(points):
+        d = v.x*dx + v.y*dy
+        if d > highest:
+            highest = d
+            best = i
+
+    return best
+
+
 class Rect:
     def __init__(self, x=0, y=0, w=0, h=0, angle=0, colour=(255, 255, 255)):
         self.x = x
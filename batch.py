@@ -0,0 +1,89 @@
+"""Simulating many independent worlds at once
+`run_batch` serialises each world, sends them to a pool of processes,
+steps each one and gathers their compact states, in the same order as
+the worlds were given.  This is for running sweeps offline, eg. over
+`Material` restitution or `Spring` stiffness, where the worlds do not
+interact.
+
+States are tuples of `(x, y, ang, vel x, vel y, ang_vel)` for each
+entity, in the order of `World.entities`, so little has to be sent
+back between processes.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+import json
+import os
+
+from colliding_world import *
+
+__all__ = ['get_state', 'simulate', 'run_batch']
+
+
+def get_state(world):
+    """Return the compact state of every entity in `world`."""
+    return [(e.pos.x, e.pos.y, e.ang, e.vel.x, e.vel.y, e.ang_vel)
+            for e in world.entities]
+
+
+def simulate(data, steps, dt=1/60, record_every=None, options=None):
+    """Load a world from `data`, as from `World.serialise`, and step it
+    `steps` times.
+
+    record_every - if given, record the state every this many steps and
+        return the list of them, starting with the initial state.
+        Otherwise only the final state is returned.
+    options - a function returning keyword arguments for
+        `CollidingWorld`, eg. to give it a broad phase or solver.  It
+        must be picklable, so a module level function or a
+        `functools.partial` of one.
+    """
+    kwargs = options() if options is not None else {}
+    world = CollidingWorld.from_dict(json.loads(data), **kwargs)
+
+    if record_every is None:
+        for _ in range(steps):
+            world.update(dt)
+        return get_state(world)
+
+    states = [get_state(world)]
+    for step in range(1, steps + 1):
+        world.update(dt)
+        if step % record_every == 0:
+            states.append(get_state(world))
+
+    return states
+
+
+def _simulate(args):
+    return simulate(*args)
+
+
+def run_batch(worlds, steps, dt=1/60, record_every=None, options=None,
+              processes=None, chunksize=None):
+    """Step each of `worlds` `steps` times in parallel and return a list
+    of their results from `simulate`.
+
+    worlds - `CollidingWorld`s, or worlds already serialised with
+        `World.serialise`.
+    processes - how many processes to use.  It defaults to the number of
+        CPUs, and with 1 the worlds are stepped in this process.
+    chunksize - how many worlds to send to a process at a time.  It
+        defaults to splitting the worlds into about four chunks per
+        process, so there is little overhead with many small worlds.
+    """
+    tasks = [(w if isinstance(w, str) else w.serialise(),
+              steps, dt, record_every, options)
+             for w in worlds]
+
+    if processes is None:
+        processes = os.cpu_count() or 1
+    processes = max(1, min(processes, len(tasks)))
+
+    if processes == 1:
+        return [_simulate(task) for task in tasks]
+
+    if chunksize is None:
+        chunksize = max(1, len(tasks) // (4 * processes))
+
+    with ProcessPoolExecutor(processes) as pool:
+        return list(pool.map(_simulate, tasks, chunksize=chunksize))
@@ -0,0 +1,160 @@
+"""Batched collision detection
+This module does the same separating axis test as `collision.collide`,
+but for every candidate pair in a step at once using NumPy.  It needs
+NumPy, which the rest of the engine does not.
+
+Polygons are passed as padded arrays: an (n, k, 2) array of vertices,
+where k is the most vertices any polygon has, and an (n,) array of how
+many of each polygon's vertices are real.
+"""
+
+import numpy as np
+
+from base import *
+from collision import find_candidates
+
+__all__ = ['pad_polygons', 'get_separations', 'get_incident_normals',
+           'collide_batch', 'batch_collide_all']
+
+
+def pad_polygons(polys):
+    """Pack a list of polygons into padded vertex and count arrays."""
+    counts = np.array([len(p) for p in polys], dtype=int)
+    k = counts.max() if len(polys) else 0
+
+    verts = np.zeros((len(polys), k, 2))
+    for i, poly in enumerate(polys):
+        verts[i, :len(poly)] = [(v.x, v.y) for v in poly]
+
+    return verts, counts
+
+
+def edge_normals(verts, start, end):
+    """Return the unit normals of the edges from vertex `start` to `end`
+    of each polygon, in the same way as `collision.get_separation`.
+
+    `start` and `end` are arrays of vertex indices with a row for each
+    polygon.
+    """
+    rows = np.arange(len(verts)).reshape((-1,) + (1,) * (start.ndim - 1))
+    edge = verts[rows, start] - verts[rows, end]
+
+    nx = -edge[..., 1]
+    ny = edge[..., 0]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        length = (nx**2 + ny**2) ** 0.5
+        return nx / length, ny / length
+
+
+def get_separations(verts1, counts1, verts2, counts2, normals1=None):
+    """Batched `collision.get_separation`.
+
+    `normals1` can be a padded array of the unit normals of each side of
+    the polygons of `verts1`, to save working them out again.
+
+    Returns arrays of the highest separations, their normals and their
+    edge indices into the polygons of `verts1`.
+    """
+    b, k1 = verts1.shape[:2]
+    k2 = verts2.shape[1]
+    rows = np.arange(b)[:, None]
+
+    index = np.arange(k1)
+    valid1 = index < counts1[:, None]
+    valid2 = np.arange(k2) < counts2[:, None]
+    if normals1 is None:
+        index = np.broadcast_to(index, (b, k1))
+        nx, ny = edge_normals(verts1, index,
+                              (index + 1) % counts1[:, None])
+    else:
+        nx, ny = normals1[..., 0], normals1[..., 1]
+
+    # Find support point of each p2 along -n for every edge of p1.
+    mnx, mny = 0.0 - nx, 0.0 - ny
+    dots = (verts2[:, None, :, 0] * mnx[:, :, None]
+            + verts2[:, None, :, 1] * mny[:, :, None])
+    dots = np.where(valid2[:, None, :], dots, -np.inf)
+    support = verts2[rows, dots.argmax(axis=2)]
+
+    # Find distance of support points from each edge.
+    d = (nx * (support[..., 0] - verts1[..., 0])
+         + ny * (support[..., 1] - verts1[..., 1]))
+    d = np.where(valid1, d, -np.inf)
+
+    best = d.argmax(axis=1)
+    rows = np.arange(b)
+    normals = np.stack((nx[rows, best], ny[rows, best]), axis=1)
+
+    return d[rows, best], normals, best
+
+
+def get_incident_normals(ref_normals, verts, counts, indices, normals=None):
+    """Batched `collision.get_incident_normal`."""
+    if normals is None:
+        left = edge_normals(verts, (indices - 1) % counts, indices)
+        right = edge_normals(verts, indices, (indices + 1) % counts)
+    else:
+        rows = np.arange(len(verts))
+        left = normals[rows, (indices - 1) % counts].T
+        right = normals[rows, indices].T
+
+    rx, ry = ref_normals[:, 0], ref_normals[:, 1]
+    use_left = rx*left[0] + ry*left[1] > rx*right[0] + ry*right[1]
+
+    return np.where(use_left[:, None],
+                    np.stack(left, axis=1),
+                    np.stack(right, axis=1))
+
+
+def collide_batch(verts1, counts1, verts2, counts2,
+                  normals1=None, normals2=None):
+    """Batched `collision.collide`.
+
+    Returns an array of separations, an (n, 2) array of collision
+    normals pointing away from each p1 and towards each p2, and arrays
+    of the flips and indices of the reference sides, as from
+    `collision.collide_reference`.
+    """
+    separation_1, ref_normal_1, incident_index_1 = \
+        get_separations(verts1, counts1, verts2, counts2, normals1)
+    separation_2, ref_normal_2, incident_index_2 = \
+        get_separations(verts2, counts2, verts1, counts1, normals2)
+
+    first = separation_1 > separation_2
+    normal_1 = get_incident_normals(ref_normal_1, verts1, counts1,
+                                    incident_index_1, normals1)
+    normal_2 = 0.0 - get_incident_normals(ref_normal_2, verts2, counts2,
+                                          incident_index_2, normals2)
+
+    return (np.where(first, separation_1, separation_2),
+            np.where(first[:, None], normal_1, normal_2),
+            ~first,
+            np.where(first, incident_index_1, incident_index_2))
+
+
+def batch_collide_all(colliders, broad_phase=None):
+    """Batched `collision.collide_all`, returning the same collisions."""
+    polys, candidates = find_candidates(colliders, broad_phase)
+
+    pairs = np.array(list(candidates), dtype=int).reshape(-1, 2)
+    if len(pairs) == 0:
+        return []
+
+    verts, counts = pad_polygons(polys)
+    normals, _ = pad_polygons([c.get_normals() for c in colliders])
+    first, second = pairs[:, 0], pairs[:, 1]
+    separations, axes, flips, indices = collide_batch(
+        verts[first], counts[first], verts[second], counts[second],
+        normals[first], normals[second])
+
+    collisions = []
+    for k in np.flatnonzero(separations < 0.0):
+        collisions.append(
+            (colliders[first[k]],
+             colliders[second[k]],
+             float(separations[k]),
+             Vec(float(axes[k, 0]), float(axes[k, 1])),
+             (bool(flips[k]), int(indices[k])))
+        )
+
+    return collisions
@@ -0,0 +1,9 @@
+"""Headless benchmarks for the physics step
+This package builds standard scenes directly on `CollidingWorld`, steps
+them without a window and reports steps per second, time spent in each
+phase of the step and memory use.  Run it from the top of the repository
+with `python -m benchmarks --help`.
+"""
+
+from benchmarks.scenes import *
+from benchmarks.run import *
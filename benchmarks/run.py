@@ -0,0 +1,255 @@
+"""Running benchmarks and reporting the results
+`run_benchmark` builds a scene, steps it and returns a dict of results.
+`main` is the command line interface, which prints a table and can save
+the results as JSON to compare against later runs.
+"""
+
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # Not on Windows.
+    resource = None
+
+from broad_phase import *
+from collision import collide_all
+from solver import SequentialImpulseSolver
+from islands import IslandSleeper
+from benchmarks.scenes import SCENES
+
+__all__ = ['world_options', 'run_benchmark', 'compare', 'main']
+
+
+BROAD_PHASES = {
+    'none': lambda: None,
+    'brute': BruteForce,
+    'hash': SpatialHash,
+    'sap': SweepAndPrune,
+    'tree': DynamicTree,
+}
+
+# The phases of `CollidingWorld.update` that do not happen inside others.
+TOP_PHASES = ['wake_springs', 'damp', 'update_spring', 'update_collision',
+              'update_turn', 'update_move', 'update_bullets', 'update_sleep']
+
+
+def world_options(broad_phase='hash', solver='impulse', narrow_phase='python',
+                  sleep=False, body_store=False, spring_set=False,
+                  static_index=False):
+    """Return keyword arguments for `CollidingWorld` from option names."""
+    options = {'broad_phase': BROAD_PHASES[broad_phase]()}
+    if static_index:
+        options['broad_phase'] = StaticIndex(options['broad_phase'])
+
+    if solver == 'sequential':
+        options['solver'] = SequentialImpulseSolver()
+    elif solver != 'impulse':
+        raise ValueError(f"unknown solver {solver!r}")
+
+    if narrow_phase == 'batch':
+        from batch_collision import batch_collide_all
+        options['narrow_phase'] = batch_collide_all
+    elif narrow_phase == 'python':
+        options['narrow_phase'] = collide_all
+    else:
+        raise ValueError(f"unknown narrow phase {narrow_phase!r}")
+
+    if sleep:
+        options['sleeper'] = IslandSleeper()
+
+    if body_store:
+        from body_store import BodyStore
+        options['body_store'] = BodyStore()
+
+    if spring_set:
+        from spring_set import SpringSet
+        options['spring_set'] = SpringSet()
+
+    return options
+
+
+def run_benchmark(scene, n, steps=100, dt=1/60, max_seconds=None,
+                  memory=True, **config):
+    """Build `scene` with `n` bodies, step it and return the results.
+
+    Stepping stops early once `max_seconds` have passed.  `config` is
+    passed to `world_options`.
+    """
+    world = SCENES[scene](n, **world_options(**config))
+    profiler = world.start_profiling(steps)
+
+    done = 0
+    start = time.perf_counter()
+    while done < steps:
+        world.update(dt)
+        done += 1
+        if max_seconds is not None \
+                and time.perf_counter() - start > max_seconds:
+            break
+    elapsed = time.perf_counter() - start
+    world.stop_profiling()
+
+    phases = {}
+    counts = {}
+    for frame in profiler.frames:
+        for name, seconds in frame.phases.items():
+            phases[name] = phases.get(name, 0.0) + seconds
+        for name, count in frame.counts.items():
+            counts[name] = counts.get(name, 0) + count
+
+    result = {
+        'scene': scene,
+        'bodies': n,
+        'config': config,
+        'steps': done,
+        'dt': dt,
+        'seconds': elapsed,
+        'steps_per_sec': done / elapsed if elapsed > 0 else float('inf'),
+        'phases': {name: {'seconds': seconds, 'per_step': seconds / done}
+                   for name, seconds in phases.items()},
+        'counts': {name: count / done for name, count in counts.items()},
+    }
+
+    if memory:
+        result['memory'] = measure_memory(scene, n, dt, min(done, 10), config)
+
+    return result
+
+
+def measure_memory(scene, n, dt, steps, config):
+    """Measure the memory used building and stepping a scene.
+
+    This is done separately from timing, as tracing slows Python down.
+    """
+    tracemalloc.start()
+    try:
+        world = SCENES[scene](n, **world_options(**config))
+        built, _ = tracemalloc.get_traced_memory()
+        for _ in range(steps):
+            world.update(dt)
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    memory = {'world_bytes': built, 'current_bytes': current,
+              'peak_bytes': peak}
+    if resource is not None:
+        memory['max_rss_kb'] = resource.getrusage(
+            resource.RUSAGE_SELF).ru_maxrss
+
+    return memory
+
+
+def compare(old, new):
+    """Pair up results of the same runs and return `(old, new, speedup)`
+    for each.
+    """
+    def key(result):
+        return (result['scene'], result['bodies'],
+                json.dumps(result['config'], sort_keys=True))
+
+    old_results = {key(r): r for r in old['results']}
+    pairs = []
+    for result in new['results']:
+        previous = old_results.get(key(result))
+        if previous is not None:
+            pairs.append((previous, result,
+                          result['steps_per_sec'] / previous['steps_per_sec']))
+
+    return pairs
+
+
+def print_result(result):
+    phases = result['phases']
+    slowest = max(TOP_PHASES,
+                  key=lambda name: phases.get(name, {'seconds': 0})['seconds'])
+    print(f"{result['scene']:>14} {result['bodies']:>6} "
+          f"{result['steps']:>6} {result['steps_per_sec']:>10.2f} "
+          f"{slowest:>17} "
+          f"{1000 * phases[slowest]['per_step']:>9.3f}", end='')
+
+    if 'memory' in result:
+        print(f" {result['memory']['peak_bytes'] / 1e6:>9.2f}", end='')
+    print()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks',
+        description='Benchmark the physics step on standard scenes.')
+    parser.add_argument('--scenes', default=','.join(SCENES),
+                        help='comma-separated scenes to run')
+    parser.add_argument('--sizes', default='10,100,1000',
+                        help='comma-separated numbers of bodies')
+    parser.add_argument('--steps', type=int, default=100)
+    parser.add_argument('--dt', type=float, default=1/60)
+    parser.add_argument('--max-seconds', type=float, default=30,
+                        help='stop stepping a run after this long')
+    parser.add_argument('--broad-phase', default='hash',
+                        choices=sorted(BROAD_PHASES))
+    parser.add_argument('--solver', default='impulse',
+                        choices=['impulse', 'sequential'])
+    parser.add_argument('--narrow-phase', default='python',
+                        choices=['python', 'batch'])
+    parser.add_argument('--sleep', action='store_true',
+                        help='put resting islands to sleep')
+    parser.add_argument('--body-store', action='store_true',
+                        help='keep bodies in a NumPy body store')
+    parser.add_argument('--spring-set', action='store_true',
+                        help='work out spring forces with NumPy arrays')
+    parser.add_argument('--static-index', action='store_true',
+                        help='keep static bodies in a grid of their own')
+    parser.add_argument('--no-memory', action='store_true',
+                        help='skip measuring memory')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--compare',
+                        help='compare against results from this JSON file')
+    args = parser.parse_args(argv)
+
+    config = {'broad_phase': args.broad_phase,
+              'solver': args.solver,
+              'narrow_phase': args.narrow_phase,
+              'sleep': args.sleep,
+              'body_store': args.body_store,
+              'spring_set': args.spring_set,
+              'static_index': args.static_index}
+
+    results = {
+        'meta': {'python': sys.version,
+                 'implementation': platform.python_implementation(),
+                 'platform': platform.platform(),
+                 'time': time.strftime('%Y-%m-%dT%H:%M:%S')},
+        'results': [],
+    }
+
+    print(f"{'scene':>14} {'bodies':>6} {'steps':>6} {'steps/s':>10} "
+          f"{'slowest phase':>17} {'ms/step':>9}"
+          + ('' if args.no_memory else f" {'peak MB':>9}"))
+
+    for scene in args.scenes.split(','):
+        for n in map(int, args.sizes.split(',')):
+            result = run_benchmark(scene, n, steps=args.steps, dt=args.dt,
+                                   max_seconds=args.max_seconds,
+                                   memory=not args.no_memory, **config)
+            results['results'].append(result)
+            print_result(result)
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+
+    if args.compare:
+        with open(args.compare) as file:
+            old = json.load(file)
+
+        print()
+        for previous, result, speedup in compare(old, results):
+            print(f"{result['scene']:>14} {result['bodies']:>6} "
+                  f"{previous['steps_per_sec']:>10.2f} -> "
+                  f"{result['steps_per_sec']:>10.2f} steps/s "
+                  f"({speedup:.2f}x)")
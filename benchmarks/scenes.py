@@ -0,0 +1,126 @@
+"""Standard scenes to benchmark
+Each scene is a function taking the number of bodies and any keyword
+arguments for `CollidingWorld`, and returning the built world.  Scenes
+are seeded, so the same arguments always build the same world.
+"""
+
+import random
+
+from base import *
+from colliding_world import *
+from phys import Spring
+
+__all__ = ['SCENES', 'hexagon_pile', 'spring_chain', 'triangle_rain',
+           'sparse_field']
+
+
+MATERIAL = Material(
+    static_friction=0.4,
+    dynamic_friction=0.2,
+    restitution=0.2,
+    density=1,
+)
+
+HEXAGON = [Vec(100, 0), Vec(50, 87), Vec(-50, 87),
+           Vec(-100, 0), Vec(-50, -87), Vec(50, -87)]
+TRIANGLE = [Vec(-100, -57.7), Vec(100, -57.7), Vec(0, 115.5)]
+BOX = [Vec(-50, -50), Vec(50, -50), Vec(50, 50), Vec(-50, 50)]
+
+
+def body(shape, scale, pos, ang=0, vel=None):
+    """Make a dynamic collider with mass and moi worked out as in
+    `main.Hexagon`.
+    """
+    vertices = [v * scale for v in shape]
+    size = scale * 100
+    mass = 3**0.5 / 2 * size**2 * MATERIAL.density
+    moi = 5 / 16 * 3**0.5 * size**4 * MATERIAL.density
+
+    return Collider(vertices, MATERIAL, pos, ang, mass, moi,
+                    vel=vel if vel is not None else Vec(0, 0), acc=Vec(0, 0))
+
+
+def wall(x1, y1, x2, y2):
+    """Make a static box from (x1, y1) to (x2, y2)."""
+    centre = Vec((x1 + x2) / 2, (y1 + y2) / 2)
+    w = (x2 - x1) / 2
+    h = (y2 - y1) / 2
+    return Collider([Vec(-w, -h), Vec(w, -h), Vec(w, h), Vec(-w, h)],
+                    MATERIAL, centre, 0, float('inf'), float('inf'),
+                    vel=Vec(0, 0), acc=Vec(0, 0))
+
+
+def hexagon_pile(n, **kwargs):
+    """Hexagons dropped in columns into a walled pit, as in `main`."""
+    world = CollidingWorld(gravity=Vec(0, -100), **kwargs)
+
+    columns = max(1, int(n ** 0.5))
+    width = columns * 110
+    world.add_ent(wall(-width, -100, 2 * width, 0),
+                  wall(-20, 0, 0, 100 * n),
+                  wall(width, 0, width + 20, 100 * n))
+
+    rng = random.Random(n)
+    for i in range(n):
+        pos = Vec(55 + (i % columns) * 110, 60 + (i // columns) * 110)
+        world.add_ent(body(HEXAGON, 0.5, pos, ang=rng.uniform(0, 1)))
+
+    return world
+
+
+def spring_chain(n, **kwargs):
+    """A chain of boxes joined by springs, hanging from a static anchor."""
+    world = CollidingWorld(gravity=Vec(0, -100), **kwargs)
+
+    anchor = wall(-10, 0, 10, 20)
+    world.add_ent(anchor)
+
+    previous = anchor
+    for i in range(n):
+        link = body(BOX, 0.2, Vec(30 * (i + 1), 10))
+        world.add_ent(link)
+        world.add_spring(Spring(stiffness=10000, end1=previous, end2=link,
+                                slack_length=25))
+        previous = link
+
+    return world
+
+
+def triangle_rain(n, **kwargs):
+    """Triangles falling onto a floor from random places."""
+    world = CollidingWorld(gravity=Vec(0, -100), **kwargs)
+
+    width = 100 * max(10, int(n ** 0.5) * 5)
+    world.add_ent(wall(-100, -100, width + 100, 0))
+
+    rng = random.Random(n)
+    for i in range(n):
+        pos = Vec(rng.uniform(0, width), rng.uniform(100, width))
+        vel = Vec(0, rng.uniform(-200, 0))
+        world.add_ent(body(TRIANGLE, 0.3, pos, rng.uniform(0, 6), vel))
+
+    return world
+
+
+def sparse_field(n, **kwargs):
+    """Bodies drifting without gravity, spread out so few touch."""
+    world = CollidingWorld(gravity=Vec(0, 0), **kwargs)
+
+    width = 400 * max(1, int(n ** 0.5))
+
+    rng = random.Random(n)
+    for i in range(n):
+        shape = rng.choice((HEXAGON, TRIANGLE, BOX))
+        pos = Vec(rng.uniform(0, width), rng.uniform(0, width))
+        vel = Vec(rng.uniform(-50, 50), rng.uniform(-50, 50))
+        world.add_ent(body(shape, 0.3, pos, rng.uniform(0, 6), vel))
+
+    return world
+
+
+SCENES = {
+    'hexagon_pile': hexagon_pile,
+    'spring_chain': spring_chain,
+    'triangle_rain': triangle_rain,
+    'sparse_field': sparse_field,
+}
@@ -0,0 +1,255 @@
+"""Array-backed storage for entities
+This module provides `BodyStore`, which keeps the state of every entity
+in a `World` in contiguous NumPy arrays so that integration can be done
+for all of them at once.  It needs NumPy, which the rest of the engine
+does not.
+
+Entities added to a world with a store still work as before: their
+attributes become views into the store's arrays.
+"""
+
+import numpy as np
+
+from base import *
+from phys import Pin
+
+__all__ = ['BodyStore', 'VecView']
+
+
+class VecView(Vec):
+    """A `Vec` stored in an entity's row of one of a `BodyStore`'s arrays.
+
+    The array is looked up each time, so the view stays valid when the
+    store grows or moves the entity to another row.
+    """
+    __slots__ = ['ent', 'name']
+
+    def __init__(self, ent, name):
+        self.ent = ent
+        self.name = name
+
+    @property
+    def x(self):
+        ent = self.ent
+        return getattr(ent._body_store, self.name)[ent._body_index, 0]
+
+    @x.setter
+    def x(self, value):
+        ent = self.ent
+        getattr(ent._body_store, self.name)[ent._body_index, 0] = value
+
+    @property
+    def y(self):
+        ent = self.ent
+        return getattr(ent._body_store, self.name)[ent._body_index, 1]
+
+    @y.setter
+    def y(self, value):
+        ent = self.ent
+        getattr(ent._body_store, self.name)[ent._body_index, 1] = value
+
+
+# Entity attribute -> store array.  `new_pos` and `new_vel` are always
+# the same objects as `pos` and `vel` between steps, so they share them.
+VEC_ATTRIBUTES = {'pos': 'pos', 'new_pos': 'pos',
+                  'vel': 'vel', 'new_vel': 'vel',
+                  'acc': 'acc', 'new_acc': 'new_acc'}
+SCALAR_ATTRIBUTES = ['mass', 'moi',
+                     'ang', 'new_ang',
+                     'ang_vel', 'new_ang_vel',
+                     'ang_acc', 'new_ang_acc',
+                     'awake']
+
+
+def vec_property(name):
+    def getter(self):
+        return self._body_views[name]
+
+    def setter(self, value):
+        row = getattr(self._body_store, name)[self._body_index]
+        row[0] = value.x
+        row[1] = value.y
+
+    return property(getter, setter)
+
+
+def scalar_property(name):
+    def getter(self):
+        return getattr(self._body_store, name)[self._body_index]
+
+    def setter(self, value):
+        getattr(self._body_store, name)[self._body_index] = value
+
+    return property(getter, setter)
+
+
+def plain_state(ent):
+    """Return the attributes `ent` would have outside of a store."""
+    state = dict(vars(ent))
+    for key in ('_body_store', '_body_index', '_body_views'):
+        state.pop(key, None)
+
+    arrays = {}
+    for attr, array in VEC_ATTRIBUTES.items():
+        # Keep eg. `pos` and `new_pos` as the same object.
+        if array not in arrays:
+            value = ent._body_views[array]
+            arrays[array] = Vec(float(value.x), float(value.y))
+        state[attr] = arrays[array]
+
+    for attr in SCALAR_ATTRIBUTES:
+        state[attr] = float(getattr(ent, attr))
+    state['awake'] = bool(state['awake'])
+
+    return state
+
+
+class StoredEntity:
+    """Mixin turning an entity's state attributes into array views."""
+    def __reduce_ex__(self, protocol):
+        # Pickle as the plain entity class with its current state.
+        return object.__new__, (type(self).__bases__[1],), plain_state(self)
+
+
+for _attr, _array in VEC_ATTRIBUTES.items():
+    setattr(StoredEntity, _attr, vec_property(_array))
+for _attr in SCALAR_ATTRIBUTES:
+    setattr(StoredEntity, _attr, scalar_property(_attr))
+del _attr, _array
+
+
+class BodyStore:
+    """Entity state held in NumPy arrays, one row per entity.
+
+    capacity - the number of rows to allocate at first.  The arrays
+        double in size whenever they fill up.
+    """
+    _view_classes = {}
+
+    def __init__(self, capacity=64):
+        self.entities = []
+        self.capacity = 0
+        self.pos = np.zeros((0, 2))
+        self.vel = np.zeros((0, 2))
+        self.acc = np.zeros((0, 2))
+        self.new_acc = np.zeros((0, 2))
+        for name in SCALAR_ATTRIBUTES:
+            setattr(self, name, np.zeros(0))
+
+        self._grow(capacity)
+
+    def __len__(self):
+        return len(self.entities)
+
+    def _arrays(self):
+        return ['pos', 'vel', 'acc', 'new_acc'] + SCALAR_ATTRIBUTES
+
+    def _grow(self, capacity):
+        for name in self._arrays():
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:])
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+        self.capacity = capacity
+
+    @classmethod
+    def view_class(cls, ent_cls):
+        """Return the subclass of `ent_cls` used for stored entities."""
+        if ent_cls not in cls._view_classes:
+            cls._view_classes[ent_cls] = type(
+                ent_cls.__name__, (StoredEntity, ent_cls),
+                {'__module__': ent_cls.__module__},
+            )
+
+        return cls._view_classes[ent_cls]
+
+    def attach(self, ent):
+        """Move `ent`'s state into the store."""
+        if isinstance(ent, Pin):
+            raise TypeError(f"{ent} cannot be stored, as it is a Pin")
+        if isinstance(ent, StoredEntity):
+            raise ValueError(f"{ent} is already in a BodyStore")
+
+        n = len(self.entities)
+        if n == self.capacity:
+            self._grow(max(1, 2 * self.capacity))
+
+        d = vars(ent)
+        for attr, array in VEC_ATTRIBUTES.items():
+            value = d.pop(attr)
+            if attr == array:
+                getattr(self, array)[n] = (value.x, value.y)
+        for attr in SCALAR_ATTRIBUTES:
+            getattr(self, attr)[n] = d.pop(attr)
+
+        ent._body_store = self
+        ent._body_index = n
+        ent._body_views = {array: VecView(ent, array)
+                           for array in set(VEC_ATTRIBUTES.values())}
+        ent.__class__ = self.view_class(type(ent))
+
+        self.entities.append(ent)
+
+    def detach(self, ent):
+        """Move `ent`'s state out of the store back into the entity."""
+        if getattr(ent, '_body_store', None) is not self:
+            raise ValueError(f"{ent} is not in this BodyStore")
+
+        state = plain_state(ent)
+
+        # Fill the hole with the last row.
+        i = ent._body_index
+        last = self.entities.pop()
+        if last is not ent:
+            for name in self._arrays():
+                array = getattr(self, name)
+                array[i] = array[len(self.entities)]
+            last._body_index = i
+            self.entities[i] = last
+
+        ent.__class__ = type(ent).__bases__[1]
+        del ent._body_store, ent._body_index, ent._body_views
+        vars(ent).update(state)
+
+    def damp(self, dt):
+        n = len(self.entities)
+        awake = self.awake[:n] != 0
+        self.vel[:n][awake] -= self.vel[:n][awake] * 0.1 * dt
+        self.ang_vel[:n][awake] -= self.ang_vel[:n][awake] * 0.1 * dt
+
+    def update_move(self, dt, gravity):
+        """Step every awake finite-mass entity's position using Velocity
+        Verlet.
+        """
+        n = len(self.entities)
+        moving = (self.mass[:n] != float('inf')) & (self.awake[:n] != 0)
+
+        new_acc = self.new_acc[:n][moving] + (gravity.x, gravity.y)
+        vel = self.vel[:n][moving] + (self.acc[:n][moving] + new_acc) * dt / 2
+        pos = self.pos[:n][moving] + vel*dt + new_acc*dt*dt/2
+
+        self.vel[:n][moving] = vel
+        self.pos[:n][moving] = pos
+        self.acc[:n][moving] = new_acc
+        self.new_acc[:n][moving] = 0
+
+    def update_turn(self, dt):
+        """Step every awake entity's orientation using Velocity Verlet."""
+        n = len(self.entities)
+        awake = self.awake[:n] != 0
+
+        ang_acc = self.ang_acc[:n][awake]
+        new_ang_acc = self.new_ang_acc[:n][awake]
+
+        ang_vel = 1 * self.new_ang_vel[:n][awake] + \
+                  (ang_acc + new_ang_acc) * dt / 2
+        ang = self.new_ang[:n][awake] + ang_vel*dt + new_ang_acc*dt*dt/2
+
+        self.ang_vel[:n][awake] = ang_vel
+        self.ang[:n][awake] = ang
+        self.ang_acc[:n][awake] = new_ang_acc
+
+        self.new_ang[:n][awake] = ang
+        self.new_ang_vel[:n][awake] = ang_vel
+        self.new_ang_acc[:n][awake] = 0
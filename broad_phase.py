@@ -0,0 +1,547 @@
+"""Broad-phase collision culling
+This module provides broad phases, which take the axis-aligned bounding
+box of every collider in a world and cheaply find the pairs whose boxes
+overlap.  Only those pairs need the full separating axis test in
+`collision.collide`.
+
+Every broad phase is used the same way: `update` is given the colliders
+and their boxes for this step, and `pairs` then returns the overlapping
+pairs as `(i, j)` index tuples with `i < j`, sorted in the same order as
+the brute-force search in `collision.aabb_pairs`.  The `query_*` methods
+return the indices of the boxes touching a region, point or segment.
+"""
+
+from math import floor
+
+from aabb_tree import AABBTree
+from collision import (aabb_pairs, collide_aabb, collide_segment_aabb,
+                       cull_pairs)
+
+__all__ = ['BroadPhase', 'BruteForce', 'SpatialHash', 'SweepAndPrune',
+           'DynamicTree', 'StaticIndex']
+
+
+class BroadPhase:
+    """The interface shared by all broad phases."""
+    def __init__(self):
+        self.colliders = []
+        self.boxes = []
+
+    def update(self, colliders, boxes):
+        """Bring the broad phase up to date with this step's boxes."""
+        self.colliders = list(colliders)
+        self.boxes = list(boxes)
+
+    def pairs(self):
+        """Return the sorted `(i, j)` pairs of overlapping boxes."""
+        raise NotImplementedError
+
+    def find_pairs(self, colliders, boxes):
+        self.update(colliders, boxes)
+        return self.pairs()
+
+    def find_candidates(self, colliders, boxes):
+        """Return the pairs of `find_pairs` that may collide, as
+        `collision.find_candidates` does.
+        """
+        return cull_pairs(colliders, self.find_pairs(colliders, boxes))
+
+    def mark_dirty(self):
+        """Note that colliders were added or removed since the last
+        update.  Broad phases that keep state between steps may need to
+        rebuild it.
+        """
+
+    def query_region(self, box):
+        return [i for i, b in enumerate(self.boxes) if collide_aabb(box, b)]
+
+    def query_point(self, point):
+        return self.query_region((point.x, point.y, point.x, point.y))
+
+    def query_segment(self, start, end):
+        return [i for i, b in enumerate(self.boxes)
+                if collide_segment_aabb(start, end, b)]
+
+
+class BruteForce(BroadPhase):
+    """Test every pair of boxes against each other.  O(n^2)."""
+    def pairs(self):
+        return list(aabb_pairs(self.boxes))
+
+
+class SpatialHash(BroadPhase):
+    """Bin boxes into a uniform grid and only test boxes sharing a cell.
+
+    cell_size - the width and height of a grid cell.  If it is `None`,
+        twice the mean box size is used, recalculated each step.
+    max_cells - boxes covering more cells than this (eg. a huge floor)
+        are not binned and are instead tested against every other box.
+    """
+    def __init__(self, cell_size=None, max_cells=64):
+        super().__init__()
+        self.cell_size = cell_size
+        self.max_cells = max_cells
+
+    def get_cell_size(self):
+        if self.cell_size is not None:
+            return self.cell_size
+
+        # Ignore infinite and oversized boxes when picking a size, as
+        # they would swamp the mean.
+        total = 0
+        count = 0
+        for x1, y1, x2, y2 in self.boxes:
+            size = max(x2 - x1, y2 - y1)
+            if 0 < size < float('inf'):
+                total += size
+                count += 1
+
+        if count == 0:
+            return 1.0
+
+        return 2 * total / count
+
+    def pairs(self):
+        boxes = self.boxes
+        size = self.get_cell_size()
+
+        cells = {}
+        oversized = []
+        for i, (x1, y1, x2, y2) in enumerate(boxes):
+            try:
+                cx1, cx2 = floor(x1 / size), floor(x2 / size)
+                cy1, cy2 = floor(y1 / size), floor(y2 / size)
+            except (OverflowError, ValueError):
+                # Infinite or NaN extents.
+                oversized.append(i)
+                continue
+
+            if (cx2 - cx1 + 1) * (cy2 - cy1 + 1) > self.max_cells:
+                oversized.append(i)
+                continue
+
+            for cx in range(cx1, cx2 + 1):
+                for cy in range(cy1, cy2 + 1):
+                    cells.setdefault((cx, cy), []).append(i)
+
+        found = set()
+        for members in cells.values():
+            for a in range(len(members) - 1):
+                i = members[a]
+                for j in members[a + 1:]:
+                    if collide_aabb(boxes[i], boxes[j]):
+                        found.add((i, j))  # Members are in index order.
+
+        for i in oversized:
+            for j in range(len(boxes)):
+                if i != j and collide_aabb(boxes[i], boxes[j]):
+                    found.add((min(i, j), max(i, j)))
+
+        return sorted(found)
+
+
+class SweepAndPrune(BroadPhase):
+    """Keep the edges of every box sorted along both axes between steps.
+
+    Bodies barely move from one step to the next, so the edge lists are
+    almost in order already and insertion sort puts them right in close
+    to linear time.  Whenever two edges swap places, the number of axes
+    their boxes overlap on goes up or down by one; boxes overlapping on
+    both axes are a pair.
+
+    added - the pairs of colliders that started overlapping during the
+        last update.
+    removed - the pairs of colliders that stopped overlapping (or were
+        removed) during the last update.
+    """
+
+    class Proxy:
+        __slots__ = ['serial', 'collider', 'edges']
+
+        def __init__(self, serial, collider):
+            self.serial = serial
+            self.collider = collider
+            # [(begin, end)] for each axis.  Each edge is a list of
+            # [position, is_end, proxy].
+            self.edges = ([float('inf'), False, self],
+                          [float('inf'), True, self]), \
+                         ([float('inf'), False, self],
+                          [float('inf'), True, self])
+
+    def __init__(self):
+        super().__init__()
+        self.axes = ([], [])
+        self.proxies = {}    # id(collider) -> Proxy
+        self.serials = {}    # serial -> Proxy
+        self.overlaps = {}   # (serial, serial) -> no. of axes overlapping
+        self.overlapping = set()  # Keys of `overlaps` that equal 2.
+        self.added = []
+        self.removed = []
+        self._next_serial = 0
+        self._changed = {}   # Key -> whether it overlapped before update.
+
+    def update(self, colliders, boxes):
+        super().update(colliders, boxes)
+        self.added = []
+        self.removed = []
+        self._changed = {}
+
+        current = {id(c) for c in self.colliders}
+        gone = [p for k, p in self.proxies.items() if k not in current]
+        if gone:
+            self._remove_proxies(gone)
+
+        for collider, (x1, y1, x2, y2) in zip(self.colliders, self.boxes):
+            proxy = self.proxies.get(id(collider))
+            if proxy is None:
+                # New edges start at the far end of the lists, which is
+                # the same as having been at infinity last step.
+                proxy = self.Proxy(self._next_serial, collider)
+                self._next_serial += 1
+                self.proxies[id(collider)] = proxy
+                self.serials[proxy.serial] = proxy
+                for axis, (begin, end) in zip(self.axes, proxy.edges):
+                    axis.append(begin)
+                    axis.append(end)
+
+            (bx, ex), (by, ey) = proxy.edges
+            bx[0] = x1
+            ex[0] = x2
+            by[0] = y1
+            ey[0] = y2
+
+        for axis in self.axes:
+            self._sort_axis(axis)
+
+        for key, was_overlapping in self._changed.items():
+            is_overlapping = self.overlaps.get(key, 0) == 2
+            if is_overlapping == was_overlapping:
+                continue
+
+            if is_overlapping:
+                self.overlapping.add(key)
+                self.added.append(self._key_colliders(key))
+            else:
+                self.overlapping.discard(key)
+                self.removed.append(self._key_colliders(key))
+
+    def pairs(self):
+        index = {id(c): i for i, c in enumerate(self.colliders)}
+        serials = {p.serial: index[k] for k, p in self.proxies.items()}
+
+        pairs = []
+        for s1, s2 in self.overlapping:
+            i, j = serials[s1], serials[s2]
+            pairs.append((i, j) if i < j else (j, i))
+
+        pairs.sort()
+        return pairs
+
+    def _key_colliders(self, key):
+        return self.serials[key[0]].collider, self.serials[key[1]].collider
+
+    def _remove_proxies(self, gone):
+        serials = {p.serial for p in gone}
+
+        for i, axis in enumerate(self.axes):
+            self.axes[i][:] = [e for e in axis if e[2].serial not in serials]
+
+        for key in [k for k in self.overlaps
+                    if k[0] in serials or k[1] in serials]:
+            if key in self.overlapping:
+                self.overlapping.discard(key)
+                self.removed.append(self._key_colliders(key))
+            del self.overlaps[key]
+
+        for proxy in gone:
+            del self.proxies[id(proxy.collider)]
+            del self.serials[proxy.serial]
+
+    def _sort_axis(self, axis):
+        for k in range(1, len(axis)):
+            edge = axis[k]
+            pos, is_end, proxy = edge
+
+            j = k - 1
+            while j >= 0:
+                other = axis[j]
+                if other[0] < pos or (other[0] == pos and other[1] <= is_end):
+                    break
+
+                # `edge` passes `other` going left.  A begin passing an
+                # end means the boxes now overlap on this axis and an
+                # end passing a begin means they no longer do.
+                if is_end != other[1]:
+                    self._change_overlap(proxy, other[2], -1 if is_end else 1)
+
+                axis[j + 1] = other
+                j -= 1
+
+            axis[j + 1] = edge
+
+    def _change_overlap(self, p1, p2, change):
+        if p1.serial < p2.serial:
+            key = (p1.serial, p2.serial)
+        else:
+            key = (p2.serial, p1.serial)
+
+        count = self.overlaps.get(key, 0)
+        if key not in self._changed:
+            self._changed[key] = count == 2
+
+        count += change
+        if count:
+            self.overlaps[key] = count
+        else:
+            del self.overlaps[key]
+
+
+class DynamicTree(BroadPhase):
+    """Keep the boxes in an `aabb_tree.AABBTree`.
+
+    Pairs and queries take O(log n) per box.  A collider is only moved
+    in the tree when it leaves its fat box, so static bodies are never
+    moved at all.
+
+    margin - how far each box is grown past its collider's box.
+    """
+    def __init__(self, margin=10.0):
+        super().__init__()
+        self.tree = AABBTree(margin)
+        self.leaves = {}  # id(collider) -> leaf
+        self.moved = 0    # Leaves reinserted in the last update.
+
+    def update(self, colliders, boxes):
+        super().update(colliders, boxes)
+        self.moved = 0
+
+        current = {id(c) for c in self.colliders}
+        for key in [k for k in self.leaves if k not in current]:
+            self.tree.remove(self.leaves.pop(key))
+
+        for i, (collider, box) in enumerate(zip(self.colliders, self.boxes)):
+            leaf = self.leaves.get(id(collider))
+            if leaf is None:
+                self.leaves[id(collider)] = self.tree.insert(i, box)
+                continue
+
+            # Leaves hold their collider's index for this step.
+            leaf.item = i
+            if self.tree.move(leaf, box):
+                self.moved += 1
+
+    def pairs(self):
+        boxes = self.boxes
+
+        found = set()
+        for i, box in enumerate(boxes):
+            for j in self.tree.query(box):
+                # Fat boxes overlap, so check the real ones.
+                if j > i and collide_aabb(box, boxes[j]):
+                    found.add((i, j))
+
+        return sorted(found)
+
+    def query_region(self, box):
+        return [i for i in self.tree.query(box)
+                if collide_aabb(box, self.boxes[i])]
+
+    def query_segment(self, start, end):
+        return [i for i in self.tree.ray_cast(start, end)
+                if collide_segment_aabb(start, end, self.boxes[i])]
+
+
+class StaticIndex(BroadPhase):
+    """Keep static colliders (of infinite mass) in a grid of their own,
+    and find the pairs of the rest with another broad phase.
+
+    The grid keeps each static collider by identity, so it is only
+    built again when static colliders are added or removed, or after
+    `mark_dirty` is called if their boxes changed.  `CollidingWorld`
+    calls it when entities are added or removed or static bodies are
+    moved.  Static colliders must not be moved without calling it.  Each
+    moving box is looked up in the grid, so a huge floor is only paired
+    with the boxes near it, and pairs of two static colliders are never
+    found.
+
+    moving - the broad phase for colliders that can move.  If it is
+        `None`, they are tested against each other by brute force.
+    cell_size - the width and height of a grid cell.
+    max_cells - boxes covering more cells than this are tested against
+        every box instead of being binned or looked up.
+    builds - the number of times the grid has been built.
+    """
+    def __init__(self, moving=None, cell_size=256, max_cells=1024):
+        super().__init__()
+        self.moving = BruteForce() if moving is None else moving
+        self.cell_size = cell_size
+        self.max_cells = max_cells
+        self.builds = 0
+        self.dirty = True
+
+        self.positions = {}     # Static collider -> position in the grid.
+        self.static = []        # Index in `colliders` of each static one.
+        self.dynamic = []       # Index in `colliders` of each moving one.
+        self.static_boxes = []  # Boxes of the static colliders when built.
+        self.cells = {}         # (cx, cy) -> [position in `static`]
+        self.oversized = []     # Positions in `static` of unbinned boxes.
+
+    def mark_dirty(self):
+        self.dirty = True
+        self.moving.mark_dirty()
+
+    def update(self, colliders, boxes):
+        super().update(colliders, boxes)
+
+        # Find where each static collider in the grid is this step.
+        positions = self.positions
+        static = [None] * len(positions)
+        dynamic = []
+        changed = False
+        for i, collider in enumerate(self.colliders):
+            if collider.mass != float('inf'):
+                dynamic.append(i)
+                continue
+
+            k = positions.get(collider)
+            if k is None:
+                changed = True
+            else:
+                static[k] = i
+
+        changed = changed or None in static
+        if not changed and self.dirty:
+            changed = any(self.boxes[i] != box
+                          for i, box in zip(static, self.static_boxes))
+
+        if changed:
+            static = [i for i, collider in enumerate(self.colliders)
+                      if collider.mass == float('inf')]
+            self.positions = {self.colliders[i]: k
+                              for k, i in enumerate(static)}
+            self.build([self.boxes[i] for i in static])
+
+        self.static = static
+        self.dynamic = dynamic
+        self.dirty = False
+
+        self.moving.update([self.colliders[i] for i in dynamic],
+                           [self.boxes[i] for i in dynamic])
+
+    def get_cells(self, box):
+        """Return the range of cells `box` covers, or `None` if it covers
+        too many.
+        """
+        x1, y1, x2, y2 = box
+        size = self.cell_size
+        try:
+            cx1, cx2 = floor(x1 / size), floor(x2 / size)
+            cy1, cy2 = floor(y1 / size), floor(y2 / size)
+        except (OverflowError, ValueError):
+            # Infinite or NaN extents.
+            return None
+
+        if (cx2 - cx1 + 1) * (cy2 - cy1 + 1) > self.max_cells:
+            return None
+
+        return cx1, cy1, cx2, cy2
+
+    def get_segment_cells(self, start, end):
+        """Return the cells the segment from `start` to `end` passes
+        through, in order, or `None` if there are too many.
+        """
+        size = self.cell_size
+        x, y = start.x / size, start.y / size
+        dx, dy = end.x / size - x, end.y / size - y
+        try:
+            cx, cy = floor(x), floor(y)
+            n = abs(floor(x + dx) - cx) + abs(floor(y + dy) - cy)
+        except (OverflowError, ValueError):
+            return None
+        if n >= self.max_cells:
+            return None
+
+        # Step from cell to cell across whichever grid line the segment
+        # meets next.
+        step_x = 1 if dx > 0 else -1
+        step_y = 1 if dy > 0 else -1
+        inf = float('inf')
+        next_x = (cx + (dx > 0) - x) / dx if dx else inf
+        next_y = (cy + (dy > 0) - y) / dy if dy else inf
+        delta_x = abs(1 / dx) if dx else inf
+        delta_y = abs(1 / dy) if dy else inf
+
+        cells = [(cx, cy)]
+        for _ in range(n):
+            if next_x < next_y:
+                cx += step_x
+                next_x += delta_x
+            else:
+                cy += step_y
+                next_y += delta_y
+            cells.append((cx, cy))
+
+        return cells
+
+    def build(self, boxes):
+        """Bin the boxes of the static colliders into the grid."""
+        self.static_boxes = boxes
+        self.cells = {}
+        self.oversized = []
+        for k, box in enumerate(boxes):
+            cells = self.get_cells(box)
+            if cells is None:
+                self.oversized.append(k)
+                continue
+
+            cx1, cy1, cx2, cy2 = cells
+            for cx in range(cx1, cx2 + 1):
+                for cy in range(cy1, cy2 + 1):
+                    self.cells.setdefault((cx, cy), []).append(k)
+
+        self.builds += 1
+
+    def query_static(self, box):
+        """Return the indices of the static colliders touching `box`."""
+        boxes = self.static_boxes
+        cells = self.get_cells(box)
+        if cells is None:
+            found = range(len(boxes))
+        else:
+            cx1, cy1, cx2, cy2 = cells
+            found = set(self.oversized)
+            for cx in range(cx1, cx2 + 1):
+                for cy in range(cy1, cy2 + 1):
+                    found.update(self.cells.get((cx, cy), ()))
+
+        return [self.static[k] for k in found if collide_aabb(box, boxes[k])]
+
+    def pairs(self):
+        dynamic = self.dynamic
+        # `dynamic` is in index order, so the pairs stay `i < j`.
+        found = [(dynamic[a], dynamic[b]) for a, b in self.moving.pairs()]
+        for i in dynamic:
+            for j in self.query_static(self.boxes[i]):
+                found.append((min(i, j), max(i, j)))
+
+        return sorted(found)
+
+    def query_region(self, box):
+        return sorted([self.dynamic[a] for a in self.moving.query_region(box)]
+                      + self.query_static(box))
+
+    def query_segment(self, start, end):
+        boxes = self.static_boxes
+        cells = self.get_segment_cells(start, end)
+        if cells is None:
+            found = range(len(boxes))
+        else:
+            found = set(self.oversized)
+            for cell in cells:
+                found.update(self.cells.get(cell, ()))
+
+        static = [self.static[k] for k in found
+                  if collide_segment_aabb(start, end, boxes[k])]
+        return sorted([self.dynamic[a]
+                       for a in self.moving.query_segment(start, end)]
+                      + static)
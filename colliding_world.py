@@ -1,6 +1,7 @@
 from base import *
 from collision import *
 from phys import *
+from broad_phase import BruteForce
 
 __all__ = ['Collider', 'CollidingWorld', 'Material']
 
@@ -28,28 +29,134 @@ class Material:
         )
 
 
+def change_count(counts, key, change):
+    count = counts.get(key, 0) + change
+    if count > 0:
+        counts[key] = count
+    else:
+        counts.pop(key, None)
+
+
+def set_ignored(entities, ignored):
+    """Make `entities`, a dict of handle strings to colliders, ignore
+    each other as in `ignored`, a dict of handle strings to the
+    `ignored` of each collider's `to_dict`.
+    """
+    for key, others in ignored.items():
+        ent = entities[key]
+        for other_key, count in others.items():
+            other = entities[other_key]
+            ent.ignored[other] = count
+            other.ignored[ent] = count
+
+
 class Collider(Entity):
     def __init__(self, shape, material, pos, ang, mass, moi, vel=Vec(), acc=Vec(), ang_vel=0, ang_acc=0):
         # todo: auto-calculate mass and moi
         super().__init__(pos, mass, ang, moi, vel, acc, ang_vel, ang_acc)
         self.vertices = shape
         self.material = material
+        # Whether to stop it passing through other colliders when it
+        # moves further than their size in a step (see
+        # `CollidingWorld.update_bullets`).
+        self.bullet = False
+
+        # Collision filtering (see `collision.can_collide`): bits for
+        # the categories it is in, bits for the categories it collides
+        # with, and its group.
+        self.category = 0x0001
+        self.mask = 0xFFFF
+        self.group = 0
+        # Collider -> number of times `ignore` was called for it.
+        self.ignored = {}
+        # Collider -> number of springs joining them, in worlds that
+        # ignore springs.
+        self.joined = {}
+
+    def get_defaults(self):
+        defaults = super().get_defaults()
+        defaults.update({'bullet': False,
+                         'category': 0x0001, 'mask': 0xFFFF, 'group': 0,
+                         'ignored': {}, 'joined': {}})
+        return defaults
+
+    def ignore(self, other):
+        """Never collide with `other` until `unignore` is called as many
+        times.
+        """
+        change_count(self.ignored, other, 1)
+        change_count(other.ignored, self, 1)
+
+    def unignore(self, other):
+        change_count(self.ignored, other, -1)
+        change_count(other.ignored, self, -1)
 
     def get_vertices(self):
-        return [vertex.rotate(self.ang) + self.pos for vertex in self.vertices]
+        """Return the vertices in world space.
+
+        They are only transformed again when the pose changes, so the
+        list is shared between calls and must not be changed.
+        """
+        version = self.get_pose_version()
+        if getattr(self, '_vertices_version', None) != version \
+                or self._vertices_of is not self.vertices:
+            self._world_vertices = self.get_transform().apply_all(
+                self.vertices)
+            self._vertices_of = self.vertices
+            self._vertices_version = version
+            self._aabb = None
+
+        return self._world_vertices
+
+    def get_aabb(self):
+        """Return the bounding box of `get_vertices`."""
+        vertices = self.get_vertices()
+        if self._aabb is None:
+            self._aabb = make_aabb(vertices)
+
+        return self._aabb
+
+    def get_shape(self):
+        """Return the shared `collision.Shape` of `vertices`."""
+        if getattr(self, '_shape_of', None) is not self.vertices:
+            self._shape = Shape.of(self.vertices)
+            self._shape_of = self.vertices
+            self._normals_of = None
+
+        return self._shape
+
+    def get_normals(self):
+        """Return the unit normals of the sides in world space.
+
+        They are only rotated again when the angle changes, and with it
+        `get_rotation`.
+        """
+        shape = self.get_shape()
+        rotation = self.get_rotation()
+        if self._normals_of is not rotation:
+            self._normals = rotate_all(shape.normals, rotation)
+            self._normals_of = rotation
+
+        return self._normals
 
     def to_dict(self):
         d = super().to_dict()
         d.update(
             {'material': str(id(self.material)),
-             'shape'   : str(id(self.vertices))}
+             'shape'   : str(id(self.vertices)),
+             'category': self.category,
+             'mask'    : self.mask,
+             'group'   : self.group,
+             'bullet'  : self.bullet,
+             'ignored' : {str(other.handle): count
+                          for other, count in self.ignored.items()}}
         )
 
         return d
 
     @classmethod
     def from_dict(cls, d, id_, shapes, materials, *args, **kwargs):
-        return cls(
+        collider = cls(
             mass=d['mass'],
             pos=Vec.from_dict(d['pos']),
             vel=Vec.from_dict(d['vel']),
@@ -61,12 +168,52 @@ class Collider(Entity):
             shape=shapes[d['shape']],
             material=materials[d['material']],
         )
+        collider.category = d.get('category', collider.category)
+        collider.mask = d.get('mask', collider.mask)
+        collider.group = d.get('group', collider.group)
+        collider.bullet = d.get('bullet', False)
+
+        return collider
 
 
 class CollidingWorld(World):
-    def __init__(self, gravity=Vec(0, 0)):
-        super().__init__(gravity)
+    """A `World` whose entities collide with each other.
+
+    broad_phase - finds which pairs of entities might be colliding each
+        step (see the `broad_phase` module).  If it is `None`, a
+        `BruteForce` one tests every pair of bounding boxes.
+    narrow_phase - a function like `collision.collide_all` to find the
+        collisions with, eg. `batch_collision.batch_collide_all`.
+    solver - resolves the collisions each step, eg. a
+        `solver.SequentialImpulseSolver`.  If it is `None`, each
+        collision gets a single impulse and positional correction.
+
+    Pairs of sleeping entities (see `World`) are never collided.
+
+    ignore_springs - whether colliders joined by a spring never collide
+        with each other.
+    bullet_tolerance - how close colliders flagged as bullets are
+        stopped from what they would otherwise pass through in a step.
+    """
+    profile_phases = World.profile_phases + ['update_collision',
+                                             'update_bullets']
+    bullet_tolerance = 0.5
+
+    def __init__(self, gravity=Vec(0, 0), broad_phase=None, body_store=None,
+                 narrow_phase=collide_all, solver=None, sleeper=None,
+                 spring_set=None, ignore_springs=False):
+        self.ignore_springs = ignore_springs
+        super().__init__(gravity, body_store, sleeper, spring_set)
+        self.broad_phase = BruteForce() if broad_phase is None else broad_phase
+        self.narrow_phase = narrow_phase
+        self.solver = solver
+        self.collisions = []
         self.imps = []  # Impulse tracking for the visualisation.
+        # Impulses applied between pairs by the last `resolve_collisions`.
+        self.impulses = 0
+        # Whether entities moved since the broad phase was last brought
+        # up to date, so queries must update it first.
+        self.moved = True
 
     def add_ent(self, *objs):
         for obj in objs:
@@ -75,19 +222,85 @@ class CollidingWorld(World):
 
             super().add_ent(obj)
 
+        self.mark_changed()
+
+    def remove_ent(self, *objs):
+        for obj in objs:
+            # Forget ignoring it, so it is not saved with the others.
+            for other in list(obj.ignored):
+                other.ignored.pop(obj, None)
+            obj.ignored.clear()
+
+            if obj.mass == float('inf'):
+                # Static bodies are in no island, so wake whatever is
+                # resting on them instead.
+                for other in self.query_region(obj.get_aabb()):
+                    self.wake(other)
+
+        super().remove_ent(*objs)
+        self.mark_changed()
+
+    def add_spring(self, *springs):
+        super().add_spring(*springs)
+        if self.ignore_springs:
+            for spring in springs:
+                if isinstance(spring.end1, Collider) \
+                        and isinstance(spring.end2, Collider):
+                    change_count(spring.end1.joined, spring.end2, 1)
+                    change_count(spring.end2.joined, spring.end1, 1)
+
+    def remove_spring(self, *springs):
+        super().remove_spring(*springs)
+        if self.ignore_springs:
+            for spring in springs:
+                if isinstance(spring.end1, Collider) \
+                        and isinstance(spring.end2, Collider):
+                    change_count(spring.end1.joined, spring.end2, -1)
+                    change_count(spring.end2.joined, spring.end1, -1)
+
     def update(self, dt):
         # import random; random.shuffle(self.entities)
         self.imps = [imp[:3] + [imp[3] - 1] for imp in self.imps if imp[3] > 0]
         if len(self.imps) > 30:
             self.imps = self.imps[:31]
 
+        self.wake_springs()
         self.damp(dt)
         self.update_spring(dt)
         self.update_collision(dt)
+        bullets = self.get_bullets()
         self.update_turn(dt)
         self.update_move(dt)
+        # The broad phase still has where they were before moving.
+        self.moved = True
+        self.update_bullets(bullets, dt)
+        self.update_sleep(dt, ((o1, o2) for o1, o2, _, _, _ in self.collisions))
+
+    def mark_moved(self):
+        """Note that entities moved other than by stepping, eg. by hand,
+        so the broad phase is updated before it is next used.
+
+        Use `mark_changed` instead if any static bodies moved.
+        """
+        self.moved = True
+
+    def mark_changed(self):
+        """Note that entities were added or removed, or static bodies
+        moved, so the broad phase is built again before it is next used.
+        """
+        self.mark_moved()
+        self.broad_phase.mark_dirty()
 
     def update_collision(self, dt):
+        collisions = self.narrow_phase(self.entities, self.broad_phase)
+        self.collisions = collisions
+
+        if self.sleeper is not None:
+            self.sleeper.wake_touching((o1, o2) for o1, o2, _, _, _ in collisions)
+
+        self.resolve_collisions(collisions, dt)
+
+    def resolve_collisions(self, collisions, dt):
         def apply_impulse(entity, impulse, collision_normal, show=True):
             if entity.mass == float('inf'):
                 return
@@ -113,7 +326,7 @@ class CollidingWorld(World):
                 o1.new_pos -= 1 / o1.mass * correction
                 o2.new_pos += 1 / o2.mass * correction
 
-        def resolve(o1: Collider, o2: Collider, contact_normal):
+        def resolve(o1: Collider, o2: Collider, contact_normal, reference):
             if o1.mass == float('inf') and o2.mass == float('inf'):
                 return
 
@@ -121,9 +334,12 @@ class CollidingWorld(World):
 
             # Find some point in space to apply the torque from on each
             # object relative to each object.
-            pos = get_intersector(o1.get_vertices(), o2.get_vertices(), n)
-            if pos is None:
+            _, contacts = get_contacts(o1.get_vertices(), o2.get_vertices(),
+                                       o1.get_normals(), o2.get_normals(),
+                                       reference)
+            if not contacts:
                 return
+            pos = sum((p for p, _, _ in contacts), Vec(0, 0)) / len(contacts)
             pos_o1 = pos - o1.pos
             pos_o2 = pos - o2.pos
 
@@ -154,6 +370,7 @@ class CollidingWorld(World):
             impulse = j * n
             apply_impulse(o1, -impulse, pos_o1)
             apply_impulse(o2, impulse, pos_o2)
+            self.impulses += 1
 
             # Calculate and apply friction.
             # Combine coef. of static friction.
@@ -185,14 +402,180 @@ class CollidingWorld(World):
 
             apply_impulse(o1, -impulse, pos_o1)
             apply_impulse(o2, impulse, pos_o2)
-
-        collisions = collide_all(self.entities)
-        for o1, o2, separation, normal in collisions:
-            resolve(o1, o2, normal)
-
-        for o1, o2, separation, normal in collisions:
+            self.impulses += 1
+
+        self.impulses = 0
+        if self.solver is not None:
+            self.solver.solve(collisions, dt)
+            self.impulses = self.solver.impulses
+
+            for c in self.solver.contacts:
+                impulse = c.normal * c.normal_impulse \
+                          + c.tangent * c.tangent_impulse
+                if c.o1.mass != float('inf'):
+                    self.imps.append([c.o1.pos, -impulse, c.r1, 30])
+                if c.o2.mass != float('inf'):
+                    self.imps.append([c.o2.pos, impulse, c.r2, 30])
+            return
+
+        for o1, o2, separation, normal, reference in collisions:
+            resolve(o1, o2, normal, reference)
+
+        for o1, o2, separation, normal, reference in collisions:
             correct_positions(o1, o2, separation, normal)
 
+    def get_bullets(self):
+        """Return `(entity, transform)` for each awake bullet, to find
+        where they moved from after they move.
+        """
+        return [(ent, ent.get_transform()) for ent in self.get_awake()
+                if ent.bullet and ent.mass != float('inf')]
+
+    def update_bullets(self, bullets, dt):
+        """Stop bullets that moved through another collider this step
+        where they first hit it, and bounce them off it.
+
+        `bullets` are from `get_bullets` before the step moved them.
+        Only the bullets sweep through the step; other colliders are
+        found by where the broad phase saw them at the start of the step,
+        and taken to be where they ended up.
+        """
+        if not bullets:
+            return
+
+        for ent, start in bullets:
+            end = ent.get_transform()
+            if end is start:
+                continue
+
+            shape = ent.get_shape()
+            x1, y1, x2, y2 = make_aabb(start.apply_all(shape.vertices))
+            box = ent.get_aabb()
+            swept = (min(x1, box[0]), min(y1, box[1]),
+                     max(x2, box[2]), max(y2, box[3]))
+
+            first = None
+            for other in self.query_swept(swept):
+                if other is ent or not can_collide(ent, other):
+                    continue
+
+                hit = time_of_impact(shape, start, end, other.get_vertices(),
+                                     other.get_normals(),
+                                     self.bullet_tolerance)
+                if hit is None or (first is not None and hit[0] >= first[0]):
+                    continue
+
+                if hit[0] == 0:
+                    # Ones already touching at the start were collided as
+                    # usual, unless it moves so far into them that it
+                    # would go through.
+                    moved = Vec(end.x - start.x - other.vel.x * dt,
+                                end.y - start.y - other.vel.y * dt)
+                    if moved.dot(hit[2]) <= self.bullet_tolerance:
+                        continue
+
+                first = hit + (other,)
+
+            if first is not None:
+                t, _, normal, other = first
+                self.stop_bullet(ent, other, start, end, t, normal)
+
+    def query_swept(self, box):
+        """Return the colliders that might be in `box`, swept by a bullet
+        this step, without updating the broad phase.
+        """
+        # Still as `update_collision` left it.
+        entities = self.entities
+        return [entities[i] for i in self.broad_phase.query_region(box)]
+
+    def stop_bullet(self, ent, other, start, end, t, normal):
+        """Move `ent` back to fraction `t` of the way from the `Transform`
+        `start` to `end`, where it hits `other`, and bounce it off along
+        `normal`, which points towards `other`.
+        """
+        ent.pos = Vec(start.x + (end.x - start.x) * t,
+                      start.y + (end.y - start.y) * t)
+        ent.new_pos = ent.pos
+        ent.ang = ent.new_ang = start.rotation.angle + (
+            end.rotation.angle - start.rotation.angle) * t
+
+        # Hit at the middle of its vertices nearest `other`.
+        vertices = ent.get_vertices()
+        depth = max(v.dot(normal) for v in vertices)
+        near = [v for v in vertices if v.dot(normal) >= depth - 1e-6]
+        point = sum(near, Vec(0, 0)) / len(near)
+        r1 = point - ent.pos
+        r2 = point - other.pos
+
+        # Take out the speed towards `other` at that point, with
+        # restitution.
+        dv = ent.vel + Vec(x=-ent.ang_vel * r1.y, y=ent.ang_vel * r1.x) - (
+             other.vel + Vec(x=-other.ang_vel * r2.y, y=other.ang_vel * r2.x))
+        v_dot_n = dv.dot(normal)
+        if v_dot_n <= 0:
+            return
+
+        e = min(ent.material.restitution, other.material.restitution)
+        j = (1 + e) * v_dot_n / (1/ent.mass + 1/other.mass
+                                 + r1.cross(normal)**2 / ent.moi
+                                 + r2.cross(normal)**2 / other.moi)
+        impulse = normal * j
+
+        ent.vel = ent.vel - impulse / ent.mass
+        ent.new_vel = ent.vel
+        ent.ang_vel = ent.new_ang_vel = \
+            ent.ang_vel - r1.cross(impulse) / ent.moi
+        if other.mass != float('inf'):
+            other.vel = other.vel + impulse / other.mass
+            other.new_vel = other.vel
+            other.ang_vel = other.new_ang_vel = \
+                other.ang_vel + r2.cross(impulse) / other.moi
+            self.wake(other)
+
+    def update_broad_phase(self):
+        """Bring the broad phase up to date with the entities and return
+        it, so it can be queried between steps.
+
+        It is only updated if entities moved since it last was, so many
+        queries between steps cost one update between them.
+        """
+        broad_phase = self.broad_phase
+        if self.moved:
+            broad_phase.update(self.entities,
+                               [e.get_aabb() for e in self.entities])
+            self.moved = False
+        return broad_phase
+
+    def query_point(self, point):
+        """Return the entities containing `point`."""
+        broad_phase = self.update_broad_phase()
+        return [self.entities[i] for i in broad_phase.query_point(point)
+                if collide_point(point, self.entities[i].get_vertices(),
+                                 self.entities[i].get_normals()) < 0]
+
+    def query_region(self, box):
+        """Return the entities whose bounding boxes overlap `box`."""
+        broad_phase = self.update_broad_phase()
+        return [self.entities[i] for i in broad_phase.query_region(box)]
+
+    def ray_cast(self, start, end):
+        """Find the entities hit by the segment from `start` to `end`.
+
+        Returns `(fraction, entity)` tuples, nearest first, where
+        `fraction` is how far along the segment the entity is hit.
+        """
+        broad_phase = self.update_broad_phase()
+
+        hits = []
+        for i in broad_phase.query_segment(start, end):
+            ent = self.entities[i]
+            t = collide_segment(start, end, ent.get_vertices())
+            if t is not None:
+                hits.append((t, ent))
+
+        hits.sort(key=lambda hit: hit[0])
+        return hits
+
     def to_dict(self):
         d = super().to_dict()
 
@@ -214,7 +597,7 @@ class CollidingWorld(World):
         return d
 
     @classmethod
-    def from_dict(cls, d):
+    def from_dict(cls, d, **kwargs):
         materials = {}
         for id_, m in d['materials'].items():
             material = Material.from_dict(m)
@@ -228,14 +611,17 @@ class CollidingWorld(World):
         entities = {}
         for id_, e in d['entities'].items():
             entity = Collider.from_dict(e, id_, shapes, materials)
+            entity.handle = int(id_)
             entities[id_] = entity
+        set_ignored(entities, {id_: e.get('ignored', {})
+                               for id_, e in d['entities'].items()})
 
         springs = []
         for s in d['springs']:
             spring = Spring.from_dict(s, entities)
             springs.append(spring)
 
-        world = cls(gravity=Vec.from_dict(d['gravity']))
+        world = cls(gravity=Vec.from_dict(d['gravity']), **kwargs)
         world.add_ent(*entities.values())
         world.add_spring(*springs)
 
@@ -1,30 +1,102 @@
+import weakref
+
 from base import *
 
-__all__ = ['get_support', 'make_aabb',
-           'get_separation', 'collide', 'collide_point', 'collide_aabb',
-           'collide_all',
-           'get_intersector']
+__all__ = ['Shape',
+           'get_support', 'make_aabb',
+           'get_separation', 'collide', 'collide_reference',
+           'collide_point', 'collide_aabb',
+           'collide_segment', 'collide_segment_aabb', 'time_of_impact',
+           'collide_all', 'find_candidates', 'cull_pairs', 'can_collide',
+           'aabb_pairs',
+           'get_intersector', 'get_normals', 'get_contacts', 'clip_segment']
+
+
+class Shape:
+    """A convex polygon in local space with its properties precomputed.
+
+    Colliders with the same vertices share one `Shape` (see `Shape.of`),
+    so shapes must not be changed once made.
+
+    normals - the unit normal of each side, going from each vertex to
+        the next, in the same way as `get_separation` finds them.
+    centroid - the centre of area.
+    radius - the distance from (0, 0) to the furthest vertex.
+    """
+    _cache = weakref.WeakValueDictionary()
+
+    def __init__(self, vertices):
+        self.vertices = list(vertices)
+
+        self.normals = get_normals(self.vertices)
+
+        # Find the centre of area by summing triangles from (0, 0).
+        area = 0
+        centroid = Vec(0, 0)
+        for i in range(len(self.vertices)):
+            a = self.vertices[i]
+            b = self.vertices[(i + 1) % len(self.vertices)]
+            triangle = a.cross(b) / 2
+            area += triangle
+            centroid += (a + b) * (triangle / 3)
+
+        if area == 0:
+            centroid = sum(self.vertices, Vec(0, 0)) / len(self.vertices)
+        else:
+            centroid /= area
+        self.centroid = centroid
+
+        self.radius = max(abs(v) for v in self.vertices)
+
+    def __len__(self):
+        return len(self.vertices)
+
+    def __iter__(self):
+        return iter(self.vertices)
+
+    def __getitem__(self, i):
+        return self.vertices[i]
+
+    @classmethod
+    def of(cls, vertices):
+        """Return the shared `Shape` with these vertices."""
+        key = tuple(flatten(vertices))
+        shape = cls._cache.get(key)
+        if shape is None:
+            shape = cls(vertices)
+            cls._cache[key] = shape
+
+        return shape
 
 
 def get_support(n, poly):
-    return max(poly, key=lambda v: v.dot(n))
+    return poly[support_index(poly, n.x, n.y)]
+
 
+def get_separation(p1, p2, normals1=None):
+    """Find the side of `p1` that `p2` is furthest out of.
 
-def get_separation(p1, p2):
+    `normals1` can be the unit normals of `p1`'s sides, to save working
+    them out again.
+    """
     highest_d = float('-inf')
     normal = Vec(0, 0)
     vertex_index = 0
     for i in range(len(p1)):
-        # Find this edge.
-        j = (i + 1) % len(p1)
-        edge = p1[i] - p1[j]
-        n = Vec(x=-edge.y, y=edge.x)
-        n = n / abs(n)     # Normalise n.
+        if normals1 is None:
+            # Find this edge.
+            j = (i + 1) % len(p1)
+            edge = p1[i] - p1[j]
+            n = Vec(x=-edge.y, y=edge.x)
+            n = n / abs(n)     # Normalise n.
+        else:
+            n = normals1[i]
 
         # Find support point of p2 along -n.
-        s = get_support(-n, p2)
+        s = p2[support_index(p2, 0.0 - n.x, 0.0 - n.y)]
         # Find distance of support point from edge.
-        d = n.dot(s - p1[i])
+        v = p1[i]
+        d = n.x*(s.x - v.x) + n.y*(s.y - v.y)
 
         # Keep track of shallowest depth.
         if d > highest_d:
@@ -35,20 +107,43 @@ def get_separation(p1, p2):
     return highest_d, normal, vertex_index
 
 
-def collide(p1, p2):
-    separation_1, ref_normal_1, incident_index_1 = get_separation(p1, p2)
-    separation_2, ref_normal_2, incident_index_2 = get_separation(p2, p1)
+def collide(p1, p2, normals1=None, normals2=None):
+    separation, normal, _ = collide_reference(p1, p2, normals1, normals2)
+    return separation, normal
+
+
+def collide_reference(p1, p2, normals1=None, normals2=None):
+    """`collide`, also returning the reference side to clip contacts
+    against, as a `(flip, index)` tuple for `get_contacts`.  `flip` is
+    whether the side is one of `p2`'s rather than `p1`'s.
+    """
+    separation_1, ref_normal_1, incident_index_1 = get_separation(p1, p2, normals1)
+    separation_2, ref_normal_2, incident_index_2 = get_separation(p2, p1, normals2)
 
     # todo: introduce bias to this calculation
     if separation_1 > separation_2:
-        return separation_1, get_incident_normal(ref_normal_1, p1, incident_index_1)
+        return (separation_1,
+                get_incident_normal(ref_normal_1, p1, incident_index_1, normals1),
+                (False, incident_index_1))
     else:
         # Invert normal so that it always points away from p1 and
         # towards p2.
-        return separation_2, -get_incident_normal(ref_normal_2, p2, incident_index_2)
+        return (separation_2,
+                -get_incident_normal(ref_normal_2, p2, incident_index_2, normals2),
+                (True, incident_index_2))
+
 
+def get_incident_normal(ref_n, inc_p, inc_i, inc_normals=None):
+    if inc_normals is not None:
+        # The sides either side of vertex `inc_i`.
+        left_n = inc_normals[inc_i - 1]
+        right_n = inc_normals[inc_i]
+
+        if ref_n.dot(left_n) > ref_n.dot(right_n):
+            return left_n
+        else:
+            return right_n
 
-def get_incident_normal(ref_n, inc_p, inc_i):
     left_edge = inc_p[inc_i - 1] - inc_p[inc_i]  # Need not wrap the index here as Python does it automatically.
     right_edge = inc_p[inc_i] - inc_p[(inc_i + 1) % len(inc_p)]
 
@@ -64,10 +159,10 @@ def get_incident_normal(ref_n, inc_p, inc_i):
         return right_n
 
 
-def get_intersector(p1, p2, axis):
+def get_intersector(p1, p2, axis, normals1=None, normals2=None):
     intersecting_points = []
-    intersecting_points += [p for p in p1 if collide_point(p, p2) < 0]
-    intersecting_points += [p for p in p2 if collide_point(p, p1) < 0]
+    intersecting_points += [p for p in p1 if collide_point(p, p2, normals2) < 0]
+    intersecting_points += [p for p in p2 if collide_point(p, p1, normals1) < 0]
 
     if len(intersecting_points) == 0:
         return None
@@ -76,13 +171,118 @@ def get_intersector(p1, p2, axis):
     return sum(intersecting_points, Vec(0, 0)) / len(intersecting_points)
 
 
-def collide_point(s, p1):
+def get_normals(poly):
+    """Return the unit normal of each side of `poly`, going from each
+    vertex to the next.
+    """
+    normals = []
+    for i in range(len(poly)):
+        j = (i + 1) % len(poly)
+        side = poly[i] - poly[j]
+        n = Vec(x=-side.y, y=side.x)
+        normals.append(n / abs(n))
+
+    return normals
+
+
+def get_contacts(p1, p2, normals1=None, normals2=None, reference=None):
+    """Find where `p1` and `p2` touch by clipping.
+
+    The side of the polygon that the other is furthest out of is the
+    reference side.  The side of the other polygon facing it most is
+    clipped to the reference side's ends, and its ends that are behind
+    the reference side are the contact points.
+
+    Returns the collision normal, pointing from p1 towards p2, and a
+    list of up to two `(point, separation, feature)` tuples.  `feature`
+    identifies the sides and vertices that made each contact point.
+
+    `reference` can be the reference side from `collide_reference`, to
+    save finding it again.
+    """
+    if normals1 is None:
+        normals1 = get_normals(p1)
+    if normals2 is None:
+        normals2 = get_normals(p2)
+
+    if reference is None:
+        separation_1, _, index_1 = get_separation(p1, p2, normals1)
+        separation_2, _, index_2 = get_separation(p2, p1, normals2)
+        if separation_1 > separation_2:
+            reference = False, index_1
+        else:
+            reference = True, index_2
+
+    flip, ref_i = reference
+    if not flip:
+        ref, inc, inc_normals = p1, p2, normals2
+        n = normals1[ref_i]
+    else:
+        ref, inc, inc_normals = p2, p1, normals1
+        n = normals2[ref_i]
+
+    # Find the incident side: the one facing most against `n`.
+    inc_i = min(range(len(inc)), key=lambda k: inc_normals[k].dot(n))
+    points = [(inc[inc_i], 0), (inc[(inc_i + 1) % len(inc)], 1)]
+
+    # Clip it to the ends of the reference side.
+    r1 = ref[ref_i]
+    r2 = ref[(ref_i + 1) % len(ref)]
+    tangent = r2 - r1
+    tangent /= abs(tangent)
+
+    points = clip_segment(points, -tangent, -tangent.dot(r1), 2)
+    if len(points) < 2:
+        return n, []
+    points = clip_segment(points, tangent, tangent.dot(r2), 3)
+    if len(points) < 2:
+        return n, []
+
+    contacts = []
+    for point, k in points:
+        separation = n.dot(point - r1)
+        if separation <= 0:
+            contacts.append((point, separation, (flip, ref_i, inc_i, k)))
+
+    if flip:
+        n = -n
+
+    return n, contacts
+
+
+def clip_segment(points, n, offset, feature):
+    """Clip a segment to the side of a line where `n.dot(p) <= offset`.
+
+    `points` is a list of two `(point, feature)` tuples.  A point made
+    by clipping gets `feature` as its feature.
+    """
+    (a, feature_a), (b, feature_b) = points
+    distance_a = n.dot(a) - offset
+    distance_b = n.dot(b) - offset
+
+    clipped = []
+    if distance_a <= 0:
+        clipped.append((a, feature_a))
+    if distance_b <= 0:
+        clipped.append((b, feature_b))
+
+    if distance_a * distance_b < 0:
+        t = distance_a / (distance_a - distance_b)
+        clipped.append((a + (b - a) * t, feature))
+
+    return clipped
+
+
+def collide_point(s, p1, normals1=None):
     biggest_d = float('-inf')
     for i in range(len(p1)):
-        j = (i + 1) % len(p1)
-        side = p1[i] - p1[j]
-        n = Vec(x=-side.y, y=side.x)
-        n = n / abs(n)     # Normalise n.
+        if normals1 is None:
+            j = (i + 1) % len(p1)
+            side = p1[i] - p1[j]
+            n = Vec(x=-side.y, y=side.x)
+            n = n / abs(n)     # Normalise n.
+        else:
+            n = normals1[i]
 
         d = n.dot(s - p1[i])
 
@@ -92,32 +292,98 @@ def collide_point(s, p1):
     return biggest_d
 
 
-def collide_all(colliders):
-    polys = [c.get_vertices() for c in colliders]
-    boxes = [make_aabb(p) for p in polys]
+def collide_all(colliders, broad_phase=None):
+    """Find every pair of `colliders` that is in collision.
 
-    collisions = []
+    Returns `(o1, o2, separation, normal, reference)` tuples, where
+    `reference` is the side to clip contacts against (see
+    `collide_reference`).
 
-    for start in range(len(colliders) - 1):
-        head = polys[start]
-        tail = polys[start + 1:]
+    `broad_phase` picks the candidate pairs to run the full test on (see
+    the `broad_phase` module).  If it is `None` every pair of
+    overlapping bounding boxes is found by brute force.
+    """
+    polys, candidates = find_candidates(colliders, broad_phase)
 
-        for i, poly in enumerate(tail):
-            if not collide_aabb(boxes[start], boxes[start + 1 + i]):
-                continue
+    collisions = []
 
-            separation, axis = collide(head, poly)
-            if separation < 0.0:
-                collisions.append(
-                    (colliders[start],
-                     colliders[start + 1 + i],
-                     separation,
-                     axis)
-                )
+    for i, j in candidates:
+        separation, axis, reference = collide_reference(
+            polys[i], polys[j],
+            colliders[i].get_normals(), colliders[j].get_normals())
+        if separation < 0.0:
+            collisions.append(
+                (colliders[i],
+                 colliders[j],
+                 separation,
+                 axis,
+                 reference)
+            )
 
     return collisions
 
 
+def find_candidates(colliders, broad_phase=None):
+    """Return the vertices of each of `colliders` and the `(i, j)` pairs
+    of them whose bounding boxes overlap, that aren't both asleep or
+    both static, and that `can_collide`.
+    """
+    polys = [c.get_vertices() for c in colliders]
+    boxes = [c.get_aabb() for c in colliders]
+
+    if broad_phase is None:
+        candidates = cull_pairs(colliders, aabb_pairs(boxes))
+    else:
+        candidates = broad_phase.find_candidates(colliders, boxes)
+
+    return polys, candidates
+
+
+def cull_pairs(colliders, pairs):
+    """Return the `(i, j)` `pairs` of `colliders` that aren't both asleep
+    or both static, and that `can_collide`.
+    """
+    # Sleeping colliders can't have moved into each other, and nor can
+    # static ones.
+    inf = float('inf')
+    return [(i, j) for i, j in pairs
+            if (colliders[i].awake or colliders[j].awake)
+            and (colliders[i].mass != inf or colliders[j].mass != inf)
+            and can_collide(colliders[i], colliders[j])]
+
+
+def can_collide(c1, c2):
+    """Return whether the collision filters of `c1` and `c2` let them
+    collide.
+
+    Colliders never collide with ones they ignore or, in worlds that
+    ignore springs, are joined to by a spring.  Otherwise, ones in
+    the same non-zero group always collide if it is positive and never
+    do if it is negative.  Otherwise, each one's category must be in
+    the other's mask.
+    """
+    if c2 in c1.ignored or c2 in c1.joined:
+        return False
+
+    group = c1.group
+    if group != 0 and group == c2.group:
+        return group > 0
+
+    return bool(c1.category & c2.mask) and bool(c2.category & c1.mask)
+
+
+def aabb_pairs(boxes):
+    """Yield every `(i, j)` with `i < j` where `boxes[i]` and `boxes[j]`
+    overlap, by testing every pair.
+    """
+    for start in range(len(boxes) - 1):
+        head = boxes[start]
+
+        for i in range(start + 1, len(boxes)):
+            if collide_aabb(head, boxes[i]):
+                yield start, i
+
+
 def make_aabb(polygon):
     # print(polygon)
     x1 = float('inf')  # left
@@ -140,4 +406,111 @@ def make_aabb(polygon):
 
 
 def collide_aabb(a, b):
-    return not (a[0] > b[2] or a[1] > b[3] or b[0] > a[2] or b[1] > a[3])
\ No newline at end of file
+    return not (a[0] > b[2] or a[1] > b[3] or b[0] > a[2] or b[1] > a[3])
+
+
+def collide_segment(start, end, p1):
+    """Find where the segment from `start` to `end` first enters `p1`.
+
+    Returns the fraction of the way along the segment, or `None` if it
+    misses.  A segment starting inside `p1` hits it at 0.
+    """
+    direction = end - start
+    t_enter = 0.0
+    t_exit = 1.0
+
+    for i in range(len(p1)):
+        j = (i + 1) % len(p1)
+        side = p1[i] - p1[j]
+        n = Vec(x=-side.y, y=side.x)
+
+        num = n.dot(p1[i] - start)
+        den = n.dot(direction)
+
+        if den == 0:
+            # Parallel to this side, so it misses if it's outside.
+            if num < 0:
+                return None
+        elif den < 0:
+            t_enter = max(t_enter, num / den)
+        else:
+            t_exit = min(t_exit, num / den)
+
+        if t_enter > t_exit:
+            return None
+
+    return t_enter
+
+
+def collide_segment_aabb(start, end, box):
+    """Check whether the segment from `start` to `end` touches `box`."""
+    t_enter = 0.0
+    t_exit = 1.0
+
+    for s, e, low, high in ((start.x, end.x, box[0], box[2]),
+                            (start.y, end.y, box[1], box[3])):
+        d = e - s
+        if d == 0:
+            if s < low or s > high:
+                return False
+            continue
+
+        t1 = (low - s) / d
+        t2 = (high - s) / d
+        if t1 > t2:
+            t1, t2 = t2, t1
+
+        t_enter = max(t_enter, t1)
+        t_exit = min(t_exit, t2)
+        if t_enter > t_exit:
+            return False
+
+    return True
+
+
+def time_of_impact(shape, start, end, other, other_normals=None,
+                   tolerance=0.5, iterations=20):
+    """Find when the `Shape` `shape`, moving from the `Transform` `start`
+    to `end`, first comes within `tolerance` of the polygon `other`.
+
+    Uses conservative advancement: the shape is moved on by as much of
+    the step as the gap to `other` allows, assuming no point on it moves
+    faster than its centre plus its spin times its radius, until the gap
+    is small enough.  As the pose is blended, a shape can be found to
+    hit `other` even though it is past it at `end`.
+
+    Returns `(fraction, separation, normal)`, where `fraction` is how
+    far from `start` to `end` the shape is stopped and `normal` points
+    from it to `other`, or `None` if it never gets close enough.
+    """
+    dx = end.x - start.x
+    dy = end.y - start.y
+    angle = start.rotation.angle
+    turn = end.rotation.angle - angle
+    bound = (dx*dx + dy*dy) ** 0.5 + abs(turn) * shape.radius
+
+    t = 0.0
+    for _ in range(iterations):
+        rotation = Rotation(angle + turn*t)
+        transform = Transform(Vec(start.x + dx*t, start.y + dy*t), rotation)
+        vertices = transform.apply_all(shape.vertices)
+        normals = rotate_all(shape.normals, rotation)
+
+        d1, n1, _ = get_separation(vertices, other, normals)
+        d2, n2, _ = get_separation(other, vertices, other_normals)
+        if d1 > d2:
+            separation, normal = d1, n1
+        else:
+            separation, normal = d2, -n2
+
+        if separation <= tolerance:
+            return t, separation, normal
+        if bound == 0:
+            return None
+
+        # Aim for the middle of the tolerance so it is not overshot.
+        t += (separation - tolerance/2) / bound
+        if t > 1:
+            return None
+
+    return None
@@ -0,0 +1,143 @@
+"""Islands and sleeping bodies
+This module groups bodies that touch or are joined by springs into
+islands, and puts whole islands to sleep once all their bodies have been
+resting for a while.  Sleeping bodies are skipped by the world until an
+awake body touches them or pulls on them with a spring.
+
+Static bodies (with infinite mass) never join islands, as nothing they
+touch can move them; otherwise the floor would join every pile into
+one island.
+"""
+
+from base import *
+
+__all__ = ['UnionFind', 'find_islands', 'IslandSleeper']
+
+
+def is_static(ent):
+    return ent.mass == float('inf')
+
+
+class UnionFind:
+    """Disjoint sets of hashable items."""
+    def __init__(self, items=()):
+        self.parent = {item: item for item in items}
+
+    def add(self, item):
+        self.parent.setdefault(item, item)
+
+    def find(self, item):
+        parent = self.parent
+        while parent[item] is not item:
+            # Path halving keeps the trees shallow.
+            parent[item] = parent[parent[item]]
+            item = parent[item]
+
+        return item
+
+    def union(self, a, b):
+        root_a = self.find(a)
+        root_b = self.find(b)
+        if root_a is not root_b:
+            self.parent[root_b] = root_a
+
+    def groups(self):
+        """Return a list of the sets, each as a list."""
+        groups = {}
+        for item in self.parent:
+            groups.setdefault(self.find(item), []).append(item)
+
+        return list(groups.values())
+
+
+def find_islands(entities, pairs):
+    """Group `entities` joined by `pairs` of entities into islands.
+
+    Static entities are left out, as are pairs with an end that is not
+    in `entities`.
+    """
+    sets = UnionFind(e for e in entities if not is_static(e))
+    for a, b in pairs:
+        if a in sets.parent and b in sets.parent:
+            sets.union(a, b)
+
+    return sets.groups()
+
+
+class IslandSleeper:
+    """Put islands to sleep once every body in them has been resting for
+    `time_to_sleep` seconds.
+
+    linear_threshold - the speed below which a body is resting.
+    angular_threshold - the angular speed below which a body is resting.
+
+    awake - the number of dynamic bodies awake after the last update.
+    islands - the awake islands found in the last update.
+    """
+    def __init__(self, linear_threshold=5.0, angular_threshold=0.05,
+                 time_to_sleep=0.5):
+        self.linear_threshold = linear_threshold
+        self.angular_threshold = angular_threshold
+        self.time_to_sleep = time_to_sleep
+
+        self.awake = 0
+        self.islands = []
+
+    def wake(self, ent):
+        """Wake `ent` and the rest of the island it fell asleep with."""
+        if ent.awake or is_static(ent):
+            return
+
+        for member in ent.sleep_island:
+            member.awake = True
+            member.sleep_time = 0.0
+            member.sleep_island = None
+
+    def wake_touching(self, pairs):
+        """Wake sleeping bodies in `pairs` with an awake dynamic body."""
+        for a, b in pairs:
+            if a.awake and not b.awake and not is_static(a):
+                self.wake(b)
+            elif b.awake and not a.awake and not is_static(b):
+                self.wake(a)
+
+    def sleep(self, island):
+        for ent in island:
+            ent.awake = False
+            ent.sleep_island = island
+
+            ent.vel = Vec(0, 0)
+            ent.new_vel = ent.vel
+            ent.acc = Vec(0, 0)
+            ent.new_acc = Vec(0, 0)
+            ent.ang_vel = ent.new_ang_vel = 0
+            ent.ang_acc = ent.new_ang_acc = 0
+
+    def update(self, entities, pairs, dt):
+        """Update sleep timers after a step and put resting islands to
+        sleep.
+
+        `pairs` are the pairs of entities touching or joined by springs.
+        """
+        awake = []
+        for ent in entities:
+            if is_static(ent):
+                # Static bodies never move, so they need no updates.
+                ent.awake = False
+            elif ent.awake:
+                awake.append(ent)
+
+        self.islands = find_islands(awake, pairs)
+        self.awake = len(awake)
+
+        for island in self.islands:
+            for ent in island:
+                if (abs(ent.vel) > self.linear_threshold
+                        or abs(ent.ang_vel) > self.angular_threshold):
+                    ent.sleep_time = 0.0
+                else:
+                    ent.sleep_time += dt
+
+            if min(ent.sleep_time for ent in island) >= self.time_to_sleep:
+                self.sleep(island)
+                self.awake -= len(island)
@@ -15,6 +15,9 @@ from base import *
 from phys import *
 from collision import *
 from colliding_world import *
+from broad_phase import *
+from stepper import FixedStepper
+from renderer import BatchRenderer
 import gui
 import load_system
 
@@ -35,9 +38,6 @@ class DrawCollider(Collider):
 
         self.colour = colour
 
-    def get_vertices(self):
-        return [vertex.rotate(self.ang) + self.pos for vertex in self.vertices]
-
 
 class Triangle(DrawCollider):
     vertices = [
@@ -62,6 +62,8 @@ class Triangle(DrawCollider):
         vertices = [v * scale for v in Triangle.vertices]
 
         super().__init__(pos, mass, ang, moi, vertices, colour)
+        # Triangles are light enough to be knocked through the walls.
+        self.bullet = True
 
 
 class Hexagon(DrawCollider):
@@ -98,65 +100,47 @@ class FrozenEntity(DrawCollider):
         self.vertices = vertices
         self.colour = colour
 
-    def get_vertices(self):
-        return [vertex + self.pos for vertex in self.vertices]
+
+def frozen_tiles(pos, x1, y1, x2, y2, width=1000, colour=(255, 255, 255)):
+    """Return `FrozenEntity` boxes covering (x1, y1) to (x2, y2) from
+    `pos`, split into tiles at most `width` wide so that each has a
+    small bounding box.
+    """
+    tiles = []
+    while x1 < x2:
+        end = min(x1 + width, x2)
+        tiles.append(FrozenEntity(pos=pos,
+                                  vertices=[Vec(x=x1, y=y1),
+                                            Vec(x=end, y=y1),
+                                            Vec(x=end, y=y2),
+                                            Vec(x=x1, y=y2)],
+                                  colour=colour))
+        x1 = end
+
+    return tiles
 
 
 class DrawableWorld(CollidingWorld):
-    def __init__(self, gravity=Vec(0.0, 0.0)):
-        super().__init__()
+    def __init__(self, gravity=Vec(0.0, 0.0), broad_phase=None):
+        super().__init__(broad_phase=broad_phase)
 
         self.draw_impulses = True
+        self.renderer = None  # Made when first drawn, once GL is ready.
 
-    def draw(self):
+    def draw(self, stepper=None):
         try:
-            self.draw_()
+            self.draw_(stepper)
         except Exception as e:
             print(e)
             assert False
             input()
 
-    def draw_(self):
-        # Draw springs.
-        for s in self.springs:
-            if s.slack:
-                colour = (0, 0, 255)
-            else:
-                colour = (0, 255, 0)
-
-            pyglet.graphics.draw(2, pyglet.gl.GL_LINES,
-                ('v2f', tuple(s.get_end1_join_pos() + s.end1.pos)
-                      + tuple(s.get_end2_join_pos() + s.end2.pos)
-                ),
-                ('c3B', colour * 2)
-            )
-
-        # Draw polygons.
-        for obj in self.entities:
-            verts = obj.get_vertices()
-            n_verts = len(verts)
-
-            if hasattr(obj, 'colour'):
-                colour = obj.colour
-            else:
-                colour = (255, 255, 255)
-
-            pyglet.graphics.draw(n_verts, pyglet.gl.GL_POLYGON,
-                    ('v2f', tuple(flatten(verts))),
-                    ('c3B', colour[:3] * n_verts)
-            )
-
-
-            if False:
-                aabb = make_aabb(verts)
-                vl = pyglet.graphics.vertex_list(4, ('v2f', (aabb[0], aabb[1],
-                                                             aabb[2], aabb[1],
-                                                             aabb[2], aabb[3],
-                                                             aabb[0], aabb[3],
-                                                             )),
-                                                 ('c3B', (127, 255, 255) * 4)
-                                                 )
-                vl.draw(pyglet.gl.GL_LINE_LOOP)
+    def draw_(self, stepper=None):
+        # Draw springs and polygons, at the poses blended between steps
+        # if there is a stepper.
+        if self.renderer is None:
+            self.renderer = BatchRenderer()
+        self.renderer.draw(self, stepper)
 
         # Draw impulses.
         imp_verts = []
@@ -217,6 +201,10 @@ class LabeledButton:
 
 
 class Window(pyglet.window.Window):
+    # Frames drawn per second.  Without vsync, drawing on every tick of
+    # the clock would spin the CPU for frames that are never seen.
+    RENDER_RATE = 120
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.time = 0
@@ -241,7 +229,7 @@ class Window(pyglet.window.Window):
             font_size=50,
         )
 
-        self.phys_world = DrawableWorld()
+        self.phys_world = DrawableWorld(broad_phase=StaticIndex(DynamicTree()))
         self.phys_world.gravity.y = -100
         self.phys_world.add_ent(
             Hexagon(
@@ -257,12 +245,8 @@ class Window(pyglet.window.Window):
                 material=test_material,
                 colour=(255, 127, 127),
             ),
-            FrozenEntity(pos=Vec(450, 50),
-                   vertices=[Vec(x=-9000., y=-75.),
-                             Vec(x= 9000., y=-75.),
-                             Vec(x= 9000., y= 25.),
-                             Vec(x=-9000., y= 25.),
-                             ]),
+            *frozen_tiles(pos=Vec(450, 50),
+                          x1=-9000., y1=-75., x2=9000., y2=25.),
             FrozenEntity(pos=Vec(0, 0),
                    vertices=[Vec(x=-10., y=0.),
                              Vec(x= 10., y=0.),
@@ -296,28 +280,29 @@ class Window(pyglet.window.Window):
                    end2_join_pos=Vec(50, 87))
         )
 
-        pyglet.clock.schedule_interval(self.periodic_update, 1/30)
-        #pyglet.clock.schedule(self.periodic_update)
 
         print(self.phys_world.serialise())
         #x = input()
         d = json.loads('''
-{"springs": [{"stiffness": 10000, "slack_length": 0, "end1": "93982084042720", "end2": "93982084042776"}], "entities": {"93982084042720": {"mass": 8660.254037844386, "moi": 54126587.73652741, "pos": {"x": 500, "y": 500}, "vel": {"x": 0.0, "y": 0.0}, "acc": {"x": 0.0, "y": 0.0}, "ang": -1, "ang_vel": 0, "ang_acc": 0, "material": "93982085918632", "shape": "93982077865112"}, "93982084042776": {"mass": 8660.254037844386, "moi": 54126587.73652741, "pos": {"x": 250, "y": 250}, "vel": {"x": 0.0, "y": 0.0}, "acc": {"x": 0.0, "y": 0.0}, "ang": -1, "ang_vel": 0, "ang_acc": 0, "material": "93982085918632", "shape": "93982077865136"}, "93982084042832": {"mass": Infinity, "moi": Infinity, "pos": {"x": 450, "y": 50}, "vel": {"x": 0.0, "y": 0.0}, "acc": {"x": 0.0, "y": 0.0}, "ang": 0, "ang_vel": 0, "ang_acc": 0, "material": "93982085918632", "shape": "93982077865160"}, "93982084042888": {"mass": Infinity, "moi": Infinity, "pos": {"x": 0, "y": 0}, "vel": {"x": 0.0, "y": 0.0}, "acc": {"x": 0.0, "y": 0.0}, "ang": 0, "ang_vel": 0, "ang_acc": 0, "material": "93982085918632", "shape": "93982077865184"}, "93982084042944": {"mass": Infinity, "moi": Infinity, "pos": {"x": 0, "y": 0}, "vel": {"x": 0.0, "y": 0.0}, "acc": {"x": 0.0, "y": 0.0}, "ang": 0, "ang_vel": 0, "ang_acc": 0, "material": "93982085918632", "shape": "93982077865208"}}, "gravity": {"x": 0, "y": -100}, "shapes": {"93982077865112": [{"x": 100.0, "y": 0.0}, {"x": 50.0, "y": 87.0}, {"x": -50.0, "y": 87.0}, {"x": -100.0, "y": 0.0}, {"x": -50.0, "y": -87.0}, {"x": 50.0, "y": -87.0}], "93982077865136": [{"x": 100.0, "y": 0.0}, {"x": 50.0, "y": 87.0}, {"x": -50.0, "y": 87.0}, {"x": -100.0, "y": 0.0}, {"x": -50.0, "y": -87.0}, {"x": 50.0, "y": -87.0}], "93982077865160": [{"x": -9000.0, "y": -75.0}, {"x": 9000.0, "y": -75.0}, {"x": 9000.0, "y": 25.0}, {"x": -9000.0, "y": 25.0}], "93982077865184": [{"x": -10.0, "y": 0.0}, {"x": 10.0, "y": 0.0}, {"x": 10.0, "y": 1000.0}, {"x": -10.0, "y": 1000.0}], "93982077865208": [{"x": 840.0, "y": 0.0}, {"x": 860.0, "y": 0.0}, {"x": 860.0, "y": 1000.0}, {"x": 840.0, "y": 1000.0}]}, "materials": {"93982085918632": {"static_friction": 0.4, "dynamic_friction": 0.2, "restitution": 0.2, "density": 1}}}
+{"springs": [{"stiffness": 10000, "slack_length": 0, "end1": "93982084042720", "end2": "93982084042776"}], "entities": {"93982084042720": {"mass": 8660.254037844386, "moi": 54126587.73652741, "pos": {"x": 500, "y": 500}, "vel": {"x": 0.0, "y": 0.0}, "acc": {"x": 0.0, "y": 0.0}, "ang": -1, "ang_vel": 0, "ang_acc": 0, "material": "93982085918632", "shape": "93982077865112"}, "93982084042776": {"mass": 8660.254037844386, "moi": 54126587.73652741, "pos": {"x": 250, "y": 250}, "vel": {"x": 0.0, "y": 0.0}, "acc": {"x": 0.0, "y": 0.0}, "ang": -1, "ang_vel": 0, "ang_acc": 0, "material": "93982085918632", "shape": "93982077865136"}, "93982084042888": {"mass": Infinity, "moi": Infinity, "pos": {"x": 0, "y": 0}, "vel": {"x": 0.0, "y": 0.0}, "acc": {"x": 0.0, "y": 0.0}, "ang": 0, "ang_vel": 0, "ang_acc": 0, "material": "93982085918632", "shape": "93982077865184"}, "93982084042944": {"mass": Infinity, "moi": Infinity, "pos": {"x": 0, "y": 0}, "vel": {"x": 0.0, "y": 0.0}, "acc": {"x": 0.0, "y": 0.0}, "ang": 0, "ang_vel": 0, "ang_acc": 0, "material": "93982085918632", "shape": "93982077865208"}}, "gravity": {"x": 0, "y": -100}, "shapes": {"93982077865112": [{"x": 100.0, "y": 0.0}, {"x": 50.0, "y": 87.0}, {"x": -50.0, "y": 87.0}, {"x": -100.0, "y": 0.0}, {"x": -50.0, "y": -87.0}, {"x": 50.0, "y": -87.0}], "93982077865136": [{"x": 100.0, "y": 0.0}, {"x": 50.0, "y": 87.0}, {"x": -50.0, "y": 87.0}, {"x": -100.0, "y": 0.0}, {"x": -50.0, "y": -87.0}, {"x": 50.0, "y": -87.0}], "93982077865184": [{"x": -10.0, "y": 0.0}, {"x": 10.0, "y": 0.0}, {"x": 10.0, "y": 1000.0}, {"x": -10.0, "y": 1000.0}], "93982077865208": [{"x": 840.0, "y": 0.0}, {"x": 860.0, "y": 0.0}, {"x": 860.0, "y": 1000.0}, {"x": 840.0, "y": 1000.0}]}, "materials": {"93982085918632": {"static_friction": 0.4, "dynamic_friction": 0.2, "restitution": 0.2, "density": 1}}}
 ''')
         print(d['shapes'])
-        self.phys_world = DrawableWorld.from_dict(d)
+        self.phys_world = DrawableWorld.from_dict(
+            d, broad_phase=StaticIndex(DynamicTree()))
+        self.phys_world.add_ent(
+            *frozen_tiles(pos=Vec(450, 50),
+                          x1=-9000., y1=-75., x2=9000., y2=25.))
         print(self.phys_world.entities[0].pos)
 
-    def periodic_update(self, dt):
-        print(f'{1/dt} fps' if dt > 0 else '', end='\n')
+        # Step the physics at a fixed rate, however fast frames are drawn.
+        self.stepper = FixedStepper(self.phys_world, dt=1/60, max_steps=4)
+        pyglet.clock.schedule_interval(self.periodic_update,
+                                       1 / self.RENDER_RATE)
 
+    def periodic_update(self, dt):
         if self.state == EditorState.PLAY:
-            dt = 1 / 30
-            self.time += dt
-
-            steps = 1
-            for _ in range(steps):
-                self.phys_world.update(dt / steps)
+            steps = self.stepper.advance(dt)
+            self.time += steps * self.stepper.dt
 
         elif self.state == EditorState.EDIT:
             pass
@@ -329,6 +314,9 @@ class Window(pyglet.window.Window):
                 self.state = EditorState.PLAY
             elif self.label_pause.check_click(x, y) and self.state == EditorState.PLAY:
                 self.state = EditorState.EDIT
+                # Draw everything where it stopped, not blended towards
+                # a step that will not come.
+                self.stepper.reset()
 
             # If clicked on no button, add shape:
             else:
@@ -343,37 +331,34 @@ class Window(pyglet.window.Window):
                 )
 
         elif button == mouse.RIGHT:
-            for ent in self.phys_world.entities:
-                if 0 > collide_point(Vec(x, y), ent.get_vertices()):
-                    end2_join_pos = (Vec(x, y) - ent.pos).rotate(-ent.ang)
-
-                    if self.selection_for_spring is None:
-                        self.selection_for_spring = (ent, end2_join_pos)
-
-                    elif self.selection_for_spring[0] is not ent:
-                        self.phys_world.add_spring(
-                            Spring(stiffness=self.attributes_for_spring[0],
-                                   slack_length=self.attributes_for_spring[1],
-                                   end1=self.selection_for_spring[0],
-                                   end2=ent,
-                                   end1_join_pos=self.selection_for_spring[1],
-                                   end2_join_pos=end2_join_pos,
-                                   )
-                        )
-
-                        self.selection_for_spring = None
+            for ent in self.phys_world.query_point(Vec(x, y)):
+                end2_join_pos = ent.get_transform().apply_inverse(Vec(x, y))
+
+                if self.selection_for_spring is None:
+                    self.selection_for_spring = (ent, end2_join_pos)
+
+                elif self.selection_for_spring[0] is not ent:
+                    self.phys_world.add_spring(
+                        Spring(stiffness=self.attributes_for_spring[0],
+                               slack_length=self.attributes_for_spring[1],
+                               end1=self.selection_for_spring[0],
+                               end2=ent,
+                               end1_join_pos=self.selection_for_spring[1],
+                               end2_join_pos=end2_join_pos,
+                               )
+                    )
 
-        elif button == mouse.MIDDLE:
-            for ent in self.phys_world.entities:
-                if 0 > collide_point(Vec(x, y), ent.get_vertices()):
-                    # print('Removed', ent)
-                    self.phys_world.remove_ent(ent)
+                    self.selection_for_spring = None
 
-                    if self.selection_for_spring is not None and self.selection_for_spring[0] is ent:
-                        self.selection_for_spring = None
+        elif button == mouse.MIDDLE:
+            for ent in self.phys_world.query_point(Vec(x, y)):
+                # print('Removed', ent)
+                # This also removes the springs attached to it.
+                self.phys_world.remove_ent(ent)
+                self.stepper.reset(ent)
 
-                    self.phys_world.springs = [s for s in self.phys_world.springs
-                                               if s.end1 is not ent and s.end2 is not ent]
+                if self.selection_for_spring is not None and self.selection_for_spring[0] is ent:
+                    self.selection_for_spring = None
 
     def on_key_press(self, symbol, modifiers):
         if symbol == key.G:
@@ -412,7 +397,7 @@ class Window(pyglet.window.Window):
 
     def on_draw_(self):
         self.clear()
-        DrawableWorld.draw(self.phys_world)
+        DrawableWorld.draw(self.phys_world, self.stepper)
 
         if self.state == EditorState.EDIT:
             self.label_play.draw()
@@ -423,10 +408,4 @@ class Window(pyglet.window.Window):
 
 if __name__ == '__main__':
     window = Window(resizable=True, vsync=False, width=1000, height=1000)
-
-    import cProfile
-    cProfile.run('[window.phys_world.update(1/120) for _ in range(1000)]')
-    # input()
-
-    # cProfile.run('pyglet.app.run()')
     pyglet.app.run()
@@ -1,6 +1,7 @@
 """Classes and functions for emulating 2D physics"""
 
 from base import *
+from profiling import Profiler
 
 import json
 
@@ -30,6 +31,66 @@ class Entity:
         self.new_ang_acc = self.ang_acc
         self.moi = moi  # Moment of inertia
 
+        # Sleeping entities are skipped by worlds with a sleeper.
+        self.awake = True
+        self.sleep_time = 0.0
+        self.sleep_island = None
+
+        # Given by the world the entity is added to.
+        self.handle = None
+        # Goes up when the pose changes (see `get_pose_version`).
+        self.pose_version = 0
+
+    def get_defaults(self):
+        """Return the attributes added since entities were first saved,
+        with their starting values.
+        """
+        return {'awake': True, 'sleep_time': 0.0, 'sleep_island': None,
+                'handle': None, 'pose_version': 0}
+
+    def __setstate__(self, state):
+        # Entities pickled by older versions lack newer attributes.
+        self.__dict__.update(self.get_defaults())
+        self.__dict__.update(state)
+        # And may lack some of the caches kept for the pose, so make
+        # them again.
+        self.__dict__.pop('_pose', None)
+
+    def get_pose_version(self):
+        """Return a counter that goes up whenever `pos` or `ang` change.
+
+        The rotation and transform, and the world-space shapes of
+        colliders, are cached against it, so they are only made again
+        once per step by `update_move` and `update_turn`, or when the
+        entity is moved by hand.
+        """
+        pose = (self.pos.x, self.pos.y, self.ang)
+        old = getattr(self, '_pose', None)
+        if old != pose:
+            if old is None or old[2] != self.ang:
+                self._rotation = Rotation(self.ang)
+            self._transform = Transform(self.pos, self._rotation)
+            self._pose = pose
+            self.pose_version += 1
+
+        return self.pose_version
+
+    def get_rotation(self):
+        """Return a `Rotation` by `ang`.
+
+        It is kept while only `pos` changes, so it is shared between
+        calls in the same step.
+        """
+        self.get_pose_version()
+        return self._rotation
+
+    def get_transform(self):
+        """Return the `Transform` from space relative to the entity into
+        world space.
+        """
+        self.get_pose_version()
+        return self._transform
+
     def to_dict(self):
         return {'mass': self.mass,
                 'moi': self.moi,
@@ -63,50 +124,204 @@ class PhysSerialiser(json.JSONEncoder):
 
 
 class World:
-    """A world to hold and simulate interaction of `Entity`s."""
-    def __init__(self, gravity=Vec(0, 0)):
+    """A world to hold and simulate interaction of `Entity`s.
+
+    body_store - if given, a `body_store.BodyStore` to keep the
+        entities' state in, so they are integrated all at once.
+    sleeper - if given, an `islands.IslandSleeper` to put resting
+        entities to sleep so they are skipped until disturbed.
+    spring_set - if given, a `spring_set.SpringSet` to keep the springs'
+        constants in, so their forces are worked out all at once.
+    profiler - the `profiling.Profiler` recording each step, if
+        profiling was started with `start_profiling`.
+
+    Each entity and spring added is given a `handle`, an integer unique
+    within the world that stays the same when it is saved and loaded.
+    Removing them swaps the last one into their place, so the order of
+    `entities` and `springs` is not kept.
+    """
+    # The methods `update` calls, timed separately when profiling.
+    profile_phases = ['wake_springs', 'damp', 'update_spring',
+                      'update_turn', 'update_move', 'update_sleep']
+
+    def __init__(self, gravity=Vec(0, 0), body_store=None, sleeper=None,
+                 spring_set=None):
         self.entities = []
         self.springs = []
+        self.entity_indices = {}  # Handle -> index into `entities`
+        self.spring_indices = {}  # Handle -> index into `springs`
+        self.attached = {}  # Entity handle -> {spring handle: Spring}
+        self.next_handle = 0
         self.gravity = gravity
+        self.body_store = body_store
+        self.sleeper = sleeper
+        self.spring_set = spring_set
+        self.profiler = None
+
+    def new_handle(self, obj):
+        """Return the handle to give `obj`, keeping the one it has if
+        it is not taken by another entity or spring.
+        """
+        handle = getattr(obj, 'handle', None)
+        if handle is None or handle in self.entity_indices \
+                or handle in self.spring_indices:
+            handle = self.next_handle
+        self.next_handle = max(self.next_handle, handle + 1)
+
+        return handle
+
+    @staticmethod
+    def swap_remove(items, indices, obj):
+        """Remove `obj` from `items` by moving the last item into its
+        place.
+        """
+        index = indices.get(obj.handle)
+        if index is None or items[index] is not obj:
+            raise ValueError(f"{obj} is not in the world")
+
+        last = items.pop()
+        if last is not obj:
+            items[index] = last
+            indices[last.handle] = index
+        del indices[obj.handle]
 
     def add_ent(self, *entities):
         for ent in entities:
             if not isinstance(ent, Entity):
                 raise TypeError(f"{ent} is not an Entity")
+            if self.get_ent(getattr(ent, 'handle', None)) is ent:
+                raise ValueError(f"{ent} is already in the world")
 
+            ent.handle = self.new_handle(ent)
+            self.entity_indices[ent.handle] = len(self.entities)
             self.entities.append(ent)
+            self.attached[ent.handle] = {}
+            if self.body_store is not None:
+                self.body_store.attach(ent)
 
     def remove_ent(self, *entities):
+        """Remove `entities` and the springs attached to them."""
         for ent in entities:
-            self.entities.remove(ent)
+            # Whatever was resting on it or hanging from it must fall.
+            self.wake(ent)
+            for spring in self.attached.get(ent.handle, {}).values():
+                self.wake(spring.end1)
+                self.wake(spring.end2)
+
+            self.swap_remove(self.entities, self.entity_indices, ent)
+            self.remove_spring(*self.attached.pop(ent.handle).values())
+            if self.body_store is not None:
+                self.body_store.detach(ent)
 
     def add_spring(self, *springs):
         for spring in springs:
             if not isinstance(spring, Spring):
                 raise TypeError(f"{spring} is not a Spring")
+            if self.get_spring(getattr(spring, 'handle', None)) is spring:
+                raise ValueError(f"{spring} is already in the world")
 
+            spring.handle = self.new_handle(spring)
+            self.spring_indices[spring.handle] = len(self.springs)
             self.springs.append(spring)
+            for end in (spring.end1, spring.end2):
+                if end.handle in self.attached:
+                    self.attached[end.handle][spring.handle] = spring
+            if self.spring_set is not None:
+                self.spring_set.attach(spring)
 
     def remove_spring(self, *springs):
         for spring in springs:
-            self.springs.remove(spring)
+            self.swap_remove(self.springs, self.spring_indices, spring)
+            for end in (spring.end1, spring.end2):
+                self.attached.get(end.handle, {}).pop(spring.handle, None)
+            if self.spring_set is not None:
+                self.spring_set.detach(spring)
+
+    def get_ent(self, handle):
+        """Return the entity with `handle`, or `None`."""
+        index = self.entity_indices.get(handle)
+        return None if index is None else self.entities[index]
+
+    def get_spring(self, handle):
+        """Return the spring with `handle`, or `None`."""
+        index = self.spring_indices.get(handle)
+        return None if index is None else self.springs[index]
+
+    def get_springs(self, ent):
+        """Return the springs attached to `ent`."""
+        return list(self.attached.get(ent.handle, {}).values())
 
     def update(self, dt):
+        self.wake_springs()
         self.damp(dt)
         self.update_spring(dt)
         self.update_turn(dt)
         self.update_move(dt)
+        self.update_sleep(dt)
+
+    def start_profiling(self, frames=120):
+        """Start recording how long each phase of the last `frames`
+        steps took, and return the `profiling.Profiler`.
+        """
+        self.stop_profiling()
+        self.profiler = Profiler(frames)
+        self.profiler.attach(self)
+        return self.profiler
+
+    def stop_profiling(self):
+        if self.profiler is not None:
+            self.profiler.detach()
+            self.profiler = None
+
+    def wake(self, ent):
+        """Wake `ent` and everything asleep with it."""
+        if self.sleeper is not None:
+            self.sleeper.wake(ent)
+
+    def wake_springs(self):
+        """Wake sleeping entities pulled by a spring from an awake one."""
+        if self.sleeper is not None:
+            self.sleeper.wake_touching((s.end1, s.end2) for s in self.springs)
+
+    def update_sleep(self, dt, pairs=()):
+        if self.sleeper is not None:
+            pairs = list(pairs) + [(s.end1, s.end2) for s in self.springs]
+            self.sleeper.update(self.entities, pairs, dt)
+
+    def get_awake(self):
+        """Return the entities that need updating."""
+        if self.sleeper is None:
+            return self.entities
+
+        return [ent for ent in self.entities if ent.awake]
+
+    def count_awake(self):
+        """Return the number of awake entities that can move."""
+        return sum(1 for ent in self.entities
+                   if ent.awake and ent.mass != float('inf'))
 
     def damp(self, dt):
-        for ent in self.entities:
+        if self.body_store is not None:
+            self.body_store.damp(dt)
+            return
+
+        for ent in self.get_awake():
             ent.new_vel -= ent.vel * 0.1 * dt
             ent.ang_vel -= ent.ang_vel * 0.1 * dt
 
     def update_spring(self, dt):
+        if self.spring_set is not None:
+            self.spring_set.update(self, dt)
+            return
+
         # Calculate spring forces and apply them.
         for spring in self.springs:
-            length = spring.end2.pos + spring.get_end2_join_pos() \
-                     - spring.end1.pos - spring.get_end1_join_pos()
+            if not (spring.end1.awake or spring.end2.awake):
+                continue
+
+            join1 = spring.get_end1_join_pos()
+            join2 = spring.get_end2_join_pos()
+            length = spring.end2.pos + join2 - spring.end1.pos - join1
 
             # Skip this string if it's sack.
             abs_length = abs(length)
@@ -125,15 +340,19 @@ class World:
             spring.end2.new_acc -= force / spring.end2.mass
 
             # Compute torque for end1.
-            torque1 = spring.get_end1_join_pos().cross(force) 
+            torque1 = join1.cross(force)
             spring.end1.new_ang_acc += torque1 / spring.end1.moi
 
             # .. for end2.
-            torque2 = spring.get_end2_join_pos().cross(force)
+            torque2 = join2.cross(force)
             spring.end2.new_ang_acc -= torque2 / spring.end2.moi
 
     def update_move(self, dt):
-        for ent in self.entities:
+        if self.body_store is not None:
+            self.body_store.update_move(dt, self.gravity)
+            return
+
+        for ent in self.get_awake():
             if ent.mass == float('inf'):
                 continue
 
@@ -141,16 +360,29 @@ class World:
             ent.new_acc += self.gravity
 
             # Calculate new position using Velocity Verlet.
-            ent.vel = ent.new_vel + (ent.acc + ent.new_acc) * dt / 2
-            ent.pos = ent.new_pos + ent.vel*dt + ent.new_acc*dt*dt/2
-            ent.acc = ent.new_acc
+            # Worked out per component to save making a `Vec` for each
+            # term, in the same order so the results are the same.
+            acc = ent.acc
+            new_acc = ent.new_acc
+            new_vel = ent.new_vel
+            new_pos = ent.new_pos
+            vx = new_vel.x + (acc.x + new_acc.x) * dt / 2
+            vy = new_vel.y + (acc.y + new_acc.y) * dt / 2
+            ent.vel = Vec(vx, vy)
+            ent.pos = Vec(new_pos.x + vx*dt + new_acc.x*dt*dt/2,
+                          new_pos.y + vy*dt + new_acc.y*dt*dt/2)
+            ent.acc = new_acc
 
             ent.new_pos = ent.pos
             ent.new_vel = ent.vel
             ent.new_acc = Vec(0, 0)
 
     def update_turn(self, dt):
-        for ent in self.entities:
+        if self.body_store is not None:
+            self.body_store.update_turn(dt)
+            return
+
+        for ent in self.get_awake():
             # Calculate new orientation using Velocity Verlet.
             ent.ang_vel = 1 * ent.new_ang_vel + \
                           (ent.ang_acc + ent.new_ang_acc) * dt / 2
@@ -165,7 +397,7 @@ class World:
         # Generate dict of entities.
         entities = {}
         for ent in self.entities:
-            entities[str(id(ent))] = ent.to_dict()
+            entities[str(ent.handle)] = ent.to_dict()
 
         # Generate list of springs.
         springs = [spring.to_dict() for spring in self.springs]
@@ -182,6 +414,7 @@ class World:
         entities = {}
         for id_, e in d['entities'].items():
             entity = Entity.from_dict(e)
+            entity.handle = int(id_)
             entities[id_] = entity
 
         springs = []
@@ -264,6 +497,7 @@ class Spring:
         self.slack = False
         self.end1 = end1
         self.end2 = end2
+        self.handle = None  # Given by the world it is added to.
 
         if end1_join_pos is None:
             self.end1_join_pos = Vec(0, 0)
@@ -277,23 +511,39 @@ class Spring:
 
     def get_end1_join_pos(self):
         """Calculates the rotation-aware join pos of end1."""
-        return self.end1_join_pos.rotate(self.end1.ang)
+        return self.end1.get_rotation().apply(self.end1_join_pos)
 
     def get_end2_join_pos(self):
         """Calculates the rotation-aware join pos of end2."""
-        return self.end2_join_pos.rotate(self.end2.ang)
+        return self.end2.get_rotation().apply(self.end2_join_pos)
 
     def to_dict(self):
-        return {'stiffness': self.stiffness,
+        return {'handle': self.handle,
+                'stiffness': self.stiffness,
                 'slack_length': self.slack_length,
-                'end1': str(id(self.end1)),
-                'end2': str(id(self.end2))}
+                'end1': str(self.end1.handle),
+                'end2': str(self.end2.handle),
+                'end1_join_pos': self.end1_join_pos,
+                'end2_join_pos': self.end2_join_pos,
+                'slack': self.slack}
 
     @classmethod
     def from_dict(cls, d, entities):
-        return cls(
+        def get_vec(key):
+            value = d.get(key)
+            if value is None or isinstance(value, Vec):
+                return value
+            return Vec.from_dict(value)
+
+        spring = cls(
             stiffness=d['stiffness'],
             slack_length=d['slack_length'],
             end1=entities[d['end1']],
-            end2=entities[d['end2']]
-        )
\ No newline at end of file
+            end2=entities[d['end2']],
+            end1_join_pos=get_vec('end1_join_pos'),
+            end2_join_pos=get_vec('end2_join_pos'),
+        )
+        spring.handle = d.get('handle')
+        spring.slack = d.get('slack', False)
+
+        return spring
\ No newline at end of file
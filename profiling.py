@@ -0,0 +1,173 @@
+"""Timing the phases of a world's step
+A `Profiler` attached to a world (see `World.start_profiling`) wraps the
+methods `update` calls, and records how long each took and how much
+work was done for each of the last few frames.  Nothing is wrapped
+while no profiler is attached, so profiling costs nothing until used.
+"""
+
+from collections import deque
+import time
+
+__all__ = ['Frame', 'Profiler']
+
+
+class Frame:
+    """The timings and counts of one step.
+
+    dt - the time step.
+    seconds - the wall time the whole step took.
+    phases - a dict of the wall time each phase took, in seconds.
+        Sub-phases are also included in the phases they happen in, eg.
+        `broad_phase` in `narrow_phase`, which is in `update_collision`.
+    counts - a dict of how much work was done, eg. `candidate_pairs`,
+        `collisions`, `contacts` and `impulses`.
+    """
+    __slots__ = ['dt', 'seconds', 'phases', 'counts']
+
+    def __init__(self, dt):
+        self.dt = dt
+        self.seconds = 0.0
+        self.phases = {}
+        self.counts = {}
+
+    def to_dict(self):
+        return {'dt'     : self.dt,
+                'seconds': self.seconds,
+                'phases' : dict(self.phases),
+                'counts' : dict(self.counts)}
+
+
+class Profiler:
+    """Record the timings of the last `size` steps of a world.
+
+    frames - a ring buffer of the recorded `Frame`s, oldest first.
+    """
+    def __init__(self, size=120):
+        self.frames = deque(maxlen=size)
+        self.frame = None
+        self.world = None
+        self.wrapped = []  # (object, attribute, original or None)
+
+    def attach(self, world):
+        """Start recording the steps of `world`."""
+        if self.world is not None:
+            raise ValueError("profiler is already attached to a world")
+        self.world = world
+
+        self.wrap(world, 'update', self.time_frame)
+        for name in world.profile_phases:
+            self.wrap(world, name, self.time_phase(name))
+
+        # Timed with culling, so `candidate_pairs` is the number of pairs
+        # the narrow phase is given.
+        broad_phase = getattr(world, 'broad_phase', None)
+        if broad_phase is not None:
+            self.wrap(broad_phase, 'find_candidates',
+                      self.time_phase('broad_phase', 'candidate_pairs'))
+        if hasattr(world, 'narrow_phase'):
+            self.wrap(world, 'narrow_phase',
+                      self.time_phase('narrow_phase', 'collisions'))
+        if hasattr(world, 'resolve_collisions'):
+            self.wrap(world, 'resolve_collisions', self.time_resolution)
+
+    def detach(self):
+        """Stop recording and put the world's methods back."""
+        for obj, attr, original in reversed(self.wrapped):
+            if original is None:
+                delattr(obj, attr)
+            else:
+                setattr(obj, attr, original)
+
+        self.wrapped = []
+        self.world = None
+
+    def wrap(self, obj, attr, make_wrapper):
+        # Methods are shadowed by an attribute on the instance, which is
+        # deleted again to unwrap them.  Attributes already on the
+        # instance, like `narrow_phase`, are put back instead.
+        method = getattr(obj, attr)
+        original = vars(obj).get(attr)
+        setattr(obj, attr, make_wrapper(method))
+        self.wrapped.append((obj, attr, original))
+
+    def time_frame(self, update):
+        def timed(dt):
+            self.frame = Frame(dt)
+            start = time.perf_counter()
+            try:
+                return update(dt)
+            finally:
+                self.frame.seconds = time.perf_counter() - start
+                self.frames.append(self.frame)
+                self.frame = None
+
+        return timed
+
+    def time_phase(self, name, count=None):
+        """Return a wrapper that adds the time a method takes to the
+        phase `name`, and the length of its result to the count `count`.
+        """
+        def make_wrapper(method):
+            def timed(*args, **kwargs):
+                if self.frame is None:
+                    # Called between steps, eg. by a query.
+                    return method(*args, **kwargs)
+
+                start = time.perf_counter()
+                try:
+                    result = method(*args, **kwargs)
+                finally:
+                    self.add_time(name, time.perf_counter() - start)
+
+                if count is not None:
+                    self.add_count(count, len(result))
+                return result
+
+            return timed
+
+        return make_wrapper
+
+    def time_resolution(self, resolve):
+        timed = self.time_phase('resolve_collisions')(resolve)
+
+        def counted(collisions, dt):
+            world = self.world
+            timed(collisions, dt)
+
+            if self.frame is not None:
+                if world.solver is not None:
+                    self.add_count('contacts', len(world.solver.contacts))
+                else:
+                    self.add_count('contacts', len(collisions))
+                self.add_count('impulses', world.impulses)
+
+        return counted
+
+    def add_time(self, name, seconds):
+        phases = self.frame.phases
+        phases[name] = phases.get(name, 0.0) + seconds
+
+    def add_count(self, name, n):
+        counts = self.frame.counts
+        counts[name] = counts.get(name, 0) + n
+
+    def last(self):
+        """Return the latest `Frame`, or `None` if none were recorded."""
+        return self.frames[-1] if self.frames else None
+
+    def averages(self):
+        """Return the mean `Frame.to_dict` over the recorded frames."""
+        if not self.frames:
+            return None
+
+        n = len(self.frames)
+        mean = {'dt': 0.0, 'seconds': 0.0, 'phases': {}, 'counts': {}}
+        for frame in self.frames:
+            mean['dt'] += frame.dt / n
+            mean['seconds'] += frame.seconds / n
+            for key in ('phases', 'counts'):
+                totals = mean[key]
+                for name, value in getattr(frame, key).items():
+                    totals[name] = totals.get(name, 0) + value / n
+
+        return mean
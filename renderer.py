@@ -0,0 +1,129 @@
+"""Drawing a world with pyglet in a few draw calls
+`BatchRenderer` keeps a vertex list in one `pyglet.graphics.Batch` for
+each entity, triangulated once when the entity is first drawn, and for
+the springs.  Each frame only the vertex positions of entities that
+have moved are written, in place, and the whole batch is drawn at once.
+"""
+
+import pyglet
+
+from base import *
+
+__all__ = ['BatchRenderer']
+
+
+def triangulate(n):
+    """Return indices of triangles fanning out from the first of `n`
+    vertices, which cover a convex polygon.
+    """
+    return list(flatten((0, i, i + 1) for i in range(1, n - 1)))
+
+
+class BatchRenderer:
+    """Draw the entities and springs of a world.
+
+    bodies - a dict of the vertex list drawn for each entity, its local
+        vertices when it was made and the pose it was last drawn at.
+    """
+    SLACK_COLOUR = (0, 0, 255)
+    TAUT_COLOUR = (0, 255, 0)
+
+    def __init__(self):
+        self.batch = pyglet.graphics.Batch()
+        # Springs are drawn under the entities.
+        self.spring_group = pyglet.graphics.OrderedGroup(0)
+        self.body_group = pyglet.graphics.OrderedGroup(1)
+        self.bodies = {}  # Entity -> [vertex list, vertices, pose]
+        self.springs = None
+
+    def add_body(self, ent):
+        n = len(ent.vertices)
+        colour = getattr(ent, 'colour', (255, 255, 255))[:3]
+        vertex_list = self.batch.add_indexed(
+            n, pyglet.gl.GL_TRIANGLES, self.body_group, triangulate(n),
+            ('v2f/stream', [0.0] * (2 * n)),
+            ('c3B/static', colour * n))
+
+        self.bodies[ent] = [vertex_list, ent.vertices, None]
+
+    def remove_body(self, ent):
+        self.bodies.pop(ent)[0].delete()
+
+    def sync(self, world):
+        """Add and remove vertex lists to match the entities of `world`."""
+        entities = set(world.entities)
+        for ent in [e for e in self.bodies if e not in entities]:
+            self.remove_body(ent)
+
+        for ent in world.entities:
+            body = self.bodies.get(ent)
+            if body is not None and body[1] is not ent.vertices:
+                # Its shape was changed, so it must be triangulated again.
+                self.remove_body(ent)
+                body = None
+            if body is None:
+                self.add_body(ent)
+
+    def update(self, world, stepper=None):
+        """Write the positions of everything in `world` that moved.
+
+        If `stepper` is given, entities are drawn at its blended poses.
+        """
+        self.sync(world)
+
+        for ent, body in self.bodies.items():
+            if stepper is None:
+                pos, ang = ent.pos, ent.ang
+            else:
+                pos, ang = stepper.get_pose(ent)
+
+            pose = (pos.x, pos.y, ang)
+            if body[2] != pose:
+                if stepper is None:
+                    transform = ent.get_transform()
+                else:
+                    transform = stepper.get_transform(ent)
+                body[0].vertices[:] = list(
+                    flatten(transform.apply_all(body[1])))
+                body[2] = pose
+
+        self.update_springs(world, stepper)
+
+    def update_springs(self, world, stepper=None):
+        n = 2 * len(world.springs)
+        if self.springs is None:
+            self.springs = self.batch.add(n, pyglet.gl.GL_LINES,
+                                          self.spring_group,
+                                          'v2f/stream', 'c3B/stream')
+        elif self.springs.get_size() != n:
+            self.springs.resize(n)
+
+        vertices = []
+        colours = []
+        for s in world.springs:
+            for ent, join_pos in ((s.end1, s.end1_join_pos),
+                                  (s.end2, s.end2_join_pos)):
+                if stepper is None:
+                    pos = ent.get_transform().apply(join_pos)
+                else:
+                    pos = stepper.to_world(ent, join_pos)
+                vertices.append(pos.x)
+                vertices.append(pos.y)
+
+            colours.extend((self.SLACK_COLOUR if s.slack
+                            else self.TAUT_COLOUR) * 2)
+
+        self.springs.vertices[:] = vertices
+        self.springs.colors[:] = colours
+
+    def draw(self, world, stepper=None):
+        self.update(world, stepper)
+        self.batch.draw()
+
+    def delete(self):
+        """Free all the vertex lists."""
+        for ent in list(self.bodies):
+            self.remove_body(ent)
+        if self.springs is not None:
+            self.springs.delete()
+            self.springs = None
@@ -0,0 +1,308 @@
+"""Compact binary snapshots of colliding worlds
+A snapshot holds the same data as `CollidingWorld.to_dict`, but as
+fixed-layout arrays of 8-byte numbers after a small header, so it is
+small and is read by memory-mapping the file instead of parsing it.
+
+File layout, in the byte order of the machine that wrote it:
+    header - see `HEADER`.
+    bodies - 11 floats per entity, in the order of `BODY_FIELDS`.
+    body refs - 7 ints per entity: its shape and material index, its
+        handle, its collision category, mask and group, and whether it
+        is a bullet.
+    shape offsets - an int per shape, plus one at the end, of where its
+        vertices start in the vertices array.
+    vertices - 2 floats per vertex of every shape.
+    materials - 4 floats per material, in the order of
+        `MATERIAL_FIELDS`.
+    springs - 7 floats per spring, in the order of `SPRING_FIELDS`.
+    spring ends - 3 ints per spring: the indices of its entities and its
+        handle.
+    ignores - 3 ints per entry in each entity's `ignored`: the indices
+        of both entities and the count.
+
+Entities and springs keep their handles, so a loaded world gives the
+same `to_dict` as the one saved.
+"""
+
+from array import array
+import mmap
+import struct
+
+from base import *
+from colliding_world import *
+from phys import Spring
+
+__all__ = ['save_snapshot', 'write_snapshot', 'Snapshot', 'load_snapshot']
+
+
+MAGIC = b'PHYSSNAP'
+VERSION = 4
+BYTE_ORDER_MARK = 0x01020304
+
+# magic, version, byte order mark, entity, shape, vertex, material,
+# spring and ignore counts, gravity x and y.
+HEADER = struct.Struct('=8sII6q2d')
+
+BODY_FIELDS = ['mass', 'moi', 'pos.x', 'pos.y', 'vel.x', 'vel.y',
+               'acc.x', 'acc.y', 'ang', 'ang_vel', 'ang_acc']
+MATERIAL_FIELDS = ['static_friction', 'dynamic_friction', 'restitution',
+                   'density']
+SPRING_FIELDS = ['stiffness', 'slack_length', 'end1_join_pos.x',
+                 'end1_join_pos.y', 'end2_join_pos.x', 'end2_join_pos.y',
+                 'slack']
+
+
+def save_snapshot(path, world):
+    """Write `world`, a `CollidingWorld`, to a snapshot at `path`."""
+    with open(path, 'wb') as file:
+        write_snapshot(file, world)
+
+
+def write_snapshot(file, world):
+    """Write `world` as a snapshot to the binary `file`."""
+    if not isinstance(world, CollidingWorld):
+        raise TypeError(f"{world} is not a CollidingWorld")
+
+    # Number shapes and materials in the order they are first used, and
+    # share them between entities like `CollidingWorld.to_dict` does.
+    shapes = {}
+    materials = {}
+    entities = {}
+    bodies = array('d')
+    body_refs = array('q')
+    for i, ent in enumerate(world.entities):
+        entities[id(ent)] = i
+        shape = shapes.setdefault(id(ent.vertices),
+                                  (len(shapes), ent.vertices))[0]
+        material = materials.setdefault(id(ent.material),
+                                        (len(materials), ent.material))[0]
+
+        bodies.extend((ent.mass, ent.moi, ent.pos.x, ent.pos.y,
+                       ent.vel.x, ent.vel.y, ent.acc.x, ent.acc.y,
+                       ent.ang, ent.ang_vel, ent.ang_acc))
+        body_refs.extend((shape, material, ent.handle,
+                          ent.category, ent.mask, ent.group,
+                          ent.bullet))
+
+    shape_offsets = array('q', [0])
+    vertices = array('d')
+    for _, shape in shapes.values():
+        for v in shape:
+            vertices.extend((v.x, v.y))
+        shape_offsets.append(len(vertices) // 2)
+
+    material_data = array('d')
+    for _, m in materials.values():
+        material_data.extend((m.static_friction, m.dynamic_friction,
+                              m.restitution, m.density))
+
+    springs = array('d')
+    spring_ends = array('q')
+    for s in world.springs:
+        springs.extend((s.stiffness, s.slack_length,
+                        s.end1_join_pos.x, s.end1_join_pos.y,
+                        s.end2_join_pos.x, s.end2_join_pos.y, s.slack))
+        spring_ends.extend((entities[id(s.end1)], entities[id(s.end2)],
+                            s.handle))
+
+    ignores = array('q')
+    for i, ent in enumerate(world.entities):
+        for other, count in ent.ignored.items():
+            ignores.extend((i, entities[id(other)], count))
+
+    file.write(HEADER.pack(MAGIC, VERSION, BYTE_ORDER_MARK,
+                           len(world.entities), len(shapes),
+                           len(vertices) // 2, len(materials),
+                           len(world.springs), len(ignores) // 3,
+                           world.gravity.x, world.gravity.y))
+    for data in (bodies, body_refs, shape_offsets, vertices,
+                 material_data, springs, spring_ends, ignores):
+        file.write(data.tobytes())
+
+
+class Snapshot:
+    """A snapshot file, memory-mapped for reading.
+
+    The arrays are flat `memoryview`s straight onto the file, eg. the
+    velocity of entity `i` is `bodies[11*i + 4]` and `bodies[11*i + 5]`.
+    Close the snapshot, or use it as a context manager, once done.
+
+    offset - where the snapshot starts in the file, if it is part of a
+        larger one.
+    size - the number of bytes the snapshot takes up.
+    """
+    def __init__(self, path, offset=0):
+        with open(path, 'rb') as file:
+            self.mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            (magic, version, mark,
+             self.n_entities, self.n_shapes, self.n_vertices,
+             self.n_materials, self.n_springs, self.n_ignores,
+             gravity_x, gravity_y) = HEADER.unpack_from(self.mmap, offset)
+
+            if magic != MAGIC:
+                raise IOError('Not a snapshot file.')
+            if version != VERSION:
+                raise IOError('Unreadable file version.')
+            if mark != BYTE_ORDER_MARK:
+                raise IOError('Snapshot was written with another byte order.')
+        except BaseException:
+            self.mmap.close()
+            raise
+
+        self.gravity = Vec(gravity_x, gravity_y)
+
+        view = memoryview(self.mmap)
+        start = offset
+        offset += HEADER.size
+        sections = []
+        for format_, n in (('d', len(BODY_FIELDS) * self.n_entities),
+                           ('q', 7 * self.n_entities),
+                           ('q', self.n_shapes + 1),
+                           ('d', 2 * self.n_vertices),
+                           ('d', len(MATERIAL_FIELDS) * self.n_materials),
+                           ('d', len(SPRING_FIELDS) * self.n_springs),
+                           ('q', 3 * self.n_springs),
+                           ('q', 3 * self.n_ignores)):
+            sections.append(view[offset:offset + 8*n].cast(format_))
+            offset += 8 * n
+        view.release()
+        self.size = offset - start
+
+        (self.bodies, self.body_refs, self.shape_offsets, self.vertices,
+         self.materials, self.springs, self.spring_ends,
+         self.ignores) = sections
+
+    def close(self):
+        for section in (self.bodies, self.body_refs, self.shape_offsets,
+                        self.vertices, self.materials, self.springs,
+                        self.spring_ends, self.ignores):
+            section.release()
+        self.mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def get_shapes(self):
+        """Return the list of vertices of each shape."""
+        vertices = self.vertices
+        offsets = self.shape_offsets
+        return [[Vec(vertices[2*k], vertices[2*k + 1])
+                 for k in range(offsets[i], offsets[i + 1])]
+                for i in range(self.n_shapes)]
+
+    def get_materials(self):
+        m = self.materials
+        return [Material(*m[4*i:4*i + 4]) for i in range(self.n_materials)]
+
+    def to_dict(self):
+        """Return the snapshot in the form `CollidingWorld.from_dict`
+        takes, the same as `to_dict` of the world saved, as loaded from
+        `World.serialise`.  Shapes and materials are keyed by their
+        index.
+        """
+        def vec(x, y):
+            return {'x': x, 'y': y}
+
+        refs = self.body_refs
+        entities = {}
+        for i in range(self.n_entities):
+            (mass, moi, x, y, vx, vy, ax, ay,
+             ang, ang_vel, ang_acc) = self.bodies[11*i:11*i + 11]
+            entities[str(refs[7*i + 2])] = {
+                'mass': mass, 'moi': moi,
+                'pos': vec(x, y), 'vel': vec(vx, vy), 'acc': vec(ax, ay),
+                'ang': ang, 'ang_vel': ang_vel, 'ang_acc': ang_acc,
+                'material': str(refs[7*i + 1]),
+                'shape': str(refs[7*i]),
+                'category': refs[7*i + 3],
+                'mask': refs[7*i + 4],
+                'group': refs[7*i + 5],
+                'bullet': bool(refs[7*i + 6]),
+                'ignored': {}}
+
+        ignores = self.ignores
+        for k in range(self.n_ignores):
+            i, j, count = ignores[3*k:3*k + 3]
+            entities[str(refs[7*i + 2])]['ignored'][str(refs[7*j + 2])] = count
+
+        springs = []
+        for i in range(self.n_springs):
+            (stiffness, slack_length, x1, y1, x2, y2,
+             slack) = self.springs[7*i:7*i + 7]
+            end1, end2, handle = self.spring_ends[3*i:3*i + 3]
+            springs.append({'handle': handle,
+                            'stiffness': stiffness,
+                            'slack_length': slack_length,
+                            'end1': str(refs[7*end1 + 2]),
+                            'end2': str(refs[7*end2 + 2]),
+                            'end1_join_pos': vec(x1, y1),
+                            'end2_join_pos': vec(x2, y2),
+                            'slack': bool(slack)})
+
+        return {
+            'springs': springs,
+            'entities': entities,
+            'gravity': vec(self.gravity.x, self.gravity.y),
+            'shapes': {str(i): [vec(v.x, v.y) for v in shape]
+                       for i, shape in enumerate(self.get_shapes())},
+            'materials': {str(i): m.to_dict()
+                          for i, m in enumerate(self.get_materials())},
+        }
+
+    def load(self, cls=CollidingWorld, **kwargs):
+        """Build a world of class `cls` from the snapshot, the same as
+        `cls.from_dict(self.to_dict(), **kwargs)` but without making the
+        dict.
+        """
+        shapes = self.get_shapes()
+        materials = self.get_materials()
+        bodies = self.bodies
+        refs = self.body_refs
+
+        entities = []
+        for i in range(self.n_entities):
+            (mass, moi, x, y, vx, vy, ax, ay,
+             ang, ang_vel, ang_acc) = bodies[11*i:11*i + 11]
+            ent = Collider(
+                mass=mass, pos=Vec(x, y), vel=Vec(vx, vy), acc=Vec(ax, ay),
+                moi=moi, ang=ang, ang_vel=ang_vel, ang_acc=ang_acc,
+                shape=shapes[refs[7*i]], material=materials[refs[7*i + 1]])
+            (ent.handle, ent.category, ent.mask,
+             ent.group) = refs[7*i + 2:7*i + 6]
+            ent.bullet = bool(refs[7*i + 6])
+            entities.append(ent)
+
+        ignores = self.ignores
+        for k in range(self.n_ignores):
+            i, j, count = ignores[3*k:3*k + 3]
+            entities[i].ignored[entities[j]] = count
+
+        springs = []
+        for i in range(self.n_springs):
+            (stiffness, slack_length, x1, y1, x2, y2,
+             slack) = self.springs[7*i:7*i + 7]
+            end1, end2, handle = self.spring_ends[3*i:3*i + 3]
+            spring = Spring(stiffness=stiffness, slack_length=slack_length,
+                            end1=entities[end1], end2=entities[end2],
+                            end1_join_pos=Vec(x1, y1),
+                            end2_join_pos=Vec(x2, y2))
+            spring.slack = bool(slack)
+            spring.handle = handle
+            springs.append(spring)
+
+        world = cls(gravity=self.gravity, **kwargs)
+        world.add_ent(*entities)
+        world.add_spring(*springs)
+
+        return world
+
+
+def load_snapshot(path, cls=CollidingWorld, **kwargs):
+    """Load the world in the snapshot at `path`."""
+    with Snapshot(path) as snapshot:
+        return snapshot.load(cls, **kwargs)
@@ -0,0 +1,168 @@
+"""Iterative collision resolution
+This module provides `SequentialImpulseSolver`, which resolves all of a
+step's collisions together by applying small impulses at every contact
+over several iterations.  The impulses are remembered between steps and
+applied again at the start of the next one ("warm starting"), so
+resting stacks settle instead of jittering.
+"""
+
+from base import *
+from collision import get_contacts
+
+__all__ = ['Contact', 'SequentialImpulseSolver']
+
+
+class Contact:
+    """A point where two colliders touch.
+
+    feature - identifies which part of each collider made the contact,
+        so it can be matched up with the same contact next step.
+    normal_impulse, tangent_impulse - the total impulse applied along
+        the normal and along the surface so far.
+    """
+    __slots__ = ['o1', 'o2', 'point', 'normal', 'separation', 'feature',
+                 'r1', 'r2', 'tangent', 'normal_mass', 'tangent_mass',
+                 'bias', 'friction', 'normal_impulse', 'tangent_impulse']
+
+    def __init__(self, o1, o2, point, normal, separation, feature=0):
+        self.o1 = o1
+        self.o2 = o2
+        self.point = point
+        self.normal = normal
+        self.separation = separation
+        self.feature = feature
+        self.normal_impulse = 0.0
+        self.tangent_impulse = 0.0
+
+    def key(self):
+        return id(self.o1), id(self.o2), self.feature
+
+
+def velocity_at(o, r):
+    """The velocity of the point `r` from the centre of `o`."""
+    return o.new_vel + Vec(x=-o.new_ang_vel * r.y, y=o.new_ang_vel * r.x)
+
+
+def apply_impulse(o, impulse, r):
+    if o.mass == float('inf'):
+        return
+
+    o.new_vel += impulse / o.mass
+    o.new_ang_vel += r.cross(impulse) / o.moi
+
+
+class SequentialImpulseSolver:
+    """Resolve collisions with accumulated, clamped impulses.
+
+    iterations - how many times to go over every contact each step.
+    warm_start - whether to start each contact with last step's impulse.
+    baumgarte - the fraction of the overlap to push apart each second,
+        per unit of `dt`.  This replaces positional correction.
+    slop - the overlap allowed before it is pushed apart.
+    restitution_threshold - contacts approaching slower than this do
+        not bounce, so resting bodies stay still.
+
+    impulses - the number of impulses applied between pairs of bodies
+        by the last `solve`, counting each iteration.
+    """
+    def __init__(self, iterations=10, warm_start=True, baumgarte=0.2,
+                 slop=1.0, restitution_threshold=20.0):
+        self.iterations = iterations
+        self.warm_start = warm_start
+        self.baumgarte = baumgarte
+        self.slop = slop
+        self.restitution_threshold = restitution_threshold
+
+        self.contacts = []
+        self.cache = {}  # Contact.key() -> (normal, tangent impulse)
+        self.impulses = 0
+
+    def make_contacts(self, o1, o2, reference):
+        """Return the contacts of a collision from `collide_all`, clipped
+        against its `reference` side.
+        """
+        normal, points = get_contacts(o1.get_vertices(), o2.get_vertices(),
+                                      o1.get_normals(), o2.get_normals(),
+                                      reference)
+
+        return [Contact(o1, o2, point, normal, separation, feature)
+                for point, separation, feature in points]
+
+    def solve(self, collisions, dt):
+        """Resolve `collisions`, as returned by `collide_all`."""
+        self.contacts = []
+        self.impulses = 0
+        for o1, o2, _, _, reference in collisions:
+            if o1.mass == float('inf') and o2.mass == float('inf'):
+                continue
+
+            self.contacts += self.make_contacts(o1, o2, reference)
+
+        for contact in self.contacts:
+            self.prepare(contact, dt)
+
+        for _ in range(self.iterations):
+            for contact in self.contacts:
+                self.solve_contact(contact)
+
+        self.cache = {c.key(): (c.normal_impulse, c.tangent_impulse)
+                      for c in self.contacts}
+
+    def prepare(self, c, dt):
+        o1, o2, n = c.o1, c.o2, c.normal
+        c.r1 = c.point - o1.pos
+        c.r2 = c.point - o2.pos
+        c.tangent = Vec(x=-n.y, y=n.x)
+
+        inverse_mass = 1/o1.mass + 1/o2.mass
+        c.normal_mass = 1 / (inverse_mass
+                             + c.r1.cross(n)**2 / o1.moi
+                             + c.r2.cross(n)**2 / o2.moi)
+        c.tangent_mass = 1 / (inverse_mass
+                              + c.r1.cross(c.tangent)**2 / o1.moi
+                              + c.r2.cross(c.tangent)**2 / o2.moi)
+
+        # Combine coef. of static friction as in `update_collision`.
+        c.friction = (o1.material.static_friction ** 2
+                      + o2.material.static_friction ** 2) ** 0.5
+
+        # Push overlapping bodies apart, and bounce if approaching fast.
+        c.bias = self.baumgarte / dt * max(0.0, -c.separation - self.slop)
+        v_dot_n = (velocity_at(o2, c.r2) - velocity_at(o1, c.r1)).dot(n)
+        if v_dot_n < -self.restitution_threshold:
+            e = min(o1.material.restitution, o2.material.restitution)
+            c.bias = max(c.bias, -e * v_dot_n)
+
+        if self.warm_start and c.key() in self.cache:
+            c.normal_impulse, c.tangent_impulse = self.cache[c.key()]
+            impulse = n * c.normal_impulse + c.tangent * c.tangent_impulse
+            apply_impulse(o1, -impulse, c.r1)
+            apply_impulse(o2, impulse, c.r2)
+            self.impulses += 1
+
+    def solve_contact(self, c):
+        o1, o2 = c.o1, c.o2
+
+        # Normal impulse, kept from pulling the bodies together.
+        dv = velocity_at(o2, c.r2) - velocity_at(o1, c.r1)
+        j = c.normal_mass * (c.bias - dv.dot(c.normal))
+        total = max(c.normal_impulse + j, 0.0)
+        j = total - c.normal_impulse
+        c.normal_impulse = total
+
+        impulse = c.normal * j
+        apply_impulse(o1, -impulse, c.r1)
+        apply_impulse(o2, impulse, c.r2)
+
+        # Friction impulse, kept within the friction cone.
+        dv = velocity_at(o2, c.r2) - velocity_at(o1, c.r1)
+        jt = -c.tangent_mass * dv.dot(c.tangent)
+        limit = c.friction * c.normal_impulse
+        total = min(max(c.tangent_impulse + jt, -limit), limit)
+        jt = total - c.tangent_impulse
+        c.tangent_impulse = total
+
+        impulse = c.tangent * jt
+        apply_impulse(o1, -impulse, c.r1)
+        apply_impulse(o2, impulse, c.r2)
+        self.impulses += 2
@@ -0,0 +1,174 @@
+"""Array-backed springs
+This module provides `SpringSet`, which keeps the constants of every
+spring in a `World` in NumPy arrays so that the forces of all of them
+are worked out at once.  It needs NumPy, which the rest of the engine
+does not.
+
+The forces are added to the entities' accelerations straight into the
+arrays of a `body_store.BodyStore` if the world has one, or otherwise
+once per entity rather than once per spring, as they are for ends that
+are not in the store, such as pins.
+"""
+
+import numpy as np
+
+from base import *
+
+__all__ = ['SpringSet']
+
+
+class SpringSet:
+    """Spring constants held in NumPy arrays, one row per spring.
+
+    The constants are copied before the first update after springs are
+    added or removed, so call `refresh` after changing a spring's
+    stiffness, slack length or join positions.
+    """
+    def __init__(self):
+        self.springs = []
+        self.rows = {}  # Spring handle -> row
+        self.dirty = False
+        self.stiffness = np.zeros(0)
+        self.slack_length = np.zeros(0)
+        self.join1 = np.zeros((0, 2))
+        self.join2 = np.zeros((0, 2))
+        self.slack = np.zeros(0, dtype=bool)
+
+    def __len__(self):
+        return len(self.springs)
+
+    def attach(self, spring):
+        self.rows[spring.handle] = len(self.springs)
+        self.springs.append(spring)
+        self.dirty = True
+
+    def detach(self, spring):
+        row = self.rows.pop(spring.handle)
+        last = self.springs.pop()
+        if last is not spring:
+            self.springs[row] = last
+            self.rows[last.handle] = row
+        self.dirty = True
+
+    def refresh(self):
+        """Copy the constants of every spring into the arrays again."""
+        springs = self.springs
+        self.stiffness = np.array([s.stiffness for s in springs], dtype=float)
+        self.slack_length = np.array([s.slack_length for s in springs],
+                                     dtype=float)
+        self.join1 = np.array([(s.end1_join_pos.x, s.end1_join_pos.y)
+                               for s in springs], dtype=float).reshape(-1, 2)
+        self.join2 = np.array([(s.end2_join_pos.x, s.end2_join_pos.y)
+                               for s in springs], dtype=float).reshape(-1, 2)
+        self.slack = np.array([s.slack for s in springs], dtype=bool)
+        self.dirty = False
+
+    def gather(self, world):
+        """Return the index of each spring's ends into arrays of the
+        bodies' positions, angles, masses, moments of inertia and
+        whether they are awake, and the offset and list of the bodies
+        that are not in the world's body store.
+
+        Bodies in the store come first, straight from its arrays, then
+        the rest, such as pins, in the order they are found.
+        """
+        ends1 = [s.end1 for s in self.springs]
+        ends2 = [s.end2 for s in self.springs]
+
+        store = world.body_store
+        n = 0 if store is None else len(store)
+        bodies = {}
+        for ent in ends1 + ends2:
+            if store is None or getattr(ent, '_body_store', None) is not store:
+                bodies.setdefault(ent, n + len(bodies))
+
+        def get_index(ent):
+            index = bodies.get(ent)
+            return ent._body_index if index is None else index
+
+        index1 = np.array([get_index(e) for e in ends1], dtype=int)
+        index2 = np.array([get_index(e) for e in ends2], dtype=int)
+
+        state = np.array([(e.pos.x, e.pos.y, e.ang, e.mass, e.moi, e.awake)
+                          for e in bodies], dtype=float).reshape(-1, 6)
+        pos, ang, mass, moi, awake = (state[:, :2], state[:, 2], state[:, 3],
+                                      state[:, 4], state[:, 5] != 0)
+        if store is not None:
+            pos = np.concatenate((store.pos[:n], pos))
+            ang = np.concatenate((store.ang[:n], ang))
+            mass = np.concatenate((store.mass[:n], mass))
+            moi = np.concatenate((store.moi[:n], moi))
+            awake = np.concatenate((store.awake[:n] != 0, awake))
+
+        return (index1, index2, n, list(bodies), pos, ang, mass, moi,
+                awake)
+
+    def update(self, world, dt):
+        """Add the forces of every spring in `world` to its ends'
+        accelerations, the same as `World.update_spring`.
+        """
+        if not self.springs:
+            return
+        if self.dirty:
+            self.refresh()
+
+        index1, index2, stored, bodies, pos, ang, mass, moi, awake = \
+            self.gather(world)
+        active = awake[index1] | awake[index2]
+
+        # Rotate the join positions by each end's angle.
+        join1 = rotate(self.join1, ang[index1])
+        join2 = rotate(self.join2, ang[index2])
+
+        length = pos[index2] + join2 - pos[index1] - join1
+        abs_length = (length[:, 0]**2 + length[:, 1]**2) ** 0.5
+        slack = abs_length < self.slack_length
+        # Springs of no length have no direction to pull in.
+        pulling = active & ~slack & (abs_length > 0)
+
+        # Compute force using Hooke's law.
+        with np.errstate(invalid='ignore', divide='ignore'):
+            scale = self.stiffness * (abs_length - self.slack_length) \
+                    / abs_length
+        force = length * np.where(pulling, scale, 0.0)[:, None]
+
+        torque1 = join1[:, 0]*force[:, 1] - join1[:, 1]*force[:, 0]
+        torque2 = join2[:, 0]*force[:, 1] - join2[:, 1]*force[:, 0]
+
+        n = len(mass)
+        acc = np.zeros((n, 2))
+        ang_acc = np.zeros(n)
+        np.add.at(acc, index1, force / mass[index1, None])
+        np.add.at(acc, index2, -force / mass[index2, None])
+        np.add.at(ang_acc, index1, torque1 / moi[index1])
+        np.add.at(ang_acc, index2, -torque2 / moi[index2])
+
+        self.set_slack(np.where(active, slack, self.slack))
+
+        store = world.body_store
+        if store is not None:
+            store.new_acc[:stored] += acc[:stored]
+            store.new_ang_acc[:stored] += ang_acc[:stored]
+
+        touched = np.zeros(n, dtype=bool)
+        touched[index1[pulling]] = True
+        touched[index2[pulling]] = True
+        touched[:stored] = False
+        for k in np.flatnonzero(touched):
+            ent = bodies[k - stored]
+            ent.new_acc += Vec(float(acc[k, 0]), float(acc[k, 1]))
+            ent.new_ang_acc += float(ang_acc[k])
+
+    def set_slack(self, slack):
+        """Update the `slack` flag of the springs it changed for."""
+        for row in np.flatnonzero(slack != self.slack):
+            self.springs[row].slack = bool(slack[row])
+        self.slack = slack
+
+
+def rotate(vectors, angles):
+    """Rotate each of an (n, 2) array of vectors by its angle."""
+    c = np.cos(angles)
+    s = np.sin(angles)
+    return np.stack((vectors[:, 0]*c - vectors[:, 1]*s,
+                     vectors[:, 0]*s + vectors[:, 1]*c), axis=1)
@@ -0,0 +1,106 @@
+"""Stepping a world at a fixed rate
+`FixedStepper` steps a world by a fixed `dt` however often it is
+advanced, so the simulation runs at the same speed and gives the same
+results whatever the frame rate.  Time left over between steps is kept
+for the next frame, and used to blend each entity's pose between the
+last two steps for drawing, so motion looks smooth even when the frame
+rate and step rate differ.
+"""
+
+from base import *
+
+__all__ = ['FixedStepper']
+
+
+class FixedStepper:
+    """Step `world` every `dt` seconds of real time.
+
+    max_steps - the most steps to take in one frame.  If stepping is
+        slower than real time, time beyond this is dropped and the
+        simulation slows down, instead of each frame taking longer to
+        catch up than the last.
+
+    accumulator - the time passed that has not been stepped yet.
+    dropped - the total time dropped because of `max_steps`.
+    """
+    def __init__(self, world, dt=1/60, max_steps=8):
+        self.world = world
+        self.dt = dt
+        self.max_steps = max_steps
+
+        self.accumulator = 0.0
+        self.dropped = 0.0
+        self.previous = {}  # Entity -> (x, y, ang) before the last step.
+
+    def advance(self, elapsed):
+        """Add `elapsed` seconds and take as many steps as fit.
+
+        Returns the number of steps taken.
+        """
+        self.accumulator += elapsed
+
+        steps = 0
+        while self.accumulator >= self.dt and steps < self.max_steps:
+            self.previous = {ent: (ent.pos.x, ent.pos.y, ent.ang)
+                             for ent in self.world.entities}
+            self.world.update(self.dt)
+            self.accumulator -= self.dt
+            steps += 1
+
+        if self.accumulator >= self.dt:
+            # Give up on catching up, but keep the fraction of a step.
+            excess = self.accumulator - self.accumulator % self.dt
+            self.dropped += excess
+            self.accumulator -= excess
+
+        return steps
+
+    def reset(self, ent=None):
+        """Draw `ent`, or every entity if not given, where it is until
+        the next step, eg. once it has been moved by hand or while the
+        world is paused.
+        """
+        if ent is None:
+            self.previous = {}
+        else:
+            self.previous.pop(ent, None)
+
+    def get_alpha(self):
+        """Return how far between the last step and the next one real
+        time is, from 0 to 1.
+        """
+        return self.accumulator / self.dt
+
+    def get_pose(self, ent):
+        """Return `(pos, ang)` of `ent` blended between the last two
+        steps, to draw it with.
+        """
+        if ent not in self.previous:
+            return ent.pos, ent.ang
+
+        x, y, ang = self.previous[ent]
+        alpha = self.get_alpha()
+        return (Vec(x=x + (ent.pos.x - x) * alpha,
+                    y=y + (ent.pos.y - y) * alpha),
+                ang + (ent.ang - ang) * alpha)
+
+    def get_transform(self, ent):
+        """Return the `Transform` of `ent` at its blended pose."""
+        if ent not in self.previous:
+            return ent.get_transform()
+
+        pos, ang = self.get_pose(ent)
+        return Transform(pos, Rotation(ang))
+
+    def to_world(self, ent, point):
+        """Return `point`, relative to `ent` when unrotated, in world
+        space at the blended pose of `ent`.
+        """
+        return self.get_transform(ent).apply(point)
+
+    def get_vertices(self, ent):
+        """Return the vertices of `ent` at its blended pose."""
+        if ent not in self.previous:
+            return ent.get_vertices()
+
+        return self.get_transform(ent).apply_all(ent.vertices)
@@ -0,0 +1,305 @@
+"""Keeping copies of a colliding world up to date
+`WorldTracker` watches a world and, each time it is updated, stamps the
+entities, springs and materials that changed with a new version.
+`diff` then returns only what changed since a version a copy already
+has, as a dict that can be sent as JSON (see `phys.PhysSerialiser`),
+and `Replica.apply` brings the copy up to that version.
+
+Entities and springs are keyed by their handle, and shapes and materials
+as in `CollidingWorld.to_dict`.  Entity state is
+changed in place all over the engine, so rather than each object
+marking itself dirty, the tracker compares them to the values it last
+recorded.  Shapes are assumed not to change once added.
+"""
+
+from base import *
+from colliding_world import *
+from colliding_world import set_ignored
+from phys import Spring
+
+__all__ = ['WorldTracker', 'Replica']
+
+
+def get_key(obj):
+    # Shapes and materials have no handles.
+    handle = getattr(obj, 'handle', None)
+    return str(id(obj) if handle is None else handle)
+
+
+# Entity state that changes as it moves, sent as a tuple of `BODY` and
+# compared within the tolerance.
+BODY = ['pos', 'ang', 'vel', 'ang_vel', 'acc', 'ang_acc']
+
+
+def get_body(ent):
+    return (ent.pos.x, ent.pos.y, ent.ang, ent.vel.x, ent.vel.y, ent.ang_vel,
+            ent.acc.x, ent.acc.y, ent.ang_acc)
+
+
+def get_refs(ent):
+    # The rest of the entity, eg. its mass, shape, material and filters,
+    # which is all sent again when any of it changes.
+    d = ent.to_dict()
+    for key in BODY:
+        del d[key]
+    return d
+
+
+def spring_to_dict(spring):
+    # Plain dicts rather than `Vec`s, so they compare equal.
+    d = spring.to_dict()
+    for key in ('end1_join_pos', 'end2_join_pos'):
+        d[key] = d[key].to_dict()
+    return d
+
+
+def entity_to_dict(ent):
+    d = ent.to_dict()
+    for key in ('pos', 'vel', 'acc'):
+        d[key] = d[key].to_dict()
+    return d
+
+
+class Tracked:
+    """The last recorded value of an object and when it changed."""
+    __slots__ = ['value', 'version', 'added']
+
+    def __init__(self, value, version):
+        self.value = value
+        self.version = version
+        self.added = version
+
+
+class WorldTracker:
+    """Track the changes to `world`, a `CollidingWorld`.
+
+    tolerance - how far a body's position, angle, velocity or
+        acceleration can move from the value last recorded before it
+        counts as changed.  With 0, every change counts.
+    version - the version of the last update.
+    """
+    def __init__(self, world, tolerance=0.0):
+        self.world = world
+        self.tolerance = tolerance
+        self.version = 0
+
+        self.entities = {}   # Entity -> Tracked body state
+        self.refs = {}       # Entity -> Tracked `get_refs`
+        self.springs = {}    # Spring -> Tracked dict
+        self.materials = {}  # Material -> Tracked dict
+        self.shapes = {}     # id(vertices) -> Tracked vertices
+        self.removed = []    # (version, kind, key)
+
+        self.update()
+
+    def changed(self, tracked, value):
+        """Return whether `value` moved too far from `tracked.value`."""
+        tolerance = self.tolerance
+        return any(abs(a - b) > tolerance
+                   for a, b in zip(value, tracked.value))
+
+    def track(self, tracked, objects, get_value, kind, changed=None):
+        """Record the values of `objects`, stamping new and changed ones
+        with the current version and forgetting ones that are gone.
+        """
+        version = self.version
+        seen = set()
+        for obj in objects:
+            seen.add(obj)
+            value = get_value(obj)
+            record = tracked.get(obj)
+            if record is None:
+                tracked[obj] = Tracked(value, version)
+            elif (record.value != value if changed is None
+                  else changed(record, value)):
+                record.value = value
+                record.version = version
+
+        for obj in [o for o in tracked if o not in seen]:
+            del tracked[obj]
+            self.removed.append((version, kind, get_key(obj)))
+
+    def update(self):
+        """Record the current state of the world as a new version, and
+        return the version.
+        """
+        self.version += 1
+        entities = self.world.entities
+
+        self.track(self.entities, entities, get_body, 'entities',
+                   self.changed)
+        self.track(self.refs, entities, get_refs, 'refs')
+        self.track(self.springs, self.world.springs, spring_to_dict,
+                   'springs')
+        self.track(self.materials, {e.material for e in entities},
+                   Material.to_dict, 'materials')
+
+        for ent in entities:
+            if id(ent.vertices) not in self.shapes:
+                self.shapes[id(ent.vertices)] = Tracked(
+                    [v.to_dict() for v in ent.vertices], self.version)
+
+        return self.version
+
+    def diff(self, since=0):
+        """Return what changed after version `since`, as of the last
+        update.  With `since=0`, everything is included.
+        """
+        def newer(tracked):
+            return {get_key(obj): record
+                    for obj, record in tracked.items()
+                    if record.version > since}
+
+        refs = newer(self.refs)
+        entities = {}
+        bodies = {}
+        for key, record in newer(self.entities).items():
+            bodies[key] = record.value
+        for ent, record in self.refs.items():
+            key = get_key(ent)
+            if key in refs or record.added > since:
+                # Send the whole entity when it is new or more than its
+                # motion changed.
+                entities[key] = entity_to_dict(ent)
+                bodies.pop(key, None)
+
+        removed = {'entities': [], 'springs': [], 'materials': []}
+        for version, kind, key in self.removed:
+            if version > since and kind in removed:
+                removed[kind].append(key)
+
+        return {
+            'since': since,
+            'version': self.version,
+            'gravity': self.world.gravity.to_dict(),
+            'shapes': {str(key): record.value
+                       for key, record in self.shapes.items()
+                       if record.version > since},
+            'materials': {key: record.value for key, record
+                          in newer(self.materials).items()},
+            'entities': entities,
+            'bodies': bodies,
+            'springs': {key: record.value for key, record
+                        in newer(self.springs).items()},
+            'removed': removed,
+        }
+
+    def forget(self, before):
+        """Forget removals from before version `before`, once every copy
+        has been brought past it.
+        """
+        self.removed = [r for r in self.removed if r[0] >= before]
+
+
+class Replica:
+    """A copy of a tracked world, brought up to date with `apply`.
+
+    world - the copy, a `cls` made with `kwargs`.
+    version - the version of the last diff applied.
+    """
+    def __init__(self, cls=CollidingWorld, **kwargs):
+        self.world = cls(**kwargs)
+        self.version = 0
+
+        self.shapes = {}
+        self.materials = {}
+        self.entities = {}
+        self.springs = {}
+
+    def apply(self, delta):
+        """Apply a diff from `WorldTracker.diff(self.version)`."""
+        if delta['since'] > self.version:
+            raise ValueError(f"diff is since version {delta['since']}, "
+                             f"but the replica is at {self.version}")
+
+        world = self.world
+        removed = delta['removed']
+        for key in removed['springs']:
+            spring = self.springs.pop(key, None)
+            # It may have gone with an entity it was attached to.
+            if spring is not None and world.get_spring(spring.handle) is spring:
+                world.remove_spring(spring)
+        for key in removed['entities']:
+            ent = self.entities.pop(key, None)
+            if ent is not None:
+                world.remove_ent(ent)
+        for key in removed['materials']:
+            self.materials.pop(key, None)
+
+        world.gravity = Vec.from_dict(delta['gravity'])
+
+        for key, vertices in delta['shapes'].items():
+            self.shapes[key] = [Vec.from_dict(v) for v in vertices]
+
+        for key, d in delta['materials'].items():
+            if key in self.materials:
+                # Update in place, as entities share it.
+                for name, value in d.items():
+                    setattr(self.materials[key], name, value)
+            else:
+                self.materials[key] = Material.from_dict(d)
+
+        for key, d in delta['entities'].items():
+            ent = Collider.from_dict(d, key, self.shapes, self.materials)
+            # Keep the same handles as the tracked world.
+            ent.handle = int(key)
+            old = self.entities.get(key)
+            springs = []
+            if old is not None:
+                springs = world.get_springs(old)
+                world.remove_ent(old)
+            world.add_ent(ent)
+            self.entities[key] = ent
+
+            # Removing the old entity removed its springs too.
+            for spring in springs:
+                if spring.end1 is old:
+                    spring.end1 = ent
+                if spring.end2 is old:
+                    spring.end2 = ent
+                world.add_spring(spring)
+
+        # Once every entity in the diff is known; ones that are gone
+        # were forgotten with their removal.
+        set_ignored(self.entities,
+                    {key: {other: count
+                           for other, count in d.get('ignored', {}).items()
+                           if other in self.entities}
+                     for key, d in delta['entities'].items()})
+
+        static_moved = False
+        for key, (x, y, ang, vx, vy, ang_vel,
+                  ax, ay, ang_acc) in delta['bodies'].items():
+            ent = self.entities[key]
+            static_moved |= ent.mass == float('inf')
+            ent.pos = Vec(x, y)
+            ent.new_pos = ent.pos
+            ent.vel = Vec(vx, vy)
+            ent.new_vel = ent.vel
+            ent.acc = Vec(ax, ay)
+            ent.new_acc = ent.acc
+            ent.ang = ent.new_ang = ang
+            ent.ang_vel = ent.new_ang_vel = ang_vel
+            ent.ang_acc = ent.new_ang_acc = ang_acc
+        if static_moved:
+            world.mark_changed()
+        else:
+            world.mark_moved()
+
+        for key, d in delta['springs'].items():
+            old = self.springs.get(key)
+            if old is not None and world.get_spring(old.handle) is old:
+                world.remove_spring(old)
+            spring = Spring(
+                stiffness=d['stiffness'],
+                slack_length=d['slack_length'],
+                end1=self.entities[d['end1']],
+                end2=self.entities[d['end2']],
+                end1_join_pos=Vec.from_dict(d['end1_join_pos']),
+                end2_join_pos=Vec.from_dict(d['end2_join_pos']))
+            spring.slack = d['slack']
+            spring.handle = int(key)
+            world.add_spring(spring)
+            self.springs[key] = spring
+
+        self.version = delta['version']
@@ -0,0 +1,142 @@
+"""Fixtures shared by the tests
+Most fixtures return a function that builds a fresh object each call,
+so a test can build as many as it needs.
+"""
+
+import os
+import random
+import sys
+
+import pytest
+
+# The engine's modules live at the top of the repository.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from base import *
+from broad_phase import DynamicTree
+from colliding_world import *
+from phys import Spring
+
+MATERIAL = Material(
+    static_friction=0.4,
+    dynamic_friction=0.2,
+    restitution=0.2,
+    density=1,
+)
+
+SHAPES = {
+    'hexagon': [Vec(100, 0), Vec(50, 87), Vec(-50, 87),
+                Vec(-100, 0), Vec(-50, -87), Vec(50, -87)],
+    'triangle': [Vec(-100, -57.7), Vec(100, -57.7), Vec(0, 115.5)],
+    'box': [Vec(-50, -50), Vec(50, -50), Vec(50, 50), Vec(-50, 50)],
+}
+
+
+class CountingTree(DynamicTree):
+    """A `DynamicTree` counting how many times it is updated."""
+    def __init__(self):
+        super().__init__()
+        self.updates = 0
+
+    def update(self, colliders, boxes):
+        self.updates += 1
+        super().update(colliders, boxes)
+
+
+def make_body(shape, scale, pos, ang=0, vel=None):
+    vertices = [v * scale for v in SHAPES[shape]]
+    size = scale * 100
+    mass = 3**0.5 / 2 * size**2 * MATERIAL.density
+    moi = 5 / 16 * 3**0.5 * size**4 * MATERIAL.density
+
+    return Collider(vertices, MATERIAL, pos, ang, mass, moi,
+                    vel=vel if vel is not None else Vec(0, 0), acc=Vec(0, 0))
+
+
+def make_wall(x1, y1, x2, y2):
+    centre = Vec((x1 + x2) / 2, (y1 + y2) / 2)
+    w = (x2 - x1) / 2
+    h = (y2 - y1) / 2
+    return Collider([Vec(-w, -h), Vec(w, -h), Vec(w, h), Vec(-w, h)],
+                    MATERIAL, centre, 0, float('inf'), float('inf'),
+                    vel=Vec(0, 0), acc=Vec(0, 0))
+
+
+def make_pile(n=9, **kwargs):
+    world = CollidingWorld(gravity=Vec(0, -100), **kwargs)
+
+    columns = max(1, int(n ** 0.5))
+    width = columns * 110
+    world.add_ent(make_wall(-width, -100, 2 * width, 0),
+                  make_wall(-20, 0, 0, 100 * n),
+                  make_wall(width, 0, width + 20, 100 * n))
+
+    rng = random.Random(n)
+    for i in range(n):
+        pos = Vec(55 + (i % columns) * 110, 60 + (i // columns) * 110)
+        world.add_ent(make_body('hexagon', 0.5, pos, ang=rng.uniform(0, 1)))
+
+    return world
+
+
+@pytest.fixture
+def body():
+    """Make a dynamic collider of one of `SHAPES`, scaled by `scale`."""
+    return make_body
+
+
+@pytest.fixture
+def wall():
+    """Make a static box from (x1, y1) to (x2, y2)."""
+    return make_wall
+
+
+@pytest.fixture
+def pile():
+    """Make a world of `n` hexagons dropped in columns into a walled
+    pit, taking keyword arguments for `CollidingWorld`.
+    """
+    return make_pile
+
+
+@pytest.fixture
+def joined_world():
+    """Make a pile with two boxes above it joined by a spring."""
+    def joined_world():
+        world = make_pile(9)
+        a = make_body('box', 0.5, Vec(100, 600), ang=0.3)
+        b = make_body('box', 0.5, Vec(200, 650))
+        world.add_ent(a, b)
+        world.add_spring(Spring(stiffness=500, end1=a, end2=b,
+                                slack_length=20,
+                                end1_join_pos=Vec(5, 5),
+                                end2_join_pos=Vec(10, -10)))
+        return world
+
+    return joined_world
+
+
+@pytest.fixture
+def scattered_world():
+    """Make a world of `n` boxes and hexagons thrown about above a floor,
+    taking keyword arguments for `CollidingWorld`.
+    """
+    def scattered_world(seed=1, n=120, **kwargs):
+        rng = random.Random(seed)
+        world = CollidingWorld(gravity=Vec(0, -100), **kwargs)
+        world.add_ent(make_wall(-9000, -75, 9000, 25))
+        for _ in range(n):
+            pos = Vec(rng.uniform(0, 2000), rng.uniform(0, 2000))
+            world.add_ent(make_body(rng.choice(['hexagon', 'box']),
+                                    rng.uniform(0.2, 1), pos,
+                                    ang=rng.uniform(0, 6),
+                                    vel=Vec(rng.uniform(-200, 200),
+                                            rng.uniform(-200, 200))))
+        return world
+
+    return scattered_world
+
+
+@pytest.fixture
+def counting_tree():
+    return CountingTree()
@@ -0,0 +1,38 @@
+import random
+
+from base import *
+
+
+def vectors(n=200, seed=2):
+    rng = random.Random(seed)
+    return [Vec(rng.uniform(-500, 500), rng.uniform(-500, 500))
+            for _ in range(n)]
+
+
+def angles(n=50, seed=3):
+    rng = random.Random(seed)
+    return [0.0, 1e-9, 3.141592653589793] + [rng.uniform(-20, 20)
+                                              for _ in range(n)]
+
+
+def test_rotation_matches_vec_rotate():
+    points = vectors()
+    for angle in angles():
+        rotation = Rotation(angle)
+        expected = [tuple(v.rotate(angle)) for v in points]
+        assert [tuple(rotation.apply(v)) for v in points] == expected
+        assert [tuple(v) for v in rotate_all(points, rotation)] == expected
+        assert [tuple(rotation.apply_inverse(v)) for v in points] \
+            == [tuple(v.rotate(-angle)) for v in points]
+
+
+def test_transform_matches_vec_rotate():
+    points = vectors()
+    pos = Vec(123.25, -7.5)
+    for angle in angles():
+        transform = Transform(pos, Rotation(angle))
+        expected = [tuple(v.rotate(angle) + pos) for v in points]
+        assert [tuple(transform.apply(v)) for v in points] == expected
+        assert [tuple(v) for v in transform.apply_all(points)] == expected
+        assert [tuple(transform.apply_inverse(v)) for v in points] \
+            == [tuple((v - pos).rotate(-angle)) for v in points]
@@ -0,0 +1,49 @@
+import json
+
+from base import *
+from colliding_world import *
+from batch import get_state, run_batch
+
+
+def test_pool_matches_local(joined_world):
+    steps = 60
+    local = joined_world()
+    for _ in range(steps):
+        local.update(1/60)
+
+    inline, = run_batch([joined_world()], steps, processes=1)
+    pooled = run_batch([joined_world(), joined_world()], steps, processes=2)
+
+    assert inline == get_state(local)
+    assert pooled == [get_state(local)] * 2
+
+
+def test_spring_round_trips_join_positions(joined_world):
+    world = joined_world()
+    spring = world.springs[0]
+    spring.slack = True
+
+    copy = CollidingWorld.from_dict(
+        json.loads(world.serialise())).springs[0]
+
+    assert (copy.end1_join_pos.x, copy.end1_join_pos.y) == (5, 5)
+    assert (copy.end2_join_pos.x, copy.end2_join_pos.y) == (10, -10)
+    assert copy.slack
+    assert copy.handle == spring.handle
+
+
+def test_pool_keeps_bullets(body, wall):
+    def make_bullet_world():
+        world = CollidingWorld(gravity=Vec(0, 0))
+        world.add_ent(wall(400, -500, 420, 500))
+        bullet = body('triangle', 0.2, Vec(0, 0), ang=0.3, vel=Vec(9000, 50))
+        bullet.bullet = True
+        world.add_ent(bullet)
+        return world
+
+    local = make_bullet_world()
+    for _ in range(40):
+        local.update(1/30)
+
+    pooled, = run_batch([make_bullet_world()], 40, dt=1/30, processes=2)
+    assert pooled == get_state(local)
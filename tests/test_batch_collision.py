@@ -0,0 +1,62 @@
+import random
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from base import *
+from collision import collide_reference, collide_all, find_candidates
+from batch_collision import batch_collide_all, collide_batch, pad_polygons
+
+
+@pytest.fixture
+def colliders(body):
+    rng = random.Random(7)
+    return [body(rng.choice(['hexagon', 'box', 'triangle']),
+                 rng.uniform(0.2, 1),
+                 Vec(rng.uniform(0, 1500), rng.uniform(0, 1500)),
+                 ang=rng.uniform(0, 6))
+            for _ in range(300)]
+
+
+def test_collide_batch_matches_collide(colliders):
+    polys, candidates = find_candidates(colliders)
+    pairs = np.array(candidates, dtype=int).reshape(-1, 2)
+    assert len(pairs)
+
+    verts, counts = pad_polygons(polys)
+    normals, _ = pad_polygons([c.get_normals() for c in colliders])
+    first, second = pairs[:, 0], pairs[:, 1]
+    separations, axes, flips, indices = collide_batch(
+        verts[first], counts[first], verts[second], counts[second],
+        normals[first], normals[second])
+
+    for k, (i, j) in enumerate(candidates):
+        separation, axis, reference = collide_reference(
+            polys[i], polys[j],
+            colliders[i].get_normals(), colliders[j].get_normals())
+        assert separations[k] == separation
+        assert (axes[k, 0], axes[k, 1]) == (axis.x, axis.y)
+        assert (flips[k], indices[k]) == reference
+
+
+def test_batch_collide_all_matches_collide_all(colliders):
+    expected = collide_all(colliders)
+    collisions = batch_collide_all(colliders)
+
+    assert len(collisions) == len(expected) > 0
+    for (a1, b1, s1, n1, r1), (a2, b2, s2, n2, r2) in zip(collisions,
+                                                          expected):
+        assert a1 is a2 and b1 is b2
+        assert s1 == s2 and (n1.x, n1.y) == (n2.x, n2.y)
+        assert r1 == r2
+
+
+def test_worlds_match(scattered_world):
+    def run(narrow_phase):
+        world = scattered_world(seed=4, n=60, narrow_phase=narrow_phase)
+        for _ in range(30):
+            world.update(1/30)
+        return [(e.pos.x, e.pos.y, e.ang) for e in world.entities]
+
+    assert run(batch_collide_all) == run(collide_all)
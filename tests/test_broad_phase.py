@@ -0,0 +1,144 @@
+import random
+
+import pytest
+
+from base import *
+from broad_phase import *
+
+BROAD_PHASES = [SpatialHash, lambda: SpatialHash(50), SweepAndPrune,
+                DynamicTree, StaticIndex,
+                lambda: StaticIndex(DynamicTree(), cell_size=100)]
+
+
+@pytest.fixture
+def churn(body, wall):
+    rng = random.Random(1)
+
+    def churn(world, step):
+        """Add and remove colliders now and then, as the editor does, and
+        return whether any were.
+        """
+        if step % 7 == 0:
+            world.remove_ent(rng.choice(world.entities[1:]))
+        if step % 5 == 0:
+            world.add_ent(body('box', 0.5, Vec(rng.uniform(0, 2000),
+                                               rng.uniform(0, 2000))))
+        if step % 11 == 0:
+            x = rng.uniform(0, 2000)
+            world.add_ent(wall(x, 500, x + 300, 520))
+        return step % 5 == 0 or step % 7 == 0 or step % 11 == 0
+
+    return churn
+
+
+def without_static_pairs(colliders, pairs):
+    inf = float('inf')
+    return sorted((i, j) for i, j in pairs
+                  if colliders[i].mass != inf or colliders[j].mass != inf)
+
+
+@pytest.mark.parametrize('make', BROAD_PHASES)
+def test_pairs_match_brute_force(make, scattered_world, churn):
+    world = scattered_world()
+    broad_phase = make()
+    brute_force = BruteForce()
+    for step in range(60):
+        world.update(1/30)
+        if churn(world, step):
+            broad_phase.mark_dirty()
+
+        # Only `StaticIndex` leaves out pairs of static colliders, but
+        # they are never collided anyway.
+        colliders = world.entities
+        boxes = [e.get_aabb() for e in colliders]
+        assert without_static_pairs(
+            colliders, broad_phase.find_pairs(colliders, boxes)) \
+            == without_static_pairs(
+                colliders, brute_force.find_pairs(colliders, boxes))
+
+
+@pytest.mark.parametrize('make', BROAD_PHASES)
+def test_queries_match_brute_force(make, scattered_world):
+    world = scattered_world(seed=2)
+    for _ in range(10):
+        world.update(1/30)
+
+    boxes = [e.get_aabb() for e in world.entities]
+    broad_phase = make()
+    broad_phase.update(world.entities, boxes)
+    brute_force = BruteForce()
+    brute_force.update(world.entities, boxes)
+
+    rng = random.Random(3)
+    for _ in range(50):
+        x, y = rng.uniform(-100, 2100), rng.uniform(-100, 2100)
+        box = (x, y, x + rng.uniform(0, 500), y + rng.uniform(0, 500))
+        assert sorted(broad_phase.query_region(box)) \
+            == sorted(brute_force.query_region(box))
+
+        point = Vec(x, y)
+        assert sorted(broad_phase.query_point(point)) \
+            == sorted(brute_force.query_point(point))
+
+        end = Vec(rng.uniform(-100, 2100), rng.uniform(-100, 2100))
+        assert sorted(broad_phase.query_segment(point, end)) \
+            == sorted(brute_force.query_segment(point, end))
+
+
+@pytest.mark.parametrize('make', BROAD_PHASES)
+def test_worlds_match_brute_force(make, scattered_world):
+    def run(broad_phase):
+        world = scattered_world(seed=4, n=60, broad_phase=broad_phase)
+        for _ in range(30):
+            world.update(1/30)
+        return [(e.pos.x, e.pos.y, e.ang) for e in world.entities]
+
+    assert run(make()) == run(None)
+
+
+def test_static_index_builds_only_when_dirty(scattered_world):
+    world = scattered_world(seed=5, n=30, broad_phase=StaticIndex(DynamicTree()))
+    for _ in range(20):
+        world.update(1/30)
+    assert world.broad_phase.builds == 1
+
+    world.remove_ent(world.entities[0])
+    world.update(1/30)
+    assert world.broad_phase.builds == 2
+
+
+
+def test_static_index_builds_only_when_statics_change(scattered_world,
+                                                      body, wall):
+    world = scattered_world(seed=6, n=30, broad_phase=StaticIndex())
+    world.add_ent(wall(0, 900, 300, 920))
+    world.update(1/30)
+    assert world.broad_phase.builds == 1
+
+    # Moving bodies come and go, moving where the walls are in the list.
+    for ent in world.entities[1:10]:
+        world.remove_ent(ent)
+    world.add_ent(body('box', 0.5, Vec(100, 300)))
+    world.update(1/30)
+    assert world.broad_phase.builds == 1
+
+    # Nothing static moved.
+    world.mark_changed()
+    world.update(1/30)
+    assert world.broad_phase.builds == 1
+
+    world.entities[0].pos += Vec(0, -5)
+    world.mark_changed()
+    world.update(1/30)
+    assert world.broad_phase.builds == 2
+
+    world.add_ent(wall(500, 900, 800, 920))
+    world.update(1/30)
+    assert world.broad_phase.builds == 3
+
+    colliders = world.entities
+    boxes = [e.get_aabb() for e in colliders]
+    assert without_static_pairs(
+        colliders, world.broad_phase.find_pairs(colliders, boxes)) \
+        == without_static_pairs(
+            colliders, BruteForce().find_pairs(colliders, boxes))
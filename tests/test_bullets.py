@@ -0,0 +1,68 @@
+import pytest
+
+from base import *
+from colliding_world import *
+
+
+@pytest.fixture
+def fire(body, wall):
+    def fire(start, vel, ang_vel=0.0, **kwargs):
+        world = CollidingWorld(gravity=Vec(0, 0), **kwargs)
+        world.add_ent(wall(400, -500, 420, 500))
+        bullet = body('triangle', 0.2, start, ang=0.3, vel=vel)
+        bullet.ang_vel = ang_vel
+        bullet.bullet = True
+        world.add_ent(bullet)
+        return world, bullet
+
+    return fire
+
+
+def test_bullets_stop_at_thin_walls(fire):
+    world, bullet = fire(Vec(0, 0), Vec(9000, 50), ang_vel=4)
+    for _ in range(40):
+        world.update(1/30)
+
+    assert bullet.vel.x < 0
+    assert max(v.x for v in bullet.get_vertices()) <= 400.6
+
+
+def test_bullets_touching_at_the_start_do_not_tunnel(fire):
+    world, bullet = fire(Vec(0, 0), Vec(9000, 0))
+    # Just touching the wall.
+    right = max(v.x for v in bullet.get_vertices())
+    bullet.pos = bullet.new_pos = Vec(399.8 - right, 0)
+    world.update(1/30)
+
+    assert max(v.x for v in bullet.get_vertices()) <= 400.6
+
+
+def test_bullets_bounce_with_spin(fire):
+    world, bullet = fire(Vec(0, 100), Vec(9000, 0))
+    for _ in range(2):
+        world.update(1/30)
+
+    # Hitting off-centre makes it spin.
+    assert bullet.vel.x < 0
+    assert bullet.ang_vel != 0
+
+
+def test_bullets_slide_along_the_floor(body, wall):
+    world = CollidingWorld(gravity=Vec(0, -100))
+    world.add_ent(wall(-1000, -100, 1000, 0))
+    box = body('box', 0.5, Vec(0, 25), vel=Vec(200, 0))
+    box.bullet = True
+    world.add_ent(box)
+    for _ in range(30):
+        world.update(1/60)
+
+    assert box.pos.x > 20
+
+
+def test_bullets_do_not_update_the_broad_phase(fire, counting_tree):
+    world, bullet = fire(Vec(0, 0), Vec(9000, 50),
+                         broad_phase=counting_tree)
+    for _ in range(10):
+        world.update(1/30)
+
+    assert world.broad_phase.updates == 10
@@ -0,0 +1,82 @@
+from math import pi
+
+from pytest import approx
+
+from base import *
+from collision import collide_reference, get_contacts
+
+
+def box(x1, y1, x2, y2):
+    return [Vec(x1, y1), Vec(x2, y1), Vec(x2, y2), Vec(x1, y2)]
+
+
+def rotated(poly, centre, ang):
+    rotation = Rotation(ang)
+    return [centre + rotation.apply(v - centre) for v in poly]
+
+
+GROUND = box(-100, -10, 100, 0)
+
+
+def points(contacts):
+    """Return the contact points and separations, flattened so they
+    can be compared with `approx`.
+    """
+    return [x for point in sorted((p.x, p.y, s) for p, s, _ in contacts)
+            for x in point]
+
+
+def flattened(normal, contacts):
+    return [(normal.x, normal.y)] + [(p.x, p.y, s, f)
+                                     for p, s, f in contacts]
+
+
+def test_box_resting_on_box():
+    normal, contacts = get_contacts(GROUND, box(0, -1, 20, 19))
+
+    # On a tie the second polygon is the reference, so the points are
+    # on the ground's top side.
+    assert (normal.x, normal.y) == approx((0, 1))
+    assert points(contacts) == approx([0, 0, -1, 20, 0, -1])
+
+
+def test_normal_points_from_first_to_second():
+    normal, contacts = get_contacts(box(0, -1, 20, 19), GROUND)
+
+    assert (normal.x, normal.y) == approx((0, -1))
+    assert points(contacts) == approx([0, -1, -1, 20, -1, -1])
+
+
+def test_overhanging_box_is_clipped_to_the_edge():
+    normal, contacts = get_contacts(GROUND, box(90, -1, 110, 19))
+
+    assert (normal.x, normal.y) == approx((0, 1))
+    assert points(contacts) == approx([90, 0, -1, 100, 0, -1])
+
+
+def test_box_on_its_corner():
+    # Tipped by 45 degrees with its lowest corner 2 into the ground.
+    half = 10 * 2**0.5
+    tipped = rotated(box(-10, -10, 10, 10), Vec(0, 0), pi / 4)
+    tipped = [v + Vec(0, half - 2) for v in tipped]
+    normal, contacts = get_contacts(GROUND, tipped)
+
+    assert (normal.x, normal.y) == approx((0, 1))
+    assert points(contacts) == approx([0, -2, -2], abs=1e-9)
+
+
+def test_features_match_between_steps():
+    _, before = get_contacts(GROUND, box(0, -1, 20, 19))
+    _, after = get_contacts(GROUND, box(0.5, -1.2, 20.5, 18.8))
+
+    assert [f for _, _, f in before] == [f for _, _, f in after]
+
+
+def test_clipping_from_the_reference_side_matches():
+    for ang in (0, 0.3, pi / 4, 2.5):
+        tipped = rotated(box(-10, -10, 10, 10), Vec(0, 0), ang)
+        for p1, p2 in ((GROUND, [v + Vec(5, 8) for v in tipped]),
+                       ([v + Vec(5, -8) for v in tipped], GROUND)):
+            _, _, reference = collide_reference(p1, p2)
+            assert flattened(*get_contacts(p1, p2, reference=reference)) \
+                == flattened(*get_contacts(p1, p2))
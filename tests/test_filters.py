@@ -0,0 +1,103 @@
+import json
+import pickle
+
+import pytest
+
+from base import *
+from colliding_world import *
+from collision import can_collide
+from phys import PhysSerialiser, Spring
+
+
+@pytest.fixture
+def make_pair(body):
+    def make_pair():
+        return body('box', 0.5, Vec(0, 0)), body('box', 0.5, Vec(10, 0))
+
+    return make_pair
+
+
+def test_categories_masks_and_groups(make_pair):
+    a, b = make_pair()
+    assert can_collide(a, b)
+
+    b.category = 0x0002
+    a.mask = 0xFFFF & ~0x0002
+    assert not can_collide(a, b) and not can_collide(b, a)
+
+    # A shared positive group overrides the masks.
+    a.group = b.group = 3
+    assert can_collide(a, b)
+
+    a.mask = 0xFFFF
+    a.group = b.group = -3
+    assert not can_collide(a, b)
+
+
+def test_ignore_counts(make_pair):
+    a, b = make_pair()
+    a.ignore(b)
+    a.ignore(b)
+    a.unignore(b)
+    assert not can_collide(a, b) and not can_collide(b, a)
+
+    b.unignore(a)
+    assert can_collide(a, b)
+    assert a.ignored == {} and b.ignored == {}
+
+
+def test_ignore_springs_counts(make_pair):
+    world = CollidingWorld(ignore_springs=True)
+    a, b = make_pair()
+    world.add_ent(a, b)
+    springs = [Spring(stiffness=10, end1=a, end2=b, slack_length=10)
+               for _ in range(2)]
+    world.add_spring(*springs)
+    a.ignore(b)
+
+    world.remove_spring(springs[0])
+    assert not can_collide(a, b)
+    world.remove_spring(springs[1])
+    # Only the explicit ignore is left.
+    assert not can_collide(a, b)
+    assert a.joined == {} and a.ignored == {b: 1}
+
+    a.unignore(b)
+    assert can_collide(a, b)
+
+
+def test_ignores_round_trip(make_pair, body):
+    world = CollidingWorld()
+    a, b = make_pair()
+    c = body('box', 0.5, Vec(20, 0))
+    world.add_ent(a, b, c)
+    world.add_spring(Spring(stiffness=10, end1=a, end2=c, slack_length=10))
+    a.ignore(b)
+    a.ignore(b)
+
+    d = json.loads(json.dumps(world.to_dict(), cls=PhysSerialiser))
+    loaded = CollidingWorld.from_dict(d)
+    la, lb, lc = loaded.entities
+    assert la.ignored == {lb: 2} and lb.ignored == {la: 2}
+    assert lc.ignored == {}
+
+    # Removing an entity forgets its ignores.
+    world.remove_ent(b)
+    assert a.ignored == {}
+
+
+def test_old_pickles_get_defaults(make_pair):
+    a, b = make_pair()
+    for ent in (a, b):
+        for name in ('awake', 'sleep_time', 'sleep_island', 'handle',
+                     'bullet', 'category', 'mask', 'group', 'ignored',
+                     'joined', 'pose_version'):
+            del ent.__dict__[name]
+
+    a, b = pickle.loads(pickle.dumps([a, b]))
+    assert a.awake and a.category == 0x0001 and a.ignored == {}
+    assert can_collide(a, b)
+
+    world = CollidingWorld(gravity=Vec(0, -100))
+    world.add_ent(a, b)
+    world.update(1/60)
@@ -0,0 +1,109 @@
+import random
+
+import pytest
+
+from base import *
+from colliding_world import CollidingWorld
+from phys import Spring
+
+
+@pytest.fixture
+def make_world(body):
+    def make_world(n=20, **kwargs):
+        world = CollidingWorld(gravity=Vec(0, -100), **kwargs)
+        world.add_ent(*[body('box', 0.2, Vec(30 * i, 0)) for i in range(n)])
+        entities = world.entities
+        world.add_spring(*[Spring(stiffness=10, end1=entities[i],
+                                  end2=entities[i + 1], slack_length=30)
+                           for i in range(n - 1)])
+        return world
+
+    return make_world
+
+
+def check(world):
+    """Check that every object is found by its handle."""
+    for i, ent in enumerate(world.entities):
+        assert world.entity_indices[ent.handle] == i
+        assert world.get_ent(ent.handle) is ent
+    for i, spring in enumerate(world.springs):
+        assert world.spring_indices[spring.handle] == i
+        assert world.get_spring(spring.handle) is spring
+        for end in (spring.end1, spring.end2):
+            assert spring in world.get_springs(end)
+
+    handles = [o.handle for o in world.entities + world.springs]
+    assert len(set(handles)) == len(handles)
+
+
+def test_swap_remove_keeps_handles(make_world):
+    world = make_world()
+    handles = {id(o): o.handle for o in world.entities + world.springs}
+
+    rng = random.Random(1)
+    for _ in range(8):
+        world.remove_ent(rng.choice(world.entities))
+        if world.springs:
+            world.remove_spring(rng.choice(world.springs))
+        check(world)
+
+    for o in world.entities + world.springs:
+        assert o.handle == handles[id(o)]
+
+
+def test_removing_an_entity_removes_its_springs(make_world):
+    world = make_world(5)
+    middle = world.get_ent(2)
+    springs = world.get_springs(middle)
+    assert len(springs) == 2
+
+    world.remove_ent(middle)
+    check(world)
+    assert world.get_ent(2) is None
+    assert all(world.get_spring(s.handle) is None for s in springs)
+    assert len(world.springs) == 2
+
+
+def test_new_objects_get_new_handles(make_world, body):
+    world = make_world(5)
+    last = world.entities[-1]
+    world.remove_ent(last)
+
+    ent = body('box', 0.2, Vec(0, 100))
+    world.add_ent(ent)
+    check(world)
+    assert ent.handle > max(o.handle for o in world.springs)
+
+    # Re-adding keeps the handle, if it is free.
+    world.add_ent(last)
+    check(world)
+    assert world.get_ent(last.handle) is last
+
+
+def test_errors(make_world):
+    world = make_world(3)
+    ent = world.entities[0]
+    with pytest.raises(ValueError):
+        world.add_ent(ent)
+
+    world.remove_ent(ent)
+    with pytest.raises(ValueError):
+        world.remove_ent(ent)
+
+
+def test_swap_remove_keeps_stored_bodies(make_world):
+    pytest.importorskip('numpy')
+    from body_store import BodyStore
+
+    world = make_world(body_store=BodyStore())
+    for _ in range(5):
+        world.update(1/60)
+    poses = {ent.handle: (ent.pos.x, ent.pos.y, ent.ang)
+             for ent in world.entities}
+
+    rng = random.Random(2)
+    for _ in range(8):
+        world.remove_ent(rng.choice(world.entities))
+        check(world)
+        for ent in world.entities:
+            assert (ent.pos.x, ent.pos.y, ent.ang) == poses[ent.handle]
@@ -0,0 +1,84 @@
+import pytest
+
+from base import *
+from colliding_world import CollidingWorld
+from islands import UnionFind, find_islands, IslandSleeper
+from phys import Spring
+
+
+@pytest.fixture
+def world(body, wall):
+    """A world with two boxes dropped side by side on a floor."""
+    world = CollidingWorld(gravity=Vec(0, -100), sleeper=IslandSleeper())
+    world.add_ent(wall(-500, -100, 500, 0))
+    world.add_ent(body('box', 0.5, Vec(0, 40)),
+                  body('box', 0.5, Vec(200, 40)))
+    return world
+
+
+def settle(world, steps=300):
+    for _ in range(steps):
+        world.update(1/60)
+        if not world.sleeper.awake:
+            return
+    raise AssertionError("the world never fell asleep")
+
+
+def test_union_find():
+    sets = UnionFind('abcde')
+    sets.union('a', 'b')
+    sets.union('c', 'd')
+    sets.union('b', 'd')
+    sets.add('f')
+    sets.add('a')
+
+    assert sets.find('a') is sets.find('d')
+    assert sets.find('e') is not sets.find('a')
+    assert sorted(sorted(g) for g in sets.groups()) \
+        == [['a', 'b', 'c', 'd'], ['e'], ['f']]
+
+
+def test_islands_leave_out_static_bodies(world, body):
+    floor, a, b = world.entities
+    outside = body('box', 0.5, Vec(0, 0))
+
+    islands = find_islands(world.entities,
+                           [(floor, a), (floor, b), (a, outside)])
+    assert sorted(map(len, islands)) == [1, 1]
+
+
+def test_resting_islands_sleep_and_wake(world, body):
+    _, a, b = world.entities
+    settle(world)
+    assert not a.awake and not b.awake
+    assert a.vel.x == a.vel.y == a.ang_vel == 0
+    # The floor does not join them into one island.
+    assert a.sleep_island == [a] and b.sleep_island == [b]
+
+    # Dropping a box onto one wakes only that one.
+    c = body('box', 0.5, Vec(0, 100), vel=Vec(0, -300))
+    world.add_ent(c)
+    for _ in range(10):
+        world.update(1/60)
+    assert a.awake and not b.awake
+
+
+def test_springs_wake_what_they_pull(world, body):
+    _, a, b = world.entities
+    settle(world)
+
+    c = body('box', 0.5, Vec(0, 400))
+    world.add_ent(c)
+    world.add_spring(Spring(stiffness=500, end1=a, end2=c, slack_length=20))
+    world.update(1/60)
+    assert a.awake and not b.awake
+
+
+def test_removing_static_bodies_wakes_what_rests_on_them(world):
+    floor, a, b = world.entities
+    settle(world)
+
+    world.remove_ent(floor)
+    assert a.awake and b.awake
+    world.update(1/60)
+    assert a.vel.y < 0
@@ -0,0 +1,52 @@
+import pytest
+
+from broad_phase import SpatialHash, StaticIndex
+from solver import SequentialImpulseSolver
+
+
+@pytest.fixture
+def run(pile):
+    """Profile a pile of `n` hexagons, returning the world and the last
+    frame.
+    """
+    def run(n=30, steps=60, **kwargs):
+        world = pile(n, **kwargs)
+        profiler = world.start_profiling()
+        for _ in range(steps):
+            world.update(1/60)
+        return world, profiler.last()
+
+    return run
+
+
+def test_counts_solver_impulses(run):
+    world, frame = run(solver=SequentialImpulseSolver(iterations=10))
+    contacts = frame.counts['contacts']
+
+    # Two per contact per iteration, and one to warm start each.
+    assert 20 * contacts <= frame.counts['impulses'] <= 21 * contacts
+    # More than the visualisation keeps.
+    assert frame.counts['impulses'] > 31
+
+
+def test_counts_impulses_without_solver(run):
+    world, frame = run()
+    collisions = frame.counts['collisions']
+
+    assert frame.counts['impulses'] == world.impulses
+    assert 0 < frame.counts['impulses'] <= 2 * collisions
+
+
+def test_default_world_times_broad_phase(run):
+    world, frame = run()
+    assert 'broad_phase' in frame.phases
+    assert frame.counts['candidate_pairs'] > 0
+
+
+def test_candidates_are_counted_after_culling(run):
+    counts = []
+    for broad_phase in (SpatialHash(), StaticIndex(), None):
+        world, frame = run(broad_phase=broad_phase)
+        counts.append(frame.counts['candidate_pairs'])
+
+    assert counts[0] == counts[1] == counts[2] > 0
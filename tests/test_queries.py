@@ -0,0 +1,39 @@
+from base import *
+from broad_phase import *
+from colliding_world import *
+
+
+def test_queries_update_once_per_step(pile, counting_tree):
+    world = pile(9, broad_phase=counting_tree)
+    world.update(1/60)
+    updates = world.broad_phase.updates
+
+    for _ in range(5):
+        world.query_point(Vec(100, 100))
+        world.query_region((0, 0, 200, 200))
+        world.ray_cast(Vec(-50, 50), Vec(400, 50))
+    assert world.broad_phase.updates == updates + 1
+
+    world.update(1/60)
+    updates = world.broad_phase.updates
+    world.query_region((0, 0, 200, 200))
+    assert world.broad_phase.updates == updates + 1
+
+
+def test_queries_see_latest_poses(pile):
+    world = pile(9, broad_phase=DynamicTree())
+    world.query_region((0, 0, 1, 1))
+    for _ in range(20):
+        world.update(1/60)
+
+    box = (0, 0, 300, 150)
+    expected = {e for e in world.entities
+                if e.get_aabb()[0] <= box[2] and box[0] <= e.get_aabb()[2]
+                and e.get_aabb()[1] <= box[3] and box[1] <= e.get_aabb()[3]}
+    assert set(world.query_region(box)) == expected
+
+    # Moved by hand.
+    ent = world.entities[5]
+    ent.pos = ent.new_pos = Vec(5000, 5000)
+    world.mark_moved()
+    assert world.query_region((4900, 4900, 5100, 5100)) == [ent]
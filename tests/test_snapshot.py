@@ -0,0 +1,86 @@
+import json
+
+import pytest
+
+from base import *
+from colliding_world import *
+from phys import PhysSerialiser
+from snapshot import Snapshot, save_snapshot, load_snapshot
+
+
+@pytest.fixture
+def make_world(joined_world):
+    def make_world():
+        world = joined_world()
+        a, b = world.entities[-2:]
+        a.category, a.mask, a.group = 0x0002, 0x00FD, -1
+        b.bullet = True
+        world.entities[7].ignore(world.entities[8])
+        world.entities[7].ignore(world.entities[8])
+        world.entities[7].ignore(world.entities[6])
+        for _ in range(10):
+            world.update(1/60)
+
+        # Leave gaps in the handles.
+        world.remove_ent(world.entities[3], world.entities[5])
+        return world
+
+    return make_world
+
+
+def normalise(d):
+    """Replace the shape and material keys of the entities in `d`, from
+    `to_dict`, with what they refer to.
+    """
+    d = json.loads(json.dumps(d, cls=PhysSerialiser))
+    for ent in d['entities'].values():
+        ent['shape'] = d['shapes'][ent['shape']]
+        ent['material'] = d['materials'][ent['material']]
+    del d['shapes'], d['materials']
+    return d
+
+
+def test_snapshot_to_dict_matches_world(make_world, tmp_path):
+    world = make_world()
+    path = tmp_path / 'world.snap'
+    save_snapshot(path, world)
+
+    with Snapshot(path) as snapshot:
+        assert normalise(snapshot.to_dict()) == normalise(world.to_dict())
+
+
+def test_load_keeps_handles(make_world, body, tmp_path):
+    world = make_world()
+    path = tmp_path / 'world.snap'
+    save_snapshot(path, world)
+    loaded = load_snapshot(path)
+
+    assert normalise(loaded.to_dict()) == normalise(world.to_dict())
+    assert [e.handle for e in loaded.entities] \
+        == [e.handle for e in world.entities]
+    assert [s.handle for s in loaded.springs] \
+        == [s.handle for s in world.springs]
+
+    # New objects do not reuse the loaded handles.
+    extra = body('box', 0.5, Vec(0, 0))
+    loaded.add_ent(extra)
+    assert extra.handle not in [e.handle for e in world.entities]
+
+
+def test_dict_round_trip(make_world):
+    world = make_world()
+    copy = CollidingWorld.from_dict(json.loads(world.serialise()))
+
+    assert normalise(copy.to_dict()) == normalise(world.to_dict())
+
+
+def test_bullets_round_trip(make_world, tmp_path):
+    world = make_world()
+    path = tmp_path / 'world.snap'
+    save_snapshot(path, world)
+    copy = CollidingWorld.from_dict(json.loads(world.serialise()))
+
+    bullets = [e.handle for e in world.entities if e.bullet]
+    assert bullets
+    for loaded in (load_snapshot(path), copy):
+        assert [e.handle for e in loaded.entities if e.bullet] == bullets
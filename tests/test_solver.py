@@ -0,0 +1,75 @@
+import pytest
+
+from base import *
+from colliding_world import CollidingWorld
+from solver import SequentialImpulseSolver
+
+
+class RecordingSolver(SequentialImpulseSolver):
+    """Records the impulses each contact started with."""
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.started = {}
+
+    def solve(self, collisions, dt):
+        self.started = {}
+        super().solve(collisions, dt)
+
+    def prepare(self, c, dt):
+        super().prepare(c, dt)
+        self.started[c.key()] = (c.normal_impulse, c.tangent_impulse)
+
+
+@pytest.fixture
+def stack(body, wall):
+    """Stack `n` boxes on a floor, returning the world and the boxes."""
+    def stack(solver, n=5):
+        world = CollidingWorld(gravity=Vec(0, -100), solver=solver)
+        world.add_ent(wall(-500, -100, 500, 0))
+        world.add_ent(*[body('box', 0.5, Vec(0, 25 + 50*i))
+                        for i in range(n)])
+        return world, world.entities[1:]
+
+    return stack
+
+
+def test_box_stack_settles(stack):
+    world, boxes = stack(SequentialImpulseSolver())
+    for _ in range(240):
+        world.update(1/60)
+
+    before = [b.pos.y for b in boxes]
+    for _ in range(120):
+        world.update(1/60)
+        assert max(abs(b.vel) for b in boxes) < 5
+
+    for i, (b, y) in enumerate(zip(boxes, before)):
+        assert abs(b.pos.y - y) < 0.25
+        assert abs(b.pos.y - (25 + 50*i)) < 5
+        assert abs(b.pos.x) < 1 and abs(b.ang) < 0.01
+
+
+def test_matching_contacts_reuse_impulses(stack):
+    solver = RecordingSolver()
+    world, boxes = stack(solver)
+    for _ in range(60):
+        world.update(1/60)
+
+    cache = dict(solver.cache)
+    world.update(1/60)
+    # Each box rests on the one below on the same two corners.
+    assert len(solver.started) == 2 * len(boxes)
+    assert solver.started.keys() == cache.keys()
+    for key, impulses in solver.started.items():
+        assert impulses == cache[key]
+        assert impulses[0] > 0
+
+
+def test_cold_start_ignores_the_cache(stack):
+    solver = RecordingSolver(warm_start=False)
+    world, boxes = stack(solver)
+    for _ in range(60):
+        world.update(1/60)
+
+    assert solver.cache
+    assert set(solver.started.values()) == {(0.0, 0.0)}
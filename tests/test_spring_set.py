@@ -0,0 +1,61 @@
+import random
+
+import pytest
+
+pytest.importorskip('numpy')
+
+from base import *
+from phys import World, Pin, Spring
+from spring_set import SpringSet
+from body_store import BodyStore
+
+
+def make_world(body, stored, pinned, spring_set=None, seed=5):
+    rng = random.Random(seed)
+    world = World(gravity=Vec(0, -100),
+                  body_store=BodyStore() if stored else None,
+                  spring_set=spring_set)
+    for _ in range(40):
+        world.add_ent(body(rng.choice(['box', 'hexagon']),
+                           rng.uniform(0.2, 1),
+                           Vec(rng.uniform(0, 500), rng.uniform(0, 500)),
+                           ang=rng.uniform(0, 6)))
+
+    ends = list(world.entities)
+    if pinned:
+        ends += [Pin(Vec(rng.uniform(0, 500), 600)) for _ in range(5)]
+    for _ in range(60):
+        end1, end2 = rng.sample(ends, 2)
+        world.add_spring(Spring(
+            stiffness=rng.uniform(100, 10000),
+            end1=end1, end2=end2,
+            slack_length=rng.uniform(0, 300),
+            end1_join_pos=Vec(rng.uniform(-10, 10), rng.uniform(-10, 10)),
+            end2_join_pos=Vec(rng.uniform(-10, 10), rng.uniform(-10, 10))))
+
+    return world
+
+
+def run(body, stored, pinned, spring_set=None):
+    world = make_world(body, stored, pinned, spring_set)
+    results = []
+    for _ in range(20):
+        world.update(1/60)
+        results.append(([x for e in world.entities
+                         for x in (e.pos.x, e.pos.y, e.ang,
+                                   e.new_acc.x, e.new_acc.y, e.new_ang_acc)],
+                        [s.slack for s in world.springs]))
+
+    return results
+
+
+@pytest.mark.parametrize('stored', [False, True])
+@pytest.mark.parametrize('pinned', [False, True])
+def test_spring_set_matches_update_spring(body, stored, pinned):
+    expected = run(body, stored, pinned)
+    for (state, slack), (expected_state, expected_slack) in zip(
+            run(body, stored, pinned, SpringSet()), expected):
+        assert state == pytest.approx(expected_state, rel=1e-11, abs=1e-11)
+        assert slack == expected_slack
+    # Some of the springs are slack and some pull.
+    assert 0 < sum(expected[-1][1]) < len(expected[-1][1])
@@ -0,0 +1,20 @@
+from base import *
+from stepper import FixedStepper
+
+
+def test_reset_draws_entities_where_they_are(pile):
+    world = pile(4)
+    stepper = FixedStepper(world, dt=1/60)
+    stepper.advance(1.5/60)
+
+    ent = world.entities[3]
+    assert stepper.get_pose(ent)[0] != ent.pos
+
+    ent.pos = ent.new_pos = Vec(1000, 1000)
+    stepper.reset(ent)
+    assert stepper.get_pose(ent) == (ent.pos, ent.ang)
+    assert stepper.get_vertices(ent) == ent.get_vertices()
+
+    stepper.reset()
+    other = world.entities[4]
+    assert stepper.get_pose(other) == (other.pos, other.ang)
@@ -0,0 +1,119 @@
+import json
+
+from base import *
+from broad_phase import StaticIndex
+from colliding_world import *
+from phys import PhysSerialiser
+from sync import WorldTracker, Replica
+
+
+def state(world):
+    """Return everything about `world`, keyed by handles, with shapes
+    and materials by value.
+    """
+    d = json.loads(json.dumps(world.to_dict(), cls=PhysSerialiser))
+    for ent in d['entities'].values():
+        ent['shape'] = d['shapes'][ent['shape']]
+        ent['material'] = d['materials'][ent['material']]
+    del d['shapes'], d['materials']
+    d['springs'] = sorted(d['springs'], key=lambda s: s['handle'])
+    return d
+
+
+def send(tracker, replica):
+    tracker.update()
+    # As it would be sent.
+    delta = json.loads(json.dumps(tracker.diff(replica.version),
+                                  cls=PhysSerialiser))
+    replica.apply(delta)
+    return delta
+
+
+def test_replica_follows_steps(joined_world):
+    world = joined_world()
+    tracker = WorldTracker(world)
+    replica = Replica(gravity=world.gravity)
+    send(tracker, replica)
+    assert state(replica.world) == state(world)
+
+    for _ in range(20):
+        world.update(1/60)
+        send(tracker, replica)
+        assert state(replica.world) == state(world)
+
+
+def test_edits_resend_entities(joined_world):
+    world = joined_world()
+    tracker = WorldTracker(world)
+    replica = Replica(gravity=world.gravity)
+    send(tracker, replica)
+
+    a, b = world.entities[-2:]
+    a.mask = 0
+    a.group = -3
+    a.mass = 5
+    b.bullet = True
+    a.ignore(world.entities[4])
+    delta = send(tracker, replica)
+
+    assert set(delta['entities']) \
+        == {str(e.handle) for e in (a, b, world.entities[4])}
+    assert state(replica.world) == state(world)
+    copy = replica.world.get_ent(a.handle)
+    assert (copy.mask, copy.group, copy.mass) == (0, -3, 5)
+    assert copy.ignored == {replica.world.get_ent(world.entities[4].handle): 1}
+    # Its spring was moved onto the new copy.
+    assert replica.world.get_springs(copy)
+
+    a.unignore(world.entities[4])
+    send(tracker, replica)
+    assert copy is not replica.world.get_ent(a.handle)
+    assert replica.world.get_ent(a.handle).ignored == {}
+
+
+def test_removals(joined_world):
+    world = joined_world()
+    tracker = WorldTracker(world)
+    replica = Replica(gravity=world.gravity)
+    send(tracker, replica)
+
+    world.remove_ent(world.entities[3], world.entities[-1])
+    world.update(1/60)
+    delta = send(tracker, replica)
+
+    assert len(delta['removed']['entities']) == 2
+    assert len(delta['removed']['springs']) == 1
+    assert state(replica.world) == state(world)
+    assert len(replica.world.entities) == len(world.entities)
+
+
+def test_unchanged_world_sends_nothing(joined_world):
+    world = joined_world()
+    tracker = WorldTracker(world)
+    replica = Replica(gravity=world.gravity)
+    send(tracker, replica)
+
+    delta = send(tracker, replica)
+    assert delta['entities'] == delta['bodies'] == delta['springs'] == {}
+
+
+def test_applying_steps_keeps_the_static_index(joined_world):
+    world = joined_world()
+    tracker = WorldTracker(world)
+    replica = Replica(gravity=world.gravity, broad_phase=StaticIndex())
+    send(tracker, replica)
+    replica.world.query_region((0, 0, 1, 1))
+    builds = replica.world.broad_phase.builds
+
+    for _ in range(5):
+        world.update(1/60)
+        send(tracker, replica)
+        replica.world.query_region((0, 0, 1, 1))
+    assert replica.world.broad_phase.builds == builds
+
+    # Moving a static body builds it again.
+    wall = next(e for e in world.entities if e.mass == float('inf'))
+    wall.pos = wall.new_pos = wall.pos + Vec(0, -5)
+    send(tracker, replica)
+    replica.world.query_region((0, 0, 1, 1))
+    assert replica.world.broad_phase.builds == builds + 1
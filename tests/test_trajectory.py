@@ -0,0 +1,83 @@
+import pytest
+
+import trajectory
+from broad_phase import StaticIndex
+from phys import World
+from snapshot import Snapshot
+from trajectory import TrajectoryRecorder, TrajectoryReader
+
+
+def test_recorder_closes_file_on_failure(tmp_path, monkeypatch):
+    files = []
+
+    def open_(*args, **kwargs):
+        files.append(open(*args, **kwargs))
+        return files[-1]
+
+    monkeypatch.setattr(trajectory, 'open', open_, raising=False)
+    with pytest.raises(TypeError):
+        TrajectoryRecorder(tmp_path / 'world.traj', World())
+    assert files[0].closed
+
+
+def test_reader_closes_file_on_failure(pile, tmp_path, monkeypatch):
+    snapshots = []
+
+    class Recorded(Snapshot):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            snapshots.append(self)
+
+    monkeypatch.setattr(trajectory, 'Snapshot', Recorded)
+
+    # Starts like a trajectory, but with the wrong magic.
+    world = pile(4)
+    path = tmp_path / 'world.traj'
+    TrajectoryRecorder(path, world).close()
+    with open(path, 'r+b') as file:
+        file.write(b'NOTATRAJ')
+
+    with pytest.raises(IOError):
+        TrajectoryReader(path)
+    assert snapshots[0].mmap.closed
+
+
+def test_round_trip(pile, tmp_path):
+    world = pile(9)
+    path = tmp_path / 'world.traj'
+    recorder = TrajectoryRecorder(path, world, chunk_size=4)
+    frames = []
+    for _ in range(10):
+        world.update(1/60)
+        recorder.record()
+        frames.append([(e.pos.x, e.pos.y, e.ang, e.vel.x, e.vel.y,
+                        e.ang_vel) for e in world.entities])
+    recorder.close()
+
+    reader = TrajectoryReader(path)
+    try:
+        assert reader.n_frames == 10
+        assert [reader.get_frame(n) for n in range(10)] == frames
+    finally:
+        reader.close()
+
+
+def test_applying_frames_keeps_the_static_index(pile, tmp_path):
+    world = pile(9)
+    path = tmp_path / 'world.traj'
+    recorder = TrajectoryRecorder(path, world)
+    for _ in range(5):
+        world.update(1/60)
+        recorder.record()
+    recorder.close()
+
+    reader = TrajectoryReader(path)
+    try:
+        world = reader.load(0, broad_phase=StaticIndex())
+        world.query_region((0, 0, 1, 1))
+        for n in range(1, 5):
+            reader.apply(world, n)
+            world.query_region((0, 0, 1, 1))
+        assert world.broad_phase.builds == 1
+    finally:
+        reader.close()
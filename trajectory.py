@@ -0,0 +1,291 @@
+"""Recording and replaying trajectories of colliding worlds
+`TrajectoryRecorder` writes a world's shapes, materials and springs
+once, as a snapshot (see `snapshot`), then appends the state of its
+entities each time `record` is called.  Frames are grouped into chunks,
+which can be compressed, and each chunk starts with the full state so
+`TrajectoryReader` can seek to any frame by decoding one chunk.
+
+A state is a tuple of `(x, y, ang, vel x, vel y, ang_vel)` for each
+entity, as from `batch.get_state`.  After the first frame of a chunk,
+only the entities whose state changed are stored.  The entities of the
+world must not change while it is recorded.
+
+File layout, in the byte order of the machine that wrote it:
+    header - see `HEADER`.
+    snapshot - the world when recording started.
+    chunks - each an 8-byte length then the (compressed) frames.
+    index - the offset of each chunk, then `FOOTER`.  If the recorder
+        was never closed, the index is missing and the reader finds the
+        chunks by following their lengths instead.
+"""
+
+from array import array
+import struct
+import zlib
+
+from base import *
+from colliding_world import *
+from snapshot import Snapshot, write_snapshot, BYTE_ORDER_MARK
+
+__all__ = ['TrajectoryRecorder', 'TrajectoryReader']
+
+
+MAGIC = b'PHYSTRAJ'
+VERSION = 1
+
+# magic, version, byte order mark, frames per chunk, whether chunks are
+# compressed.
+HEADER = struct.Struct('=8sIIqq')
+# number of frames, number of chunks, magic.
+FOOTER = struct.Struct('=qq8s')
+LENGTH = struct.Struct('=q')
+
+STATE_SIZE = 6
+
+
+def get_states(entities):
+    states = array('d')
+    for e in entities:
+        states.extend((e.pos.x, e.pos.y, e.ang, e.vel.x, e.vel.y, e.ang_vel))
+
+    return states
+
+
+class TrajectoryRecorder:
+    """Record the states of `world` to a file at `path`.
+
+    chunk_size - the number of frames in each chunk.  Seeking decodes at
+        most this many frames.
+    compress - whether to compress each chunk with zlib.
+    """
+    def __init__(self, path, world, chunk_size=64, compress=True):
+        self.world = world
+        self.chunk_size = chunk_size
+        self.compress = compress
+
+        self.file = open(path, 'wb')
+        try:
+            self.file.write(HEADER.pack(MAGIC, VERSION, BYTE_ORDER_MARK,
+                                        chunk_size, compress))
+            write_snapshot(self.file, world)
+        except BaseException:
+            # Eg. `world` is not a `CollidingWorld`.
+            self.file.close()
+            raise
+
+        self.n_entities = len(world.entities)
+        self.n_frames = 0
+        self.chunk_offsets = []
+        self.chunk = []
+        self.previous = None
+
+    def record(self):
+        """Add the current state of the world as the next frame."""
+        if len(self.world.entities) != self.n_entities:
+            raise ValueError("entities changed while recording")
+
+        states = get_states(self.world.entities)
+        if not self.chunk:
+            # Start each chunk with every entity, so it can be decoded
+            # on its own.
+            self.chunk.append(array('q', [-1]).tobytes() + states.tobytes())
+        else:
+            changed = array('q')
+            values = array('d')
+            previous = self.previous
+            for i in range(self.n_entities):
+                k = STATE_SIZE * i
+                state = states[k:k + STATE_SIZE]
+                if state != previous[k:k + STATE_SIZE]:
+                    changed.append(i)
+                    values.extend(state)
+
+            self.chunk.append(array('q', [len(changed)]).tobytes()
+                              + changed.tobytes() + values.tobytes())
+
+        self.previous = states
+        self.n_frames += 1
+        if len(self.chunk) == self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """Write the frames recorded since the last chunk."""
+        if not self.chunk:
+            return
+
+        data = b''.join(self.chunk)
+        if self.compress:
+            data = zlib.compress(data)
+
+        self.chunk_offsets.append(self.file.tell())
+        self.file.write(LENGTH.pack(len(data)))
+        self.file.write(data)
+        self.file.flush()
+        self.chunk = []
+
+    def close(self):
+        """Write the last chunk and the index, and close the file."""
+        if self.file.closed:
+            return
+
+        self.flush()
+        self.file.write(array('q', self.chunk_offsets).tobytes())
+        self.file.write(FOOTER.pack(self.n_frames, len(self.chunk_offsets),
+                                    MAGIC))
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class TrajectoryReader:
+    """Read the frames of a recorded trajectory.
+
+    snapshot - the `snapshot.Snapshot` of the world when recording
+        started, which `load` builds a world from.
+    n_frames - the number of frames recorded.
+    """
+    def __init__(self, path):
+        self.snapshot = Snapshot(path, HEADER.size)
+        try:
+            data = self.snapshot.mmap
+
+            magic, version, mark, self.chunk_size, self.compressed = \
+                HEADER.unpack_from(data)
+            if magic != MAGIC:
+                raise IOError('Not a trajectory file.')
+            if version != VERSION:
+                raise IOError('Unreadable file version.')
+            if mark != BYTE_ORDER_MARK:
+                raise IOError('Trajectory was written with another byte '
+                              'order.')
+
+            self.n_entities = self.snapshot.n_entities
+            self.cache = (None, None)  # (chunk number, decoded frames)
+            start = HEADER.size + self.snapshot.size
+
+            n_frames, n_chunks, magic = FOOTER.unpack_from(
+                data, len(data) - FOOTER.size)
+            if magic == MAGIC:
+                index = len(data) - FOOTER.size - 8 * n_chunks
+                self.chunk_offsets = array('q',
+                                           data[index:index + 8*n_chunks])
+                self.n_frames = n_frames
+            else:
+                self.find_chunks(start)
+        except BaseException:
+            self.snapshot.close()
+            raise
+
+    def find_chunks(self, offset):
+        """Find the chunks of a trajectory that was not closed."""
+        data = self.snapshot.mmap
+        self.chunk_offsets = array('q')
+        while offset + LENGTH.size <= len(data):
+            length, = LENGTH.unpack_from(data, offset)
+            if offset + LENGTH.size + length > len(data):
+                break  # The last chunk was not finished.
+            self.chunk_offsets.append(offset)
+            offset += LENGTH.size + length
+
+        self.n_frames = 0
+        if self.chunk_offsets:
+            last = len(self.chunk_offsets) - 1
+            self.n_frames = (self.chunk_size * last
+                             + len(self.decode_chunk(last)))
+
+    def close(self):
+        self.snapshot.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self.n_frames
+
+    def decode_chunk(self, number):
+        """Return the full states of every frame in chunk `number`."""
+        if self.cache[0] == number:
+            return self.cache[1]
+
+        data = self.snapshot.mmap
+        offset = self.chunk_offsets[number]
+        length, = LENGTH.unpack_from(data, offset)
+        offset += LENGTH.size
+        chunk = data[offset:offset + length]
+        if self.compressed:
+            chunk = zlib.decompress(chunk)
+
+        frames = []
+        states = None
+        size = STATE_SIZE * self.n_entities
+        offset = 0
+        while offset < len(chunk):
+            count, = LENGTH.unpack_from(chunk, offset)
+            offset += LENGTH.size
+
+            if count == -1:
+                states = array('d', chunk[offset:offset + 8*size])
+                offset += 8 * size
+            else:
+                states = array('d', states)
+                changed = array('q', chunk[offset:offset + 8*count])
+                offset += 8 * count
+                values = array('d', chunk[offset:
+                                          offset + 8*STATE_SIZE*count])
+                offset += 8 * STATE_SIZE * count
+                for j, i in enumerate(changed):
+                    states[STATE_SIZE*i:STATE_SIZE*(i + 1)] = \
+                        values[STATE_SIZE*j:STATE_SIZE*(j + 1)]
+
+            frames.append(states)
+
+        self.cache = (number, frames)
+        return frames
+
+    def get_frame(self, n):
+        """Return the state of each entity in frame `n`."""
+        if not -self.n_frames <= n < self.n_frames:
+            raise IndexError("frame out of range")
+        n %= self.n_frames
+
+        states = self.decode_chunk(n // self.chunk_size)[n % self.chunk_size]
+        return [tuple(states[k:k + STATE_SIZE])
+                for k in range(0, len(states), STATE_SIZE)]
+
+    def __iter__(self):
+        for n in range(self.n_frames):
+            yield self.get_frame(n)
+
+    def load(self, n=None, cls=CollidingWorld, **kwargs):
+        """Build a world from the snapshot, at frame `n` if given."""
+        world = self.snapshot.load(cls, **kwargs)
+        if n is not None:
+            self.apply(world, n)
+
+        return world
+
+    def apply(self, world, n):
+        """Move the entities of `world`, loaded with `load`, to frame `n`."""
+        static_moved = False
+        for ent, (x, y, ang, vx, vy, ang_vel) in zip(world.entities,
+                                                      self.get_frame(n)):
+            if ent.mass == float('inf') \
+                    and (ent.pos.x, ent.pos.y, ent.ang) != (x, y, ang):
+                static_moved = True
+            ent.pos = Vec(x, y)
+            ent.new_pos = ent.pos
+            ent.vel = Vec(vx, vy)
+            ent.new_vel = ent.vel
+            ent.ang = ent.new_ang = ang
+            ent.ang_vel = ent.new_ang_vel = ang_vel
+        if static_moved:
+            world.mark_changed()
+        else:
+            world.mark_moved()